@@ -6,9 +6,22 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 
-from backend.core.routers import books, chat, companion, memory, online, retrieval, sandbox, tasks, voice
+from backend.core.routers import books, chat, companion, memory, metrics, online, retrieval, sandbox, tasks, voice
+from backend.core.services.embeddings_client import EmbeddingsClient
+from backend.core.services.event_retention import EventRetention, RetentionPolicy
+from backend.core.services.fact_index import FactVectorIndex
+from backend.core.services.conversation_store import ConversationStore
+from backend.core.services.conversation_summarizer import ConversationSummarizer
+from backend.core.services.interaction_writer import InteractionWriter
+from backend.core.services.kobold_pool import KoboldPool
+from backend.core.services.llm_scheduler import LLMScheduler
 from backend.core.services.memory_engine import MemoryEngine
+from backend.core.services.plan_cache import PlanCache
+from backend.core.services.prefetch_cache import PrefetchCache
+from backend.core.services.response_cache import RESPONSE_CACHE_ENABLED, SemanticResponseCache
+from backend.core.services.sqlite_pool import close_all_connections
 from backend.core.services.task_runner import TaskRunner
+from backend.core.services.token_counter import TokenCounter
 from backend.core.services.companion_state import CompanionState
 from backend.core.services.companion_memory import CompanionMemory
 from backend.core.services.voice_state import VoiceState
@@ -34,10 +47,73 @@ async def retrieval_worker_loop(job_state: RetrievalJobState, stop_event: asynci
 async def lifespan(app: FastAPI):
     # Startup
     app.state.memory_engine = MemoryEngine()
+    app.state.embeddings_client = EmbeddingsClient()
+    # Opt-in (CHAT_RESPONSE_CACHE_ENABLED=1): near-identical questions are answered from the cache.
+    app.state.response_cache = SemanticResponseCache() if RESPONSE_CACHE_ENABLED else None
+    # Drafts sent to /api/chat/prefetch while the user types; consumed by the matching chat turn.
+    app.state.prefetch_cache = PrefetchCache()
+    # KoboldCpp backends (KOBOLD_BACKENDS): chat goes to the large model, planner to the small one.
+    app.state.kobold_pool = KoboldPool.from_env()
+    app.state.kobold_client = app.state.kobold_pool.client_for("chat")
+    chat.task_planner.kobold = app.state.kobold_pool.client_for("planner")
+    tasks.planner.kobold = app.state.kobold_pool.client_for("planner")
+    # Prompt budgets are counted with the tokenizer of the backend that serves chat.
+    app.state.token_counter = TokenCounter(kobold=app.state.kobold_client)
+    app.state.kobold_probe_stop = asyncio.Event()
+    app.state.kobold_probe_task = asyncio.create_task(
+        app.state.kobold_pool.probe_loop(app.state.kobold_probe_stop)
+    )
+    # Single gate in front of KoboldCpp: chat turns outrank planner and background calls.
+    app.state.llm_scheduler = LLMScheduler()
+    chat.task_planner.scheduler = app.state.llm_scheduler
+    tasks.planner.scheduler = app.state.llm_scheduler
+    app.state.plan_cache = PlanCache()
+    chat.task_planner.plan_cache = app.state.plan_cache
+    tasks.planner.plan_cache = app.state.plan_cache
     app.state.task_runner = TaskRunner()
     app.state.task_runner.load_state()
     app.state.companion_state = CompanionState()
     app.state.companion_memory = CompanionMemory()
+    # Facts past their ttl_days are moved to 'expired'; cached answers may have been built on them.
+    def _on_facts_expired(_count: int):
+        if app.state.response_cache is not None:
+            app.state.response_cache.clear()
+
+    app.state.fact_expiry_stop = asyncio.Event()
+    app.state.fact_expiry_task = asyncio.create_task(
+        app.state.companion_memory.expiry_loop(app.state.fact_expiry_stop, on_expired=_on_facts_expired)
+    )
+    # Append-only event tables: old events go to gzip archives + daily rollups, space is vacuumed.
+    app.state.event_retention = EventRetention({
+        app.state.companion_memory.db_path: [
+            RetentionPolicy("relationship_fact_events", parent_column="fact_id", kind_column="event_kind"),
+            RetentionPolicy("initiative_proposal_events", parent_column="proposal_id", kind_column="event_kind"),
+        ],
+        app.state.task_runner.db_path: [
+            RetentionPolicy(
+                "task_events",
+                parent_column="task_id",
+                kind_column="kind",
+                on_pruned=app.state.task_runner.trim_events,
+            ),
+        ],
+    })
+    # The one-time VACUUM rewrites the files: done here, before traffic, not under the shared writer.
+    await asyncio.to_thread(app.state.event_retention.migrate_auto_vacuum)
+    app.state.event_retention_stop = asyncio.Event()
+    app.state.event_retention_task = asyncio.create_task(
+        app.state.event_retention.run_loop(app.state.event_retention_stop)
+    )
+    # Relationship facts for the prompt are picked by similarity to the question, not by recency.
+    app.state.fact_index = FactVectorIndex(app.state.embeddings_client)
+    app.state.conversation_store = ConversationStore()
+    # Long sessions: turns leaving the verbatim window are folded into a summary at background priority.
+    app.state.conversation_summarizer = ConversationSummarizer(
+        app.state.conversation_store,
+        kobold=app.state.kobold_pool.client_for("background"),
+        scheduler=app.state.llm_scheduler,
+        max_history_messages=chat.MAX_CHAT_HISTORY_MESSAGES,
+    )
     app.state.voice_state = VoiceState()
     # Week-1 retrieval abstraction bootstrap: multimodal retriever can be injected later.
     app.state.multimodal_retriever = None
@@ -54,13 +130,33 @@ async def lifespan(app: FastAPI):
         )
     )
     await app.state.memory_engine.initialize()
+    # Chat interactions are persisted write-behind, off the response path.
+    app.state.interaction_writer = InteractionWriter(app.state.memory_engine)
+    app.state.interaction_writer.start()
     yield
     # Shutdown
+    # Retention first: a pass in progress must finish before task events are written back.
+    app.state.event_retention_stop.set()
+    with suppress(asyncio.CancelledError):
+        await app.state.event_retention_task
     app.state.task_runner.save_state()
     app.state.retrieval_worker_stop.set()
     with suppress(asyncio.CancelledError):
         await app.state.retrieval_worker_task
+    await app.state.conversation_summarizer.close()
+    app.state.llm_scheduler.close()
+    app.state.kobold_probe_stop.set()
+    with suppress(asyncio.CancelledError):
+        await app.state.kobold_probe_task
+    app.state.fact_expiry_stop.set()
+    with suppress(asyncio.CancelledError):
+        await app.state.fact_expiry_task
+    await app.state.kobold_pool.close()
+    await app.state.token_counter.close()
+    await app.state.interaction_writer.close()
     await app.state.memory_engine.close()
+    await app.state.embeddings_client.close()
+    close_all_connections()
 
 
 app = FastAPI(
@@ -89,6 +185,7 @@ app.include_router(companion.router, prefix="/api/companion", tags=["companion"]
 app.include_router(voice.router, prefix="/api/voice", tags=["voice"])
 app.include_router(retrieval.router, prefix="/api/retrieval", tags=["retrieval"])
 app.include_router(online.router, prefix="/api/online", tags=["online"])
+app.include_router(metrics.router, prefix="/api/metrics", tags=["metrics"])
 
 
 @app.get("/")
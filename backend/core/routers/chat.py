@@ -1,22 +1,44 @@
+from contextlib import contextmanager, nullcontext, suppress
+from dataclasses import dataclass, field
+import asyncio
+import json
 import os
-from typing import List, Optional
+import time
+from typing import List, Optional, Union
 import uuid
 
 from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
 from backend.core.services.companion_memory import CompanionMemory
 from backend.core.services.companion_state import CompanionState
-from backend.core.services.kobold_client import KoboldClient
+from backend.core.services.kobold_client import DEFAULT_SYSTEM_PROMPT, KoboldClient
+from backend.core.services.conversation_store import ConversationSession, ConversationStore
+from backend.core.services.conversation_summarizer import ConversationSummarizer, build_summary_message_text
+from backend.core.services.fact_index import FACT_INDEX_CANDIDATES, FACT_INDEX_TIMEOUT_SECONDS, FactVectorIndex
+from backend.core.services.interaction_writer import InteractionWriter
+from backend.core.services.kobold_pool import KoboldPool
+from backend.core.services.llm_scheduler import LLMPriority, LLMScheduler, SchedulerQueueFullError
 from backend.core.services.memory_engine import MemoryEngine
+from backend.core.services.metrics import RollingHistogram, capture_generation_stats, llm_caller
+from backend.core.services.prefetch_cache import PrefetchCache
+from backend.core.services.response_cache import (
+    RESPONSE_CACHE_EMBED_TIMEOUT_SECONDS,
+    SemanticResponseCache,
+    make_fingerprint,
+)
 from backend.core.services.task_planner import TaskPlanner
 from backend.core.routers.sandbox import CodeExecutionRequest, execute_code
-from backend.core.services.retrieval import search_with_backend
+from backend.core.services.retrieval import mmr_select, search_with_backend
 from backend.core.services.online_tools import online_tools_enabled, web_search
+from backend.core.services.token_counter import TokenCounter
 
 router = APIRouter()
 kobold = KoboldClient()
 task_planner = TaskPlanner()
+# Fallback without the lifespan's app.state.token_counter: local estimates only, owns no HTTP client.
+token_counter = TokenCounter(base_url=None)
 
 
 class ChatMessage(BaseModel):
@@ -31,6 +53,10 @@ class ChatRequest(BaseModel):
     temperature: float = 0.7
     autonomous_mode: str = "auto"  # off | auto | force
     web_search: bool = False
+    prompt_layout: Optional[str] = None  # legacy | prefix_stable (default: CHAT_PROMPT_LAYOUT)
+    # With a server-held session `messages` carries only the new turn; history comes from the store.
+    # Anything before the latest user turn is ignored, so a client resending its transcript is harmless.
+    session_id: Optional[str] = None
 
 
 class AutonomousExecution(BaseModel):
@@ -49,10 +75,71 @@ class ChatResponse(BaseModel):
     memory_used: bool
     context_items: int
     autonomous: Optional[AutonomousExecution] = None
+    session_id: Optional[str] = None
+    # Id for POST /api/chat/feedback; None when the interaction was not stored.
+    interaction_id: Optional[str] = None
+    cached: bool = False
 
 
 MAX_CHAT_HISTORY_MESSAGES = 14
 MAX_MEMORY_CONTEXT_ITEMS = 3
+# "Role: " prefix and the blank-line separator added by KoboldClient._format_messages.
+MESSAGE_OVERHEAD_TOKENS = 4
+PROMPT_LAYOUTS = {"legacy", "prefix_stable"}
+# In prefix_stable layout history is dropped from the front in whole pages, so the prompt
+# prefix only changes once per page instead of on every turn.
+PREFIX_STABLE_HISTORY_PAGE = int(os.getenv("CHAT_PREFIX_HISTORY_PAGE", "6"))
+# MMR trade-off for memory context per reasoning mode: 1.0 = pure relevance, lower = more diverse.
+MEMORY_MMR_LAMBDA = {
+    "stable": float(os.getenv("CHAT_MMR_LAMBDA_STABLE", "0.7")),
+    "wild": float(os.getenv("CHAT_MMR_LAMBDA_WILD", "0.5")),
+}
+# Per-source deadlines for context gathering; a source that misses its deadline is dropped from the turn.
+CONTEXT_SOURCE_DEADLINES_S = {
+    "facts": float(os.getenv("CHAT_SOURCE_DEADLINE_FACTS_SECONDS", "1.0")),
+    "memory": float(os.getenv("CHAT_SOURCE_DEADLINE_MEMORY_SECONDS", "4.0")),
+    "web": float(os.getenv("CHAT_SOURCE_DEADLINE_WEB_SECONDS", "6.0")),
+}
+
+
+def resolve_prompt_layout(requested: Optional[str] = None) -> str:
+    layout = (requested or os.getenv("CHAT_PROMPT_LAYOUT", "legacy")).strip().lower()
+    return layout if layout in PROMPT_LAYOUTS else "legacy"
+
+
+@dataclass
+class PromptBudget:
+    """Token budget for prompt assembly; context shares apply to what is left after policy and latest turn."""
+
+    context_tokens: int = 4096
+    memory_share: float = 0.20
+    facts_share: float = 0.10
+    web_share: float = 0.20
+    autonomy_share: float = 0.15
+
+    @classmethod
+    def from_env(cls) -> "PromptBudget":
+        return cls(
+            context_tokens=int(os.getenv("CHAT_CONTEXT_TOKENS", "4096")),
+            memory_share=float(os.getenv("CHAT_BUDGET_MEMORY_SHARE", "0.20")),
+            facts_share=float(os.getenv("CHAT_BUDGET_FACTS_SHARE", "0.10")),
+            web_share=float(os.getenv("CHAT_BUDGET_WEB_SHARE", "0.20")),
+            autonomy_share=float(os.getenv("CHAT_BUDGET_AUTONOMY_SHARE", "0.15")),
+        )
+
+
+@dataclass
+class PromptBlocks:
+    """Prompt parts collected for a turn before budget allocation and layout."""
+
+    policy: List[ChatMessage] = field(default_factory=list)
+    facts: Optional[ChatMessage] = None
+    memory: Optional[ChatMessage] = None
+    disambiguation: Optional[ChatMessage] = None
+    web: Optional[ChatMessage] = None
+    autonomy: Optional[ChatMessage] = None
+    history: List[ChatMessage] = field(default_factory=list)
+    latest: List[ChatMessage] = field(default_factory=list)
 
 
 def _normalize_text(text: str) -> str:
@@ -78,9 +165,17 @@ def _insertion_index_before_last_user(messages: List[ChatMessage]) -> int:
     return len(messages)
 
 
-def build_memory_context_items(items: list[dict], limit: int = MAX_MEMORY_CONTEXT_ITEMS) -> list[str]:
-    """Return compact, deduplicated memory snippets suitable for prompt injection."""
-    filtered: list[str] = []
+def build_memory_context_items(
+    items: list[dict],
+    limit: int = MAX_MEMORY_CONTEXT_ITEMS,
+    mmr_lambda: Optional[float] = None,
+) -> list[str]:
+    """Return compact, deduplicated memory snippets suitable for prompt injection.
+
+    With `mmr_lambda` the slots are filled by MMR over item embeddings, so paraphrases of one
+    memory do not take all of them; without it (or without embeddings) retrieval order is kept.
+    """
+    filtered: list[dict] = []
     seen: set[str] = set()
     for item in items:
         raw = str(item.get("content", "") or "").strip()
@@ -93,10 +188,9 @@ def build_memory_context_items(items: list[dict], limit: int = MAX_MEMORY_CONTEX
         if not normalized or normalized in seen:
             continue
         seen.add(normalized)
-        filtered.append(raw[:500])
-        if len(filtered) >= limit:
-            break
-    return filtered
+        filtered.append(item)
+    chosen = mmr_select(filtered, limit, mmr_lambda) if mmr_lambda is not None else filtered[:limit]
+    return [str(item.get("content", "")).strip()[:500] for item in chosen]
 
 
 def build_memory_context_block(items: list[dict], limit: int = MAX_MEMORY_CONTEXT_ITEMS) -> str:
@@ -167,6 +261,7 @@ async def search_memory_context(req: Request, memory_engine: MemoryEngine, query
         query_text=query_text,
         limit=limit,
         multimodal_retriever=mm_retriever,
+        include_embeddings=True,
     )
 
 
@@ -194,11 +289,12 @@ def build_source_summary_disambiguation_message() -> ChatMessage:
     )
 
 
-async def build_online_context(query_text: str, enabled: bool = False) -> str:
-    if not online_tools_enabled():
-        return ""
+def _online_search_requested(query_text: str, enabled: bool = False) -> bool:
+    return online_tools_enabled() and (enabled or _online_search_triggered(query_text))
+
 
-    if not enabled and not _online_search_triggered(query_text):
+async def build_online_context(query_text: str, enabled: bool = False) -> str:
+    if not _online_search_requested(query_text, enabled):
         return ""
 
     cleaned = query_text.split(":", 1)[1].strip() if _online_search_triggered(query_text) and ":" in query_text else query_text.strip()
@@ -324,10 +420,311 @@ async def _run_autonomous_task(req: Request, query_text: str) -> AutonomousExecu
         )
 
 
-@router.post("", response_model=ChatResponse)
-@router.post("/", response_model=ChatResponse)
-async def chat(request: ChatRequest, req: Request):
-    """Чат с LLM через KoboldCpp с использованием памяти Roampal и companion-политик."""
+def split_latest_turn(messages: List[ChatMessage]) -> tuple[List[ChatMessage], List[ChatMessage]]:
+    """Split request messages into history and the latest user turn (plus anything after it)."""
+    idx = _insertion_index_before_last_user(messages)
+    if idx >= len(messages):
+        return list(messages[:-1]), list(messages[-1:])
+    return list(messages[:idx]), list(messages[idx:])
+
+
+def new_session_turn(request: ChatRequest) -> List[ChatMessage]:
+    """Messages the request adds to its session: the latest user turn (the store already has the rest)."""
+    return split_latest_turn(request.messages)[1]
+
+
+async def _message_cost(message: ChatMessage, counter: TokenCounter) -> int:
+    return await counter.count(message.content) + MESSAGE_OVERHEAD_TOKENS
+
+
+async def _fit_message(message: Optional[ChatMessage], cap: int, counter: TokenCounter) -> tuple[Optional[ChatMessage], int]:
+    """Return the message (truncated if needed) and its cost, or (None, 0) if nothing useful fits."""
+    if message is None or cap <= MESSAGE_OVERHEAD_TOKENS:
+        return None, 0
+    cost = await _message_cost(message, counter)
+    if cost <= cap:
+        return message, cost
+    content = await counter.truncate(message.content, cap - MESSAGE_OVERHEAD_TOKENS)
+    if not content:
+        return None, 0
+    fitted = ChatMessage(role=message.role, content=content)
+    return fitted, await _message_cost(fitted, counter)
+
+
+async def allocate_prompt_budget(
+    blocks: PromptBlocks,
+    counter: TokenCounter,
+    budget: PromptBudget,
+    max_new_tokens: int,
+    history_page: int = 1,
+) -> tuple[PromptBlocks, dict]:
+    """Fit prompt blocks into the model context.
+
+    Priority: system policy, then the latest user turn, then memory/facts/web/autonomy context
+    (each capped by its share), then history from newest to oldest with whatever is left.
+    With history_page > 1 the oldest history is dropped in whole pages instead of one by one.
+    """
+
+    # Count every block concurrently up front; the sequential pass below then hits the counter cache.
+    await counter.count_many([
+        DEFAULT_SYSTEM_PROMPT,
+        *(m.content for m in [*blocks.policy, *blocks.history, *blocks.latest]),
+        *(m.content for m in (blocks.disambiguation, blocks.memory, blocks.facts, blocks.web, blocks.autonomy) if m is not None),
+    ])
+    available = budget.context_tokens - max_new_tokens - await counter.count(DEFAULT_SYSTEM_PROMPT)
+    available -= MESSAGE_OVERHEAD_TOKENS * 2  # default system prompt + trailing "Assistant:"
+    usage: dict = {"budget": max(0, available)}
+
+    history_system = [m for m in blocks.history if m.role == "system"]
+    history_turns = [m for m in blocks.history if m.role != "system"]
+
+    used = 0
+    for message in [*blocks.policy, *history_system, *([blocks.disambiguation] if blocks.disambiguation else [])]:
+        used += await _message_cost(message, counter)
+    usage["policy"] = used
+
+    latest: List[ChatMessage] = []
+    for message in blocks.latest:
+        fitted, cost = await _fit_message(message, max(available - used, MESSAGE_OVERHEAD_TOKENS + 1), counter)
+        if fitted is not None:
+            latest.append(fitted)
+            used += cost
+    usage["latest"] = used - usage["policy"]
+
+    base = max(0, available - used)
+    fitted_blocks: dict = {}
+    for name, share in (
+        ("memory", budget.memory_share),
+        ("facts", budget.facts_share),
+        ("web", budget.web_share),
+        ("autonomy", budget.autonomy_share),
+    ):
+        cap = min(int(base * max(0.0, share)), max(0, available - used))
+        fitted, cost = await _fit_message(getattr(blocks, name), cap, counter)
+        fitted_blocks[name] = fitted
+        usage[name] = cost
+        used += cost
+
+    kept: List[ChatMessage] = []
+    history_used = 0
+    if history_page <= 1:
+        for message in reversed(history_turns[-MAX_CHAT_HISTORY_MESSAGES:]):
+            cost = await _message_cost(message, counter)
+            if used + cost > available:
+                break
+            kept.append(message)
+            used += cost
+            history_used += cost
+        kept.reverse()
+    else:
+        costs = [await _message_cost(m, counter) for m in history_turns]
+        start = 0
+        while start < len(history_turns):
+            tail_cost = sum(costs[start:])
+            if len(history_turns) - start <= MAX_CHAT_HISTORY_MESSAGES and used + tail_cost <= available:
+                break
+            start += history_page
+        kept = history_turns[start:]
+        history_used = sum(costs[start:])
+        used += history_used
+    usage["history"] = history_used
+    usage["history_dropped"] = len(history_turns) - len(kept)
+    usage["total"] = used
+
+    allocated = PromptBlocks(
+        policy=blocks.policy,
+        facts=fitted_blocks["facts"],
+        memory=fitted_blocks["memory"],
+        disambiguation=blocks.disambiguation,
+        web=fitted_blocks["web"],
+        autonomy=fitted_blocks["autonomy"],
+        history=[*history_system, *kept],
+        latest=latest,
+    )
+    return allocated, usage
+
+
+def assemble_prompt_messages(blocks: PromptBlocks, layout: str = "legacy") -> List[ChatMessage]:
+    """Order prompt blocks for the given layout.
+
+    legacy: policy and facts first, then history, per-turn context right before the latest user turn.
+    prefix_stable: history first in append-only order, and everything that may change between turns
+    (policy, facts, memory, web, autonomy) only right before the latest user turn, so KoboldCpp can
+    reuse the KV cache of the unchanged prefix.
+    """
+    head = [*blocks.policy, *([blocks.facts] if blocks.facts else [])]
+    volatile = [m for m in (blocks.memory, blocks.disambiguation, blocks.web, blocks.autonomy) if m is not None]
+    if layout == "prefix_stable":
+        return [*blocks.history, *head, *volatile, *blocks.latest]
+    return [*head, *blocks.history, *volatile, *blocks.latest]
+
+
+@dataclass
+class ChatTurnContext:
+    """Prompt and bookkeeping assembled for a single chat turn."""
+
+    query_text: str
+    working_messages: List[ChatMessage]
+    memory_context: list[dict] = field(default_factory=list)
+    retrieval_backend: str = "legacy"
+    context_items: int = 0
+    used_relationship_ids: list[str] = field(default_factory=list)
+    autonomous_info: Optional[AutonomousExecution] = None
+    prompt_usage: dict = field(default_factory=dict)
+    generation: Optional[dict] = None
+    context_sources: dict = field(default_factory=dict)
+    interaction_id: Optional[str] = None
+    # Semantic response cache: the answer served from it, or the (embedding, fingerprint) to store under.
+    cached_response: Optional[str] = None
+    response_cache_key: Optional[tuple[list[float], str]] = None
+    stage_timings_ms: dict = field(default_factory=dict)
+    started_at: float = field(default_factory=time.perf_counter)
+
+
+@contextmanager
+def timed_stage(ctx: ChatTurnContext, stage: str):
+    """Record the wall time of one pipeline stage into the turn's trace."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        ctx.stage_timings_ms[stage] = round((time.perf_counter() - started) * 1000.0, 2)
+
+
+async def _gather_source(name: str, coro, deadline_s: Optional[float], report: dict):
+    """Await one context source within its deadline; failures and timeouts drop the source."""
+    started = time.perf_counter()
+    try:
+        result = await asyncio.wait_for(coro, timeout=deadline_s)
+        status = "ok"
+    except asyncio.TimeoutError:
+        result, status = None, "timeout"
+    except Exception as exc:
+        result, status = None, f"error: {exc.__class__.__name__}"
+    report[name] = {"status": status, "ms": round((time.perf_counter() - started) * 1000.0, 2), "used": False}
+    return result
+
+
+def _conversation_store(req: Request) -> ConversationStore:
+    store: ConversationStore | None = getattr(req.app.state, "conversation_store", None)
+    if store is None:
+        raise HTTPException(status_code=503, detail="conversation store is not initialized")
+    return store
+
+
+def load_session_history(req: Request, session_id: Optional[str]) -> List[ChatMessage]:
+    """History of a server-held session (tail cache), empty for stateless requests."""
+    if not session_id:
+        return []
+    store = _conversation_store(req)
+    if store.get_session(session_id) is None:
+        raise HTTPException(status_code=404, detail="Сессия не найдена")
+    messages = store.get_messages(session_id)
+    summary = store.get_summary(session_id)
+    covered_seq = summary.covered_seq if summary is not None else -1
+    # While summarization lags, turns between the summary and the tail are in neither: load them from
+    # SQLite and leave trimming to allocate_prompt_budget.
+    if messages and messages[0].seq > covered_seq + 1:
+        messages = [*store.get_messages_between(session_id, covered_seq, messages[0].seq), *messages]
+    history = [ChatMessage(role=m.role, content=m.content) for m in messages if m.seq > covered_seq]
+    if summary is None:
+        return history
+    # The rolling summary stands in for the turns it covers; it opens the history so it stays in the prefix.
+    return [ChatMessage(role="system", content=build_summary_message_text(summary.summary)), *history]
+
+
+def _response_cache(req: Request) -> SemanticResponseCache | None:
+    return getattr(req.app.state, "response_cache", None)
+
+
+async def lookup_response_cache(request: ChatRequest, req: Request, ctx: ChatTurnContext, history: List[ChatMessage]) -> bool:
+    """Serve a near-identical earlier question from the semantic cache; on a miss remember the key for storing."""
+
+    cache = _response_cache(req)
+    embeddings_client = getattr(req.app.state, "embeddings_client", None)
+    if cache is None or embeddings_client is None:
+        return False
+    # Web and autonomy answers depend on the moment they were produced.
+    if _online_search_requested(ctx.query_text, enabled=request.web_search):
+        return False
+    if _autonomy_enabled() and _should_run_autonomy(request.autonomous_mode, ctx.query_text):
+        return False
+
+    companion_state: CompanionState | None = getattr(req.app.state, "companion_state", None)
+    companion_memory: CompanionMemory | None = getattr(req.app.state, "companion_memory", None)
+    started = time.perf_counter()
+    try:
+        embedding = await asyncio.wait_for(
+            embeddings_client.embed_query(_normalize_text(ctx.query_text)),
+            timeout=RESPONSE_CACHE_EMBED_TIMEOUT_SECONDS,
+        )
+        profile_version = (await asyncio.to_thread(companion_memory.get_profile)).version if companion_memory else 0
+    except Exception as exc:
+        ctx.context_sources["response_cache"] = {
+            "status": f"error: {exc.__class__.__name__}",
+            "ms": round((time.perf_counter() - started) * 1000.0, 2),
+            "used": False,
+        }
+        return False
+
+    sess = companion_state.get_session() if companion_state is not None else None
+    # The previous assistant turn is part of the key, so a follow-up only matches within the same context.
+    last_reply = next((m.content for m in reversed(history) if m.role == "assistant"), "")
+    fingerprint = make_fingerprint(
+        sess.reasoning_mode if sess else "",
+        sess.challenge_mode if sess else "",
+        profile_version,
+        request.use_memory,
+        request.max_tokens,
+        _normalize_text(last_reply),
+    )
+    entry = cache.lookup(embedding, fingerprint)
+    ctx.context_sources["response_cache"] = {
+        "status": "hit" if entry else "miss",
+        "ms": round((time.perf_counter() - started) * 1000.0, 2),
+        "used": entry is not None,
+    }
+    if entry is None:
+        ctx.response_cache_key = (embedding, fingerprint)
+        return False
+    ctx.cached_response = entry.response
+    ctx.interaction_id = entry.interaction_id
+    return True
+
+
+async def select_relationship_facts(req: Request, companion_memory: CompanionMemory, query_text: str, limit: int = 3):
+    """Active facts most relevant to the query; the most recently updated ones without the vector index."""
+    fact_index: FactVectorIndex | None = getattr(req.app.state, "fact_index", None)
+    facts = await asyncio.to_thread(companion_memory.list_facts, limit=FACT_INDEX_CANDIDATES if fact_index else limit)
+    if fact_index is None or len(facts) <= limit:
+        return facts[:limit]
+    try:
+        return await asyncio.wait_for(
+            fact_index.select(_normalize_text(query_text), facts, limit),
+            timeout=FACT_INDEX_TIMEOUT_SECONDS,
+        )
+    except Exception:
+        return facts[:limit]
+
+
+def _prefetch_slot_key(session_id: Optional[str]) -> str:
+    return session_id or "default"
+
+
+def _prefetched_or(prefetched: dict, name: str, factory):
+    """Prefetched task of a source unless it already failed; otherwise fetch now."""
+    task = prefetched.get(name)
+    if task is not None and not (task.done() and (task.cancelled() or task.exception() is not None)):
+        return task
+    prefetched.pop(name, None)
+    return factory()
+
+
+async def prepare_chat_turn(request: ChatRequest, req: Request, evaluation: bool = False) -> ChatTurnContext:
+    """Collect companion policy, memory, web and autonomy context and fit it into the token budget.
+
+    evaluation: offline replay — the response cache and prefetch slots are neither read nor consumed.
+    """
 
     if not request.messages:
         raise HTTPException(status_code=400, detail="messages не может быть пустым")
@@ -335,123 +732,673 @@ async def chat(request: ChatRequest, req: Request):
     memory_engine: MemoryEngine = req.app.state.memory_engine
     companion_state: CompanionState | None = getattr(req.app.state, "companion_state", None)
     companion_memory: CompanionMemory | None = getattr(req.app.state, "companion_memory", None)
+    counter: TokenCounter = getattr(req.app.state, "token_counter", token_counter)
 
-    context_items = 0
-    memory_context = []
-    retrieval_backend = "legacy"
-    query_text = request.messages[-1].content
-    working_messages = list(request.messages)
-    used_relationship_ids: list[str] = []
-    active_kobold: KoboldClient = getattr(req.app.state, "kobold_client", kobold)
-    autonomous_info: Optional[AutonomousExecution] = None
+    if request.session_id:
+        messages = [*load_session_history(req, request.session_id), *new_session_turn(request)]
+    else:
+        messages = list(request.messages)
+    ctx = ChatTurnContext(query_text=request.messages[-1].content, working_messages=messages)
+    query_text = ctx.query_text
+    history, latest = split_latest_turn(messages)
+    if not evaluation:
+        with timed_stage(ctx, "response_cache"):
+            cache_hit = await lookup_response_cache(request, req, ctx, history)
+        if cache_hit:
+            return ctx
+    blocks = PromptBlocks(history=history, latest=latest)
 
     # Companion behavior policy injection (mode/challenge)
-    if companion_state is not None:
-        behavior_msg = build_companion_behavior_message(companion_state.get_session())
-        working_messages.insert(0, behavior_msg)
+    with timed_stage(ctx, "behavior"):
+        if companion_state is not None:
+            blocks.policy.append(build_companion_behavior_message(companion_state.get_session()))
+
+    if request.web_search and _needs_source_summary_disambiguation(query_text):
+        blocks.disambiguation = build_source_summary_disambiguation_message()
+
+    # Context fetched by /prefetch while the user was typing this exact message.
+    prefetch_cache: PrefetchCache | None = getattr(req.app.state, "prefetch_cache", None)
+    prefetched = {}
+    if prefetch_cache is not None and not evaluation:
+        prefetched = prefetch_cache.take(_prefetch_slot_key(request.session_id), _normalize_text(query_text)) or {}
 
-    # Relationship memory injection (top active facts)
+    # Independent context sources run concurrently, each under its own deadline, so the turn waits
+    # for the slowest source that made it rather than for the sum of all of them.
+    sources = {}
     if companion_memory is not None:
-        relation_facts = companion_memory.list_facts(limit=3)
-        if relation_facts:
-            relation_payload = [{"fact_id": x.fact_id, "fact": x.fact} for x in relation_facts]
-            used_relationship_ids = [x["fact_id"] for x in relation_payload]
-            working_messages.insert(1 if companion_state is not None else 0, build_relationship_memory_message(relation_payload))
+        # Relationship memory injection (facts most relevant to the question); sqlite runs off the event loop.
+        sources["facts"] = (
+            _prefetched_or(prefetched, "facts", lambda: select_relationship_facts(req, companion_memory, query_text, limit=3)),
+            CONTEXT_SOURCE_DEADLINES_S["facts"],
+        )
+    if request.use_memory:
+        sources["memory"] = (
+            _prefetched_or(prefetched, "memory", lambda: search_memory_context(req, memory_engine, query_text, limit=8)),
+            CONTEXT_SOURCE_DEADLINES_S["memory"],
+        )
+    if _online_search_requested(query_text, enabled=request.web_search):
+        # Optional internet search context in chat (prefix `web:` or `search:`).
+        sources["web"] = (build_online_context(query_text, enabled=request.web_search), CONTEXT_SOURCE_DEADLINES_S["web"])
+    if _autonomy_enabled() and _should_run_autonomy(request.autonomous_mode, query_text):
+        # No deadline: cancelling a running sandbox task would leave it in an undefined state.
+        sources["autonomy"] = (_run_autonomous_task(req, query_text), None)
+
+    results = await asyncio.gather(
+        *(_gather_source(name, coro, deadline, ctx.context_sources) for name, (coro, deadline) in sources.items())
+    )
+    gathered = dict(zip(sources, results))
+    for name in ("facts", "memory"):
+        if name in prefetched and name in ctx.context_sources:
+            ctx.context_sources[name]["prefetched"] = True
+    # Sources ran concurrently: each stage is its own wait, "context" the wall time of the whole gather.
+    for name, report in ctx.context_sources.items():
+        if name in sources:
+            ctx.stage_timings_ms[name] = report["ms"]
+    ctx.stage_timings_ms["context"] = round(max((r["ms"] for n, r in ctx.context_sources.items() if n in sources), default=0.0), 2)
+
+    relation_facts = gathered.get("facts")
+    if relation_facts:
+        relation_payload = [{"fact_id": x.fact_id, "fact": x.fact} for x in relation_facts]
+        ctx.used_relationship_ids = [x["fact_id"] for x in relation_payload]
+        blocks.facts = build_relationship_memory_message(relation_payload)
 
     # Получение релевантного контекста из памяти
-    if request.use_memory:
-        memory_context, retrieval_backend = await search_memory_context(req, memory_engine, query_text, limit=8)
+    if gathered.get("memory") is not None:
+        ctx.memory_context, ctx.retrieval_backend = gathered["memory"]
 
         # Добавление контекста в промпт
-        if memory_context:
-            filtered_context_items = build_memory_context_items(memory_context, limit=MAX_MEMORY_CONTEXT_ITEMS)
+        if ctx.memory_context:
+            reasoning_mode = companion_state.get_session().reasoning_mode if companion_state is not None else "stable"
+            filtered_context_items = build_memory_context_items(
+                ctx.memory_context,
+                limit=MAX_MEMORY_CONTEXT_ITEMS,
+                mmr_lambda=MEMORY_MMR_LAMBDA.get(reasoning_mode, MEMORY_MMR_LAMBDA["stable"]),
+            )
             context_text = "\n\n".join([f"[Память {i + 1}]: {text}" for i, text in enumerate(filtered_context_items)])
 
-            # Вставка контекста перед последним сообщением
             if context_text:
-                system_msg = ChatMessage(
+                blocks.memory = ChatMessage(
                     role="system",
-                    content=f"Релевантный контекст из памяти ({retrieval_backend}):\n{context_text}",
+                    content=f"Релевантный контекст из памяти ({ctx.retrieval_backend}):\n{context_text}",
                 )
-                insertion_index = _insertion_index_before_last_user(working_messages)
-                working_messages.insert(insertion_index, system_msg)
-                context_items = len(filtered_context_items)
-
-    if request.web_search and _needs_source_summary_disambiguation(query_text):
-        insertion_index = _insertion_index_before_last_user(working_messages)
-        working_messages.insert(insertion_index, build_source_summary_disambiguation_message())
+                ctx.context_items = len(filtered_context_items)
 
-    # Optional internet search context in chat (prefix `web:` or `search:`).
-    online_context = await build_online_context(query_text, enabled=request.web_search)
+    online_context = gathered.get("web")
     if online_context:
-        insertion_index = _insertion_index_before_last_user(working_messages)
-        working_messages.insert(
-            insertion_index,
-            ChatMessage(role="system", content=f"Актуальный интернет-контекст:\n{online_context}"),
-        )
+        blocks.web = ChatMessage(role="system", content=f"Актуальный интернет-контекст:\n{online_context}")
 
-    if _autonomy_enabled() and _should_run_autonomy(request.autonomous_mode, query_text):
-        autonomous_info = await _run_autonomous_task(req, query_text)
+    autonomous_info = gathered.get("autonomy")
+    if autonomous_info is not None:
+        ctx.autonomous_info = autonomous_info
         if autonomous_info.triggered:
-            insertion_index = _insertion_index_before_last_user(working_messages)
-            working_messages.insert(
-                insertion_index,
-                ChatMessage(
-                    role="system",
-                    content=(
-                        "Автономное выполнение пользовательской задачи уже выполнено. "
-                        "Сформируй отчёт строго по факту выполнения.\n"
-                        f"task_id: {autonomous_info.task_id}\n"
-                        f"status: {autonomous_info.status}\n"
-                        f"language: {autonomous_info.language}\n"
-                        f"exit_code: {autonomous_info.exit_code}\n"
-                        f"stdout:\n{autonomous_info.stdout[:1200]}\n"
-                        f"stderr:\n{autonomous_info.stderr[:1200]}"
-                    ),
+            blocks.autonomy = ChatMessage(
+                role="system",
+                content=(
+                    "Автономное выполнение пользовательской задачи уже выполнено. "
+                    "Сформируй отчёт строго по факту выполнения.\n"
+                    f"task_id: {autonomous_info.task_id}\n"
+                    f"status: {autonomous_info.status}\n"
+                    f"language: {autonomous_info.language}\n"
+                    f"exit_code: {autonomous_info.exit_code}\n"
+                    f"stdout:\n{autonomous_info.stdout[:1200]}\n"
+                    f"stderr:\n{autonomous_info.stderr[:1200]}"
                 ),
             )
 
-    working_messages = trim_chat_history(working_messages)
+    layout = resolve_prompt_layout(request.prompt_layout)
+    with timed_stage(ctx, "prompt_budget"):
+        allocated, ctx.prompt_usage = await allocate_prompt_budget(
+            blocks,
+            counter,
+            PromptBudget.from_env(),
+            max_new_tokens=request.max_tokens,
+            history_page=PREFIX_STABLE_HISTORY_PAGE if layout == "prefix_stable" else 1,
+        )
+    if allocated.memory is None:
+        ctx.context_items = 0
+    if allocated.facts is None:
+        ctx.used_relationship_ids = []
+    for name in ctx.context_sources:
+        ctx.context_sources[name]["used"] = getattr(allocated, name, None) is not None
+    ctx.prompt_usage["layout"] = layout
+    ctx.working_messages = assemble_prompt_messages(allocated, layout=layout)
+    return ctx
+
+
+async def _persist_chat_turn(request: ChatRequest, req: Request, ctx: ChatTurnContext, response: str):
+    """Session append, memory interaction and response-cache entry of a finished turn."""
+    memory_engine: MemoryEngine = req.app.state.memory_engine
 
-    try:
-        if autonomous_info is not None and autonomous_info.triggered:
-            response = build_autonomous_response(query_text, autonomous_info)
+    if request.session_id:
+        _conversation_store(req).append_messages(
+            request.session_id,
+            [*((m.role, m.content) for m in new_session_turn(request)), ("assistant", response)],
+        )
+        summarizer: ConversationSummarizer | None = getattr(req.app.state, "conversation_summarizer", None)
+        if summarizer is not None:
+            summarizer.maybe_schedule(request.session_id)
+
+    if ctx.cached_response is not None:
+        # The answer is already stored as the original interaction; feedback goes there.
+        pass
+    elif request.use_memory:
+        writer: InteractionWriter | None = getattr(req.app.state, "interaction_writer", None)
+        if writer is not None:
+            # Write-behind: embedding + Chroma insert happen after the response is returned.
+            ctx.interaction_id = writer.submit(ctx.query_text, response, ctx.memory_context)
         else:
-            response = await active_kobold.generate(
-                messages=serialize_messages(working_messages),
-                max_tokens=request.max_tokens,
-                temperature=request.temperature,
-            )
-
-        if request.use_memory:
-            await memory_engine.add_interaction(
-                query=query_text,
+            ctx.interaction_id = await memory_engine.add_interaction(
+                query=ctx.query_text,
                 response=response,
-                context_used=memory_context,
+                context_used=ctx.memory_context,
             )
 
-        if companion_state is not None:
-            sess = companion_state.get_session()
-            companion_state.set_last_trace(
-                response_id=f"resp_{uuid.uuid4().hex[:12]}",
-                retrieval_backend=retrieval_backend,
-                relationship_used=used_relationship_ids,
-                uncertainty_markers=infer_uncertainty_markers(response),
-                counter_position_used=(sess.challenge_mode != "off"),
-                confidence=0.72 if sess.reasoning_mode == "stable" else 0.64,
-            )
+    cache = _response_cache(req)
+    if cache is not None and ctx.response_cache_key is not None and ctx.cached_response is None and response:
+        embedding, fingerprint = ctx.response_cache_key
+        cache.put(
+            embedding,
+            fingerprint,
+            query=ctx.query_text,
+            response=response,
+            interaction_id=ctx.interaction_id,
+            context_ids=[str(item.get("id")) for item in ctx.memory_context if item.get("id")],
+        )
+
+
+async def finalize_chat_turn(request: ChatRequest, req: Request, ctx: ChatTurnContext, response: str):
+    """Persist the interaction and record the explainability trace once the answer is complete."""
+
+    companion_state: CompanionState | None = getattr(req.app.state, "companion_state", None)
+
+    with timed_stage(ctx, "persistence"):
+        await _persist_chat_turn(request, req, ctx, response)
+    ctx.stage_timings_ms["total"] = round((time.perf_counter() - ctx.started_at) * 1000.0, 2)
+
+    if companion_state is not None:
+        sess = companion_state.get_session()
+        companion_state.set_last_trace(
+            response_id=f"resp_{uuid.uuid4().hex[:12]}",
+            retrieval_backend=ctx.retrieval_backend,
+            relationship_used=ctx.used_relationship_ids,
+            uncertainty_markers=infer_uncertainty_markers(response),
+            counter_position_used=(sess.challenge_mode != "off"),
+            confidence=0.72 if sess.reasoning_mode == "stable" else 0.64,
+            generation=ctx.generation,
+            context_sources=ctx.context_sources,
+            stage_timings_ms=ctx.stage_timings_ms,
+        )
+
+
+def _generation_error(exc: Exception) -> HTTPException:
+    detail = str(exc)
+    if isinstance(exc, SchedulerQueueFullError):
+        status = 503
+    elif isinstance(exc, TimeoutError):
+        status = 504
+    else:
+        status = 503 if "KoboldCpp error" in detail else 500
+    return HTTPException(status_code=status, detail=f"Ошибка генерации: {detail}")
+
+
+DISCONNECT_POLL_SECONDS = 0.5
+
+
+async def _cancel_on_disconnect(req: Request, coro):
+    """Run coro, cancelling it (and thereby aborting the KoboldCpp generation) if the client goes away."""
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+            if await req.is_disconnected():
+                task.cancel()
+                with suppress(asyncio.CancelledError):
+                    await task
+                raise HTTPException(status_code=499, detail="client disconnected")
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+async def generate_chat_response(
+    req: Request,
+    active_kobold: KoboldClient,
+    messages: List[dict],
+    request: ChatRequest,
+    priority: LLMPriority = LLMPriority.INTERACTIVE,
+    caller: str = "chat",
+    watch_disconnect: bool = True,
+) -> str:
+    """Generate through the shared LLM scheduler (interactive priority by default) when the app provides one."""
+    scheduler: LLMScheduler | None = getattr(req.app.state, "llm_scheduler", None)
+
+    async def _call() -> str:
+        return await active_kobold.generate(
+            messages=messages,
+            max_tokens=request.max_tokens,
+            temperature=request.temperature,
+        )
+
+    with llm_caller(caller):
+        if scheduler is None:
+            return await _call()
+        scheduled = scheduler.run(_call, priority=priority, on_cancel=active_kobold.abort)
+        if not watch_disconnect:
+            return await scheduled
+        return await _cancel_on_disconnect(req, scheduled)
+
+
+@router.post("", response_model=ChatResponse)
+@router.post("/", response_model=ChatResponse)
+async def chat(request: ChatRequest, req: Request):
+    """Чат с LLM через KoboldCpp с использованием памяти Roampal и companion-политик."""
+
+    ctx = await prepare_chat_turn(request, req)
+    active_kobold: KoboldClient = getattr(req.app.state, "kobold_client", kobold)
+
+    try:
+        if ctx.cached_response is not None:
+            response = ctx.cached_response
+        elif ctx.autonomous_info is not None and ctx.autonomous_info.triggered:
+            response = build_autonomous_response(ctx.query_text, ctx.autonomous_info)
+        else:
+            with capture_generation_stats() as generations, timed_stage(ctx, "generation"):
+                response = await generate_chat_response(req, active_kobold, serialize_messages(ctx.working_messages), request)
+            ctx.generation = generations[-1].as_dict() if generations else None
+
+        await finalize_chat_turn(request, req, ctx, response)
 
         return ChatResponse(
             response=response,
             memory_used=request.use_memory,
-            context_items=context_items,
-            autonomous=autonomous_info,
+            context_items=ctx.context_items,
+            autonomous=ctx.autonomous_info,
+            session_id=request.session_id,
+            interaction_id=ctx.interaction_id,
+            cached=ctx.cached_response is not None,
         )
 
+    except HTTPException:
+        raise
     except Exception as e:
-        detail = str(e)
-        status = 503 if "KoboldCpp error" in detail else 500
-        raise HTTPException(status_code=status, detail=f"Ошибка генерации: {detail}")
+        raise _generation_error(e)
+
+
+def _sse_event(event: str, payload: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+@router.post("/stream")
+async def chat_stream(request: ChatRequest, req: Request):
+    """SSE-вариант чата: токены отдаются по мере генерации, persistence и trace — после завершения.
+
+    События: `token` ({"token": ...}), затем `done` (метаданные как в ChatResponse без текста)
+    или `error` ({"status_code", "detail"}).
+    """
+
+    ctx = await prepare_chat_turn(request, req)
+    active_kobold: KoboldClient = getattr(req.app.state, "kobold_client", kobold)
+    scheduler: LLMScheduler | None = getattr(req.app.state, "llm_scheduler", None)
+
+    async def event_source():
+        chunks: list[str] = []
+        try:
+            if ctx.cached_response is not None:
+                chunks.append(ctx.cached_response)
+                yield _sse_event("token", {"token": chunks[0]})
+            elif ctx.autonomous_info is not None and ctx.autonomous_info.triggered:
+                chunks.append(build_autonomous_response(ctx.query_text, ctx.autonomous_info))
+                yield _sse_event("token", {"token": chunks[0]})
+            else:
+                # Client disconnects cancel this generator, which aborts the generation via the scheduler hook.
+                slot = (
+                    scheduler.slot(LLMPriority.INTERACTIVE, on_cancel=active_kobold.abort)
+                    if scheduler is not None
+                    else nullcontext()
+                )
+                with llm_caller("chat"), capture_generation_stats() as generations, timed_stage(ctx, "generation"):
+                    async with slot:
+                        async for token in active_kobold.generate_stream(
+                            messages=serialize_messages(ctx.working_messages),
+                            max_tokens=request.max_tokens,
+                            temperature=request.temperature,
+                        ):
+                            chunks.append(token)
+                            yield _sse_event("token", {"token": token})
+                ctx.generation = generations[-1].as_dict() if generations else None
+
+            response = "".join(chunks).strip()
+            await finalize_chat_turn(request, req, ctx, response)
+        except Exception as e:
+            error = _generation_error(e)
+            yield _sse_event("error", {"status_code": error.status_code, "detail": error.detail})
+            return
+
+        autonomous = ctx.autonomous_info
+        if autonomous is not None:
+            autonomous = autonomous.model_dump() if hasattr(autonomous, "model_dump") else autonomous.dict()
+        yield _sse_event(
+            "done",
+            {
+                "memory_used": request.use_memory,
+                "context_items": ctx.context_items,
+                "autonomous": autonomous,
+                "session_id": request.session_id,
+                "interaction_id": ctx.interaction_id,
+                "cached": ctx.cached_response is not None,
+            },
+        )
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+CHAT_EVAL_MAX_PROMPTS = int(os.getenv("CHAT_EVAL_MAX_PROMPTS", "500"))
+CHAT_EVAL_MAX_CONCURRENCY = int(os.getenv("CHAT_EVAL_MAX_CONCURRENCY", "4"))
+
+
+class EvalPrompt(BaseModel):
+    prompt: str
+    id: Optional[str] = None
+    # Optional substring the answer should contain (case-insensitive) — a cheap quality signal.
+    expected: Optional[str] = None
+
+
+class EvalBatchRequest(BaseModel):
+    prompts: List[Union[str, EvalPrompt]]
+    concurrency: int = 2
+    use_memory: bool = True
+    max_tokens: int = 256
+    temperature: float = 0.0
+
+
+async def _evaluate_prompt(req: Request, item: EvalPrompt, body: EvalBatchRequest) -> dict:
+    """One prompt through the full pipeline at background priority; nothing is persisted."""
+    request = ChatRequest(
+        messages=[ChatMessage(role="user", content=item.prompt)],
+        use_memory=body.use_memory,
+        max_tokens=body.max_tokens,
+        temperature=body.temperature,
+        # Replays must not run sandbox tasks or depend on live web results.
+        autonomous_mode="off",
+        web_search=False,
+    )
+    active_kobold: KoboldClient = getattr(req.app.state, "kobold_client", kobold)
+    result = {"id": item.id, "prompt": item.prompt}
+    ctx: Optional[ChatTurnContext] = None
+    try:
+        ctx = await prepare_chat_turn(request, req, evaluation=True)
+        with capture_generation_stats() as generations, timed_stage(ctx, "generation"):
+            response = await generate_chat_response(
+                req,
+                active_kobold,
+                serialize_messages(ctx.working_messages),
+                request,
+                priority=LLMPriority.BACKGROUND,
+                caller="eval",
+                # Streaming response: a disconnect cancels the NDJSON generator and with it this call.
+                watch_disconnect=False,
+            )
+        ctx.stage_timings_ms["total"] = round((time.perf_counter() - ctx.started_at) * 1000.0, 2)
+        result.update(
+            ok=True,
+            response=response,
+            context_items=ctx.context_items,
+            generation=generations[-1].as_dict() if generations else None,
+        )
+        if item.expected is not None:
+            result["matched"] = item.expected.lower() in response.lower()
+    except Exception as exc:
+        detail = exc.detail if isinstance(exc, HTTPException) else _generation_error(exc).detail
+        result.update(ok=False, error=detail)
+    result["stage_timings_ms"] = ctx.stage_timings_ms if ctx is not None else {}
+    return result
+
+
+@router.post("/eval/batch")
+async def eval_batch(body: EvalBatchRequest, req: Request):
+    """Прогон корпуса вопросов через полный chat-пайплайн; результаты — NDJSON по мере готовности.
+
+    Строки: `{"index", "id", "prompt", "ok", "response" | "error", "stage_timings_ms", ...}`,
+    последняя — `{"summary": {...}}` с пропускной способностью и перцентилями этапов.
+    """
+
+    items = [EvalPrompt(prompt=p) if isinstance(p, str) else p for p in body.prompts]
+    if not items:
+        raise HTTPException(status_code=400, detail="prompts не может быть пустым")
+    if len(items) > CHAT_EVAL_MAX_PROMPTS:
+        raise HTTPException(status_code=400, detail=f"не больше {CHAT_EVAL_MAX_PROMPTS} prompts за раз")
+    concurrency = max(1, min(int(body.concurrency), CHAT_EVAL_MAX_CONCURRENCY))
+
+    async def lines():
+        semaphore = asyncio.Semaphore(concurrency)
+        started = time.perf_counter()
+
+        async def _run(index: int, item: EvalPrompt) -> dict:
+            async with semaphore:
+                return {"index": index, **await _evaluate_prompt(req, item, body)}
+
+        tasks = [asyncio.create_task(_run(i, item)) for i, item in enumerate(items)]
+        stages: dict[str, RollingHistogram] = {}
+        ok = matched = judged = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                ok += 1 if result["ok"] else 0
+                if "matched" in result:
+                    judged += 1
+                    matched += 1 if result["matched"] else 0
+                for stage, ms in result["stage_timings_ms"].items():
+                    stages.setdefault(stage, RollingHistogram(window=len(items))).observe(ms)
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+        finally:
+            # Client went away: stop the remaining prompts instead of generating for nobody.
+            for task in tasks:
+                task.cancel()
+
+        wall_s = time.perf_counter() - started
+        summary = {
+            "count": len(items),
+            "ok": ok,
+            "failed": len(items) - ok,
+            "matched": matched if judged else None,
+            "match_rate": round(matched / judged, 4) if judged else None,
+            "concurrency": concurrency,
+            "wall_ms": round(wall_s * 1000.0, 2),
+            "prompts_per_minute": round(len(items) / wall_s * 60.0, 2) if wall_s > 0 else None,
+            "stages": {stage: h.snapshot() for stage, h in sorted(stages.items())},
+        }
+        yield json.dumps({"summary": summary}, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+class PrefetchRequest(BaseModel):
+    text: str
+    session_id: Optional[str] = None
+    use_memory: bool = True
+    # prefix_stable only: push the history prefix the turn will send through KoboldCpp (1 token,
+    # background priority) to warm its KV cache. Layout and max_tokens as in the coming ChatRequest.
+    warm_prompt: bool = False
+    prompt_layout: Optional[str] = None
+    max_tokens: int = 512
+
+
+@router.post("/prefetch")
+async def prefetch_context(body: PrefetchRequest, req: Request):
+    """Подготовить контекст по черновику сообщения, пока пользователь печатает (вызывать с debounce)."""
+
+    cache: PrefetchCache | None = getattr(req.app.state, "prefetch_cache", None)
+    if cache is None:
+        raise HTTPException(status_code=503, detail="prefetch cache is not initialized")
+    text = _normalize_text(body.text)
+    if not text:
+        return {"status": "skipped", "sources": []}
+
+    companion_memory: CompanionMemory | None = getattr(req.app.state, "companion_memory", None)
+    embeddings_client = getattr(req.app.state, "embeddings_client", None)
+    loaders = {}
+    if companion_memory is not None:
+        loaders["facts"] = lambda: select_relationship_facts(req, companion_memory, body.text, limit=3)
+    if body.use_memory:
+        memory_engine: MemoryEngine = req.app.state.memory_engine
+        loaders["memory"] = lambda: search_memory_context(req, memory_engine, body.text, limit=8)
+    if _response_cache(req) is not None and embeddings_client is not None:
+        # Warms the embeddings client LRU used by the response cache lookup.
+        loaders["embedding"] = lambda: embeddings_client.embed_query(text)
+    # Only the prefix_stable layout opens the prompt with history; in legacy the policy and facts come
+    # first, so a warmed history would never match the turn's prefix and only occupy the LLM.
+    if body.warm_prompt and body.session_id and resolve_prompt_layout(body.prompt_layout) == "prefix_stable":
+        history = load_session_history(req, body.session_id)
+        active_kobold: KoboldClient = getattr(req.app.state, "kobold_client", kobold)
+        scheduler: LLMScheduler | None = getattr(req.app.state, "llm_scheduler", None)
+        companion_state: CompanionState | None = getattr(req.app.state, "companion_state", None)
+        counter: TokenCounter = getattr(req.app.state, "token_counter", token_counter)
+
+        async def _warm_prompt():
+            # Same policy, budget and history paging as prepare_chat_turn, so the warmed messages are the
+            # history block the turn puts first. Context blocks are not known yet; they shift the history
+            # start only when the tail sits right at a page boundary.
+            blocks = PromptBlocks(history=history, latest=[ChatMessage(role="user", content=body.text)])
+            if companion_state is not None:
+                blocks.policy.append(build_companion_behavior_message(companion_state.get_session()))
+            allocated, _ = await allocate_prompt_budget(
+                blocks,
+                counter,
+                PromptBudget.from_env(),
+                max_new_tokens=body.max_tokens,
+                history_page=PREFIX_STABLE_HISTORY_PAGE,
+            )
+            prefix = serialize_messages(allocated.history)
+            if not prefix:
+                return None
+            with llm_caller("prefetch"):
+                if scheduler is None:
+                    return await active_kobold.generate(prefix, max_tokens=1, temperature=0.0)
+                return await scheduler.run(
+                    lambda: active_kobold.generate(prefix, max_tokens=1, temperature=0.0),
+                    priority=LLMPriority.BACKGROUND,
+                    on_cancel=active_kobold.abort,
+                )
+
+        if history:
+            loaders["prompt"] = _warm_prompt
+
+    started = cache.prefetch(_prefetch_slot_key(body.session_id), text, loaders)
+    return {"status": "scheduled" if started else "unchanged", "sources": sorted(loaders)}
+
+
+@router.get("/prefetch/stats")
+async def prefetch_stats(req: Request):
+    """Prefetch slots: drafts prefetched, superseded by newer drafts, and consumed by chat turns."""
+
+    cache: PrefetchCache | None = getattr(req.app.state, "prefetch_cache", None)
+    if cache is None:
+        raise HTTPException(status_code=503, detail="prefetch cache is not initialized")
+    return cache.get_stats()
+
+
+@router.get("/prompt-stats")
+async def prompt_stats(req: Request):
+    """Prompt-prefix reuse between consecutive KoboldCpp prompts and token counter cache stats."""
+
+    active_kobold: KoboldClient = getattr(req.app.state, "kobold_client", kobold)
+    counter: TokenCounter = getattr(req.app.state, "token_counter", token_counter)
+    summarizer: ConversationSummarizer | None = getattr(req.app.state, "conversation_summarizer", None)
+    fact_index: FactVectorIndex | None = getattr(req.app.state, "fact_index", None)
+    return {
+        "layout": resolve_prompt_layout(),
+        "prefix": active_kobold.prefix_tracker.get_metrics(),
+        "token_counter": counter.get_stats(),
+        "summarizer": summarizer.get_stats() if summarizer is not None else None,
+        "fact_index": fact_index.get_stats() if fact_index is not None else None,
+    }
+
+
+@router.get("/scheduler-metrics")
+async def scheduler_metrics(req: Request):
+    """Queue depth, wait times and outcomes of the shared KoboldCpp scheduler."""
+
+    scheduler: LLMScheduler | None = getattr(req.app.state, "llm_scheduler", None)
+    if scheduler is None:
+        raise HTTPException(status_code=503, detail="llm scheduler is not initialized")
+    return scheduler.get_metrics()
+
+
+class SessionCreateRequest(BaseModel):
+    title: str = ""
+
+
+class SessionResponse(BaseModel):
+    session_id: str
+    title: str
+    message_count: int
+    created_at: float
+    updated_at: float
+
+
+class SessionMessagesResponse(SessionResponse):
+    messages: List[ChatMessage]
+    summary: Optional[str] = None
+
+
+def _session_response(session: ConversationSession) -> SessionResponse:
+    return SessionResponse(**session.__dict__)
+
+
+@router.post("/sessions", response_model=SessionResponse)
+async def create_session(body: SessionCreateRequest, req: Request):
+    """Создать серверную сессию: дальше в /api/chat передаётся только новая реплика и session_id."""
+    return _session_response(_conversation_store(req).create_session(title=body.title))
+
+
+@router.get("/sessions", response_model=List[SessionResponse])
+async def list_sessions(req: Request, limit: int = 50):
+    return [_session_response(x) for x in _conversation_store(req).list_sessions(limit=limit)]
+
+
+@router.get("/sessions/{session_id}", response_model=SessionMessagesResponse)
+async def get_session(session_id: str, req: Request, limit: int = 100):
+    """Сессия и её последние сообщения (для возобновления чата после переподключения)."""
+    store = _conversation_store(req)
+    session = store.get_session(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Сессия не найдена")
+    messages = [ChatMessage(role=m.role, content=m.content) for m in store.get_messages(session_id, limit=limit)]
+    summary = store.get_summary(session_id)
+    return SessionMessagesResponse(**session.__dict__, messages=messages, summary=summary.summary if summary else None)
+
+
+@router.delete("/sessions/{session_id}")
+async def delete_session(session_id: str, req: Request):
+    if not _conversation_store(req).delete_session(session_id):
+        raise HTTPException(status_code=404, detail="Сессия не найдена")
+    return {"status": "deleted"}
+
+
+@router.get("/response-cache")
+async def response_cache_stats(req: Request):
+    """Semantic response cache: hit rate, invalidations and feedback on served hits."""
+
+    cache = _response_cache(req)
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.get_stats()}
+
+
+@router.get("/backends")
+async def kobold_backends(req: Request):
+    """Health, routing capabilities, latency and tokens/sec of the KoboldCpp backend pool."""
+
+    pool: KoboldPool | None = getattr(req.app.state, "kobold_pool", None)
+    if pool is None:
+        raise HTTPException(status_code=503, detail="kobold pool is not initialized")
+    return pool.get_metrics()
 
 
 @router.post("/feedback")
@@ -463,12 +1410,24 @@ async def feedback(
     """Обратная связь для outcome-based learning"""
 
     memory_engine: MemoryEngine = req.app.state.memory_engine
+    writer: InteractionWriter | None = getattr(req.app.state, "interaction_writer", None)
 
     try:
-        await memory_engine.record_outcome(
-            interaction_id=interaction_id,
-            helpful=helpful,
-        )
+        if writer is not None:
+            # Waits only for this interaction if it is still queued; past a short wait the writer
+            # records the outcome itself right after the write.
+            await writer.record_outcome(interaction_id, helpful)
+        else:
+            await memory_engine.record_outcome(
+                interaction_id=interaction_id,
+                helpful=helpful,
+            )
+        cache = _response_cache(req)
+        if cache is not None:
+            cache.record_feedback(interaction_id, helpful)
+            if not helpful:
+                # Answers that used this interaction as context are suspect too.
+                cache.invalidate_memory(interaction_id)
         return {"status": "success", "message": "Обратная связь записана"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -41,11 +41,16 @@ class LastResponseTraceResponse(BaseModel):
     counter_position_used: bool
     confidence: float
     ts: float
+    generation: Optional[dict] = None
+    context_sources: Optional[dict] = None
+    stage_timings_ms: Optional[dict] = None
 
 
 class ResponseTraceHistoryResponse(BaseModel):
     items: list[LastResponseTraceResponse]
     count: int
+    # {stage: {count, p50, p95, max}} over the returned traces.
+    stage_percentiles_ms: dict = {}
 
 
 class StylePatch(BaseModel):
@@ -100,6 +105,8 @@ class RelationshipFactResponse(BaseModel):
     status: str
     created_at: float
     updated_at: float
+    ttl_days: Optional[int] = None
+    expires_at: Optional[float] = None
 
 
 class RelationshipFactsListResponse(BaseModel):
@@ -256,6 +263,8 @@ def _fact_to_response(fact) -> RelationshipFactResponse:
         status=fact.status,
         created_at=fact.created_at,
         updated_at=fact.updated_at,
+        ttl_days=fact.ttl_days,
+        expires_at=fact.expires_at,
     )
 
 
@@ -266,7 +275,11 @@ async def get_response_traces(req: Request, limit: int = 50):
     state: CompanionState = req.app.state.companion_state
     traces = state.get_trace_history(limit=limit)
     items = [LastResponseTraceResponse(**t.__dict__) for t in traces]
-    return ResponseTraceHistoryResponse(items=items, count=len(items))
+    return ResponseTraceHistoryResponse(
+        items=items,
+        count=len(items),
+        stage_percentiles_ms=state.get_stage_percentiles(limit=limit),
+    )
 
 
 @router.get("/relationship-profile", response_model=RelationshipProfileResponse)
@@ -283,6 +296,13 @@ async def patch_relationship_profile(body: RelationshipProfilePatchRequest, req:
     return _profile_to_response(updated)
 
 
+def _invalidate_response_cache(req: Request):
+    # Relationship facts go into every chat prompt, so cached answers may no longer match them.
+    response_cache = getattr(req.app.state, "response_cache", None)
+    if response_cache is not None:
+        response_cache.clear()
+
+
 @router.post("/relationship-facts", response_model=RelationshipFactResponse)
 async def create_relationship_fact(body: RelationshipFactCreateRequest, req: Request):
     memory: CompanionMemory = req.app.state.companion_memory
@@ -293,6 +313,7 @@ async def create_relationship_fact(body: RelationshipFactCreateRequest, req: Req
         confidence=body.confidence,
         ttl_days=body.ttl_days,
     )
+    _invalidate_response_cache(req)
     return _fact_to_response(created)
 
 
@@ -311,6 +332,7 @@ async def invalidate_relationship_fact(fact_id: str, req: Request):
         updated = memory.invalidate_fact(fact_id)
     except ValueError as exc:
         raise HTTPException(status_code=404, detail=str(exc))
+    _invalidate_response_cache(req)
     return _fact_to_response(updated)
 
 
@@ -23,6 +23,10 @@ async def add_memory(item: MemoryItem, req: Request):
             content=item.content,
             metadata=item.metadata
         )
+        # A new memory may change the answer to any cached question.
+        response_cache = getattr(req.app.state, "response_cache", None)
+        if response_cache is not None:
+            response_cache.clear()
         return {"id": memory_id, "status": "added"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -50,6 +54,9 @@ async def delete_memory(memory_id: str, req: Request):
     
     try:
         await memory_engine.delete_memory(memory_id)
+        response_cache = getattr(req.app.state, "response_cache", None)
+        if response_cache is not None:
+            response_cache.invalidate_memory(memory_id)
         return {"status": "deleted"}
     except Exception as e:
         raise HTTPException(status_code=404, detail="Память не найдена")
@@ -65,3 +72,21 @@ async def memory_stats(req: Request):
         return stats
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/embeddings/stats")
+async def embeddings_stats(req: Request):
+    """Счётчики клиента эмбеддингов (latency, cache hits, circuit breaker)"""
+
+    client = getattr(req.app.state, "embeddings_client", None)
+    if client is None:
+        raise HTTPException(status_code=503, detail="embeddings client is not initialized")
+    return client.get_stats()
+
+@router.get("/write-behind/stats")
+async def write_behind_stats(req: Request):
+    """Очередь отложенной записи взаимодействий: глубина, записано, отброшено, ошибки"""
+
+    writer = getattr(req.app.state, "interaction_writer", None)
+    if writer is None:
+        raise HTTPException(status_code=503, detail="interaction writer is not initialized")
+    return writer.get_stats()
@@ -0,0 +1,45 @@
+import asyncio
+
+from fastapi import APIRouter, HTTPException, Request
+
+from backend.core.services.metrics import get_registry
+
+router = APIRouter()
+
+
+@router.get("")
+@router.get("/")
+async def get_metrics(prefix: str = ""):
+    """Счётчики и скользящие гистограммы процесса (llm_ttft_ms, llm_tokens_per_sec, ...)"""
+
+    snapshot = get_registry().snapshot()
+    if not prefix:
+        return snapshot
+    return {
+        section: {key: value for key, value in items.items() if key.startswith(prefix)}
+        for section, items in snapshot.items()
+    }
+
+
+@router.get("/retention")
+async def get_retention_stats(req: Request):
+    """Ретенция журналов событий: сколько заархивировано по таблицам, vacuum, ошибки."""
+
+    retention = getattr(req.app.state, "event_retention", None)
+    if retention is None:
+        raise HTTPException(status_code=503, detail="event retention is not initialized")
+    return retention.get_stats()
+
+
+@router.get("/event-rollups")
+async def get_event_rollups(req: Request, table: str, days: int = 30):
+    """Число событий по дням и типам (архивные rollups + ещё не заархивированные строки)."""
+
+    retention = getattr(req.app.state, "event_retention", None)
+    if retention is None:
+        raise HTTPException(status_code=503, detail="event retention is not initialized")
+    try:
+        items = await asyncio.to_thread(retention.get_daily_counts, table, days=days)
+    except ValueError as exc:
+        raise HTTPException(status_code=404, detail=str(exc))
+    return {"table": table, "items": items, "count": len(items)}
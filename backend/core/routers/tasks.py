@@ -85,13 +85,13 @@ async def approve_task(task_id: str, req: Request):
 
 
 @router.post("/{task_id}/run", response_model=TaskResponse)
-async def run_task(task_id: str, req: Request):
+async def run_task(task_id: str, req: Request, bypass_plan_cache: bool = False):
     runner: TaskRunner = req.app.state.task_runner
     rec = runner.get_task(task_id)
     if not rec:
         raise HTTPException(status_code=404, detail="Task not found")
 
-    plan = await planner.build_plan(rec.goal)
+    plan = await planner.build_plan(rec.goal, bypass_cache=bypass_plan_cache)
 
     try:
         result = await execute_code(
@@ -128,6 +128,12 @@ async def run_task(task_id: str, req: Request):
         return to_response(updated)
 
 
+@router.get("/planner/metrics")
+async def planner_metrics():
+    cache = planner.plan_cache
+    return {**planner.get_metrics(), "plan_cache": cache.get_stats() if cache is not None else None}
+
+
 @router.get("/{task_id}", response_model=TaskResponse)
 async def get_task(task_id: str, req: Request):
     runner: TaskRunner = req.app.state.task_runner
@@ -2,11 +2,39 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 from pathlib import Path
+import asyncio
 import json
+import os
+import re
 import sqlite3
+import threading
 import time
 import uuid
-from typing import Optional
+from typing import Callable, Optional
+
+from backend.core.services.rate_limiter import SlidingWindowCounter
+from backend.core.services.sqlite_pool import get_connection_manager
+
+
+# How often the background sweeper moves facts past their ttl_days to status 'expired'.
+FACT_EXPIRY_SWEEP_INTERVAL_SECONDS = float(os.getenv("COMPANION_FACT_EXPIRY_SWEEP_SECONDS", "3600"))
+FACT_EXPIRY_SWEEP_BATCH = int(os.getenv("COMPANION_FACT_EXPIRY_SWEEP_BATCH", "200"))
+
+# max_unsolicited_per_hour of the relationship profile is counted over this window.
+UNSOLICITED_WINDOW_SECONDS = 3600
+# Proposal statuses that count against the unsolicited limit (a dismissed proposal frees its slot).
+UNSOLICITED_COUNTED_STATUSES = ("open", "accepted")
+
+# Largest page list_facts returns; also the size of the cached active-fact set.
+MAX_FACTS_PAGE = 200
+
+_FTS_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def build_fts_query(query: str) -> str:
+    """User text -> FTS5 MATCH expression: quoted prefix terms joined by OR (bm25 ranks the rest)."""
+    tokens = _FTS_TOKEN_RE.findall((query or "").lower())
+    return " OR ".join(f'"{token}"*' for token in dict.fromkeys(tokens))
 
 
 @dataclass
@@ -36,6 +64,8 @@ class RelationshipFact:
     ttl_days: Optional[int]
     created_at: float
     updated_at: float
+    # created_at + ttl_days; past it the fact is no longer served and the sweeper marks it expired.
+    expires_at: Optional[float] = None
 
 
 @dataclass
@@ -66,15 +96,52 @@ class CompanionMemory:
         logs_dir = Path(__file__).resolve().parents[1] / "logs"
         logs_dir.mkdir(parents=True, exist_ok=True)
         self.db_path = logs_dir / "companion.db"
+        # Read-through cache of profiles and active-fact sets: key -> (stamp, value), see _cache_stamp.
+        self._cache: dict[tuple[str, str], tuple[tuple, object]] = {}
+        self._cache_lock = threading.Lock()
+        self._local_version = 0
+        self._cache_stats = {"hits": 0, "misses": 0}
+        self._unsolicited = SlidingWindowCounter(UNSOLICITED_WINDOW_SECONDS)
         self._init_db()
         self._ensure_default_profile()
 
     def _db(self):
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        return conn
+        """Write transaction on the shared long-lived WAL connection of this database."""
+        return get_connection_manager(self.db_path).write()
+
+    def _read_db(self):
+        return get_connection_manager(self.db_path).read()
+
+    def _cache_stamp(self) -> tuple:
+        """Own writes bump _local_version; the reader's data_version catches every other commit.
+
+        Read on the reader connection, so a cache hit never waits for the shared writer lock.
+        """
+        return self._local_version, *get_connection_manager(self.db_path).data_version()
+
+    def _invalidate_cache(self):
+        with self._cache_lock:
+            self._local_version += 1
+            self._cache.clear()
+
+    def _cached(self, key: tuple[str, str], loader):
+        # Stamp taken before loading: a write racing with the load makes the entry stale, never wrong.
+        stamp = self._cache_stamp()
+        entry = self._cache.get(key)
+        if entry is not None and entry[0] == stamp:
+            self._cache_stats["hits"] += 1
+            return entry[1]
+        self._cache_stats["misses"] += 1
+        value = loader()
+        with self._cache_lock:
+            self._cache[key] = (stamp, value)
+        return value
+
+    def get_stats(self) -> dict:
+        return {**self._cache_stats, "cached_keys": len(self._cache)}
 
     def _init_db(self):
+        self._invalidate_cache()
         with self._db() as conn:
             conn.execute(
                 """
@@ -106,10 +173,18 @@ class CompanionMemory:
                   ttl_days INTEGER,
                   created_at REAL NOT NULL,
                   updated_at REAL NOT NULL,
+                  expires_at REAL,
                   FOREIGN KEY(user_id) REFERENCES relationship_profiles(user_id)
                 )
                 """
             )
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(relationship_facts)")}
+            if "expires_at" not in columns:
+                # Databases created before TTL enforcement: add the column and derive it from ttl_days.
+                conn.execute("ALTER TABLE relationship_facts ADD COLUMN expires_at REAL")
+                conn.execute(
+                    "UPDATE relationship_facts SET expires_at = created_at + ttl_days * 86400.0 WHERE ttl_days IS NOT NULL"
+                )
             conn.execute(
                 """
                 CREATE TABLE IF NOT EXISTS relationship_fact_events (
@@ -158,6 +233,12 @@ class CompanionMemory:
                 ON relationship_facts(user_id, status)
                 """
             )
+            conn.execute(
+                """
+                CREATE INDEX IF NOT EXISTS idx_relationship_facts_expiry
+                ON relationship_facts(status, expires_at) WHERE expires_at IS NOT NULL
+                """
+            )
             conn.execute(
                 """
                 CREATE INDEX IF NOT EXISTS idx_relationship_fact_events_fact
@@ -170,6 +251,66 @@ class CompanionMemory:
                 ON initiative_proposals(user_id, status, created_at)
                 """
             )
+        # False when this SQLite build has no FTS5; fact search then falls back to LIKE.
+        self.fts_enabled = self._init_fts()
+        self._seed_unsolicited_limiter()
+
+    def _seed_unsolicited_limiter(self):
+        since = time.time() - UNSOLICITED_WINDOW_SECONDS
+        with self._read_db() as conn:
+            rows = conn.execute(
+                """
+                SELECT user_id, proposal_id, created_at
+                FROM initiative_proposals
+                WHERE unsolicited=1 AND created_at>=? AND status IN (?, ?)
+                """,
+                (since, *UNSOLICITED_COUNTED_STATUSES),
+            ).fetchall()
+        self._unsolicited.seed((row["user_id"], row["proposal_id"], float(row["created_at"])) for row in rows)
+
+    def _init_fts(self) -> bool:
+        """FTS5 index over relationship_facts.fact, kept in sync by triggers; backfilled on first run."""
+        with self._db() as conn:
+            exists = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type='table' AND name='relationship_facts_fts'"
+            ).fetchone()
+            try:
+                # Own copy of the text keyed by fact_id (not rowid: VACUUM may renumber rowids of this table).
+                conn.execute(
+                    """
+                    CREATE VIRTUAL TABLE IF NOT EXISTS relationship_facts_fts USING fts5(
+                      fact, fact_id UNINDEXED, tokenize='unicode61 remove_diacritics 2'
+                    )
+                    """
+                )
+            except sqlite3.OperationalError:
+                return False
+            conn.execute(
+                """
+                CREATE TRIGGER IF NOT EXISTS relationship_facts_fts_ai AFTER INSERT ON relationship_facts BEGIN
+                  INSERT INTO relationship_facts_fts (fact, fact_id) VALUES (new.fact, new.fact_id);
+                END
+                """
+            )
+            conn.execute(
+                """
+                CREATE TRIGGER IF NOT EXISTS relationship_facts_fts_ad AFTER DELETE ON relationship_facts BEGIN
+                  DELETE FROM relationship_facts_fts WHERE fact_id = old.fact_id;
+                END
+                """
+            )
+            conn.execute(
+                """
+                CREATE TRIGGER IF NOT EXISTS relationship_facts_fts_au AFTER UPDATE OF fact ON relationship_facts BEGIN
+                  DELETE FROM relationship_facts_fts WHERE fact_id = old.fact_id;
+                  INSERT INTO relationship_facts_fts (fact, fact_id) VALUES (new.fact, new.fact_id);
+                END
+                """
+            )
+            if not exists:
+                # Migration for databases created before the index existed.
+                conn.execute("INSERT INTO relationship_facts_fts (fact, fact_id) SELECT fact, fact_id FROM relationship_facts")
+        return True
 
     def _ensure_default_profile(self):
         now = time.time()
@@ -200,9 +341,13 @@ class CompanionMemory:
                     1,
                 ),
             )
+        self._invalidate_cache()
 
     def get_profile(self, user_id: str = "local_user") -> RelationshipProfile:
-        with self._db() as conn:
+        return self._cached(("profile", user_id), lambda: self._load_profile(user_id))
+
+    def _load_profile(self, user_id: str) -> RelationshipProfile:
+        with self._read_db() as conn:
             row = conn.execute("SELECT * FROM relationship_profiles WHERE user_id=?", (user_id,)).fetchone()
             if not row:
                 raise ValueError("profile not found")
@@ -261,6 +406,7 @@ class CompanionMemory:
                     user_id,
                 ),
             )
+        self._invalidate_cache()
 
         return self.get_profile(user_id)
 
@@ -276,15 +422,17 @@ class CompanionMemory:
         now = time.time()
         fact_id = f"rf_{uuid.uuid4().hex[:12]}"
         confidence = max(0.0, min(1.0, float(confidence)))
+        # Same rule as the backfill in _init_db: only NULL means "never expires", 0 expires at once.
+        expires_at = now + int(ttl_days) * 86400.0 if ttl_days is not None else None
         with self._db() as conn:
             conn.execute(
                 """
                 INSERT INTO relationship_facts (
                   fact_id, user_id, fact, confidence, source_type, source_ref_id,
-                  status, ttl_days, created_at, updated_at
-                ) VALUES (?, ?, ?, ?, ?, ?, 'active', ?, ?, ?)
+                  status, ttl_days, created_at, updated_at, expires_at
+                ) VALUES (?, ?, ?, ?, ?, ?, 'active', ?, ?, ?, ?)
                 """,
-                (fact_id, user_id, fact, confidence, source_type, source_ref_id, ttl_days, now, now),
+                (fact_id, user_id, fact, confidence, source_type, source_ref_id, ttl_days, now, now, expires_at),
             )
             conn.execute(
                 """
@@ -293,66 +441,81 @@ class CompanionMemory:
                 """,
                 (fact_id, json.dumps({"fact": fact, "confidence": confidence}, ensure_ascii=False), now),
             )
+        self._invalidate_cache()
         return self.get_fact(fact_id)
 
     def get_fact(self, fact_id: str) -> RelationshipFact:
-        with self._db() as conn:
+        with self._read_db() as conn:
             row = conn.execute("SELECT * FROM relationship_facts WHERE fact_id=?", (fact_id,)).fetchone()
             if not row:
                 raise ValueError("fact not found")
-            return RelationshipFact(
-                fact_id=row["fact_id"],
-                user_id=row["user_id"],
-                fact=row["fact"],
-                confidence=float(row["confidence"]),
-                source_type=row["source_type"],
-                source_ref_id=row["source_ref_id"],
-                status=row["status"],
-                ttl_days=row["ttl_days"],
-                created_at=float(row["created_at"]),
-                updated_at=float(row["updated_at"]),
-            )
+            return self._row_to_fact(row)
 
     def list_facts(self, query: str = "", limit: int = 20, user_id: str = "local_user") -> list[RelationshipFact]:
         q = (query or "").strip()
-        limit = max(1, min(int(limit), 200))
-        with self._db() as conn:
-            if q:
+        limit = max(1, min(int(limit), MAX_FACTS_PAGE))
+        if not q:
+            # Listed on every chat turn: the active set comes from the cache, newest first.
+            # Facts may expire while cached, so the TTL is checked again on the way out.
+            now = time.time()
+            active = self._cached(("facts", user_id), lambda: self._load_active_facts(user_id))
+            return [f for f in active if f.expires_at is None or f.expires_at > now][:limit]
+        match = build_fts_query(q) if self.fts_enabled else ""
+        now = time.time()
+        with self._read_db() as conn:
+            if match:
                 rows = conn.execute(
                     """
-                    SELECT * FROM relationship_facts
-                    WHERE user_id=? AND status='active' AND fact LIKE ?
-                    ORDER BY updated_at DESC
+                    SELECT f.* FROM relationship_facts_fts
+                    JOIN relationship_facts AS f ON f.fact_id = relationship_facts_fts.fact_id
+                    WHERE relationship_facts_fts MATCH ? AND f.user_id=? AND f.status='active'
+                      AND (f.expires_at IS NULL OR f.expires_at > ?)
+                    ORDER BY bm25(relationship_facts_fts), f.updated_at DESC
                     LIMIT ?
                     """,
-                    (user_id, f"%{q}%", limit),
+                    (match, user_id, now, limit),
                 ).fetchall()
             else:
                 rows = conn.execute(
                     """
                     SELECT * FROM relationship_facts
-                    WHERE user_id=? AND status='active'
+                    WHERE user_id=? AND status='active' AND fact LIKE ?
+                      AND (expires_at IS NULL OR expires_at > ?)
                     ORDER BY updated_at DESC
                     LIMIT ?
                     """,
-                    (user_id, limit),
+                    (user_id, f"%{q}%", now, limit),
                 ).fetchall()
+        return [self._row_to_fact(row) for row in rows]
 
-        return [
-            RelationshipFact(
-                fact_id=row["fact_id"],
-                user_id=row["user_id"],
-                fact=row["fact"],
-                confidence=float(row["confidence"]),
-                source_type=row["source_type"],
-                source_ref_id=row["source_ref_id"],
-                status=row["status"],
-                ttl_days=row["ttl_days"],
-                created_at=float(row["created_at"]),
-                updated_at=float(row["updated_at"]),
-            )
-            for row in rows
-        ]
+    def _load_active_facts(self, user_id: str) -> list[RelationshipFact]:
+        with self._read_db() as conn:
+            rows = conn.execute(
+                """
+                SELECT * FROM relationship_facts
+                WHERE user_id=? AND status='active' AND (expires_at IS NULL OR expires_at > ?)
+                ORDER BY updated_at DESC
+                LIMIT ?
+                """,
+                (user_id, time.time(), MAX_FACTS_PAGE),
+            ).fetchall()
+        return [self._row_to_fact(row) for row in rows]
+
+    @staticmethod
+    def _row_to_fact(row) -> RelationshipFact:
+        return RelationshipFact(
+            fact_id=row["fact_id"],
+            user_id=row["user_id"],
+            fact=row["fact"],
+            confidence=float(row["confidence"]),
+            source_type=row["source_type"],
+            source_ref_id=row["source_ref_id"],
+            status=row["status"],
+            ttl_days=row["ttl_days"],
+            created_at=float(row["created_at"]),
+            updated_at=float(row["updated_at"]),
+            expires_at=row["expires_at"],
+        )
 
     def invalidate_fact(self, fact_id: str) -> RelationshipFact:
         now = time.time()
@@ -371,20 +534,68 @@ class CompanionMemory:
                 """,
                 (fact_id, json.dumps({"reason": "manual"}, ensure_ascii=False), now),
             )
+        self._invalidate_cache()
         return self.get_fact(fact_id)
 
-    def _recent_unsolicited_count(self, user_id: str = "local_user", window_s: int = 3600) -> int:
-        since = time.time() - window_s
-        with self._db() as conn:
-            row = conn.execute(
-                """
-                SELECT COUNT(*) AS c
-                FROM initiative_proposals
-                WHERE user_id=? AND unsolicited=1 AND created_at>=? AND status IN ('open','accepted')
-                """,
-                (user_id, since),
-            ).fetchone()
-            return int(row["c"]) if row else 0
+    def expire_facts(self, now: Optional[float] = None, batch_size: int = FACT_EXPIRY_SWEEP_BATCH) -> int:
+        """Move active facts past expires_at to status 'expired', in batches; returns how many."""
+        now = time.time() if now is None else float(now)
+        batch_size = max(1, int(batch_size))
+        total = 0
+        while True:
+            # One short write transaction per batch, so chat turns never wait behind a long sweep.
+            with self._db() as conn:
+                rows = conn.execute(
+                    """
+                    SELECT fact_id, expires_at FROM relationship_facts
+                    WHERE status='active' AND expires_at IS NOT NULL AND expires_at <= ?
+                    LIMIT ?
+                    """,
+                    (now, batch_size),
+                ).fetchall()
+                conn.executemany(
+                    "UPDATE relationship_facts SET status='expired', updated_at=? WHERE fact_id=?",
+                    [(now, row["fact_id"]) for row in rows],
+                )
+                conn.executemany(
+                    """
+                    INSERT INTO relationship_fact_events (fact_id, event_kind, payload_json, ts)
+                    VALUES (?, 'expired', ?, ?)
+                    """,
+                    [
+                        (row["fact_id"], json.dumps({"reason": "ttl", "expires_at": row["expires_at"]}), now)
+                        for row in rows
+                    ],
+                )
+            total += len(rows)
+            if len(rows) < batch_size:
+                break
+        if total:
+            self._invalidate_cache()
+        return total
+
+    async def expiry_loop(
+        self,
+        stop_event: asyncio.Event,
+        interval_s: float = FACT_EXPIRY_SWEEP_INTERVAL_SECONDS,
+        on_expired: Optional[Callable[[int], None]] = None,
+    ):
+        """Background TTL sweeper, run by the app lifespan."""
+        while not stop_event.is_set():
+            try:
+                expired = await asyncio.to_thread(self.expire_facts)
+            except sqlite3.Error:
+                expired = 0
+            if expired and on_expired is not None:
+                on_expired(expired)
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=interval_s)
+            except asyncio.TimeoutError:
+                continue
+
+    def _recent_unsolicited_count(self, user_id: str = "local_user") -> int:
+        """Open/accepted unsolicited proposals of the last hour, from the in-memory window (no SQL)."""
+        return self._unsolicited.count(user_id)
 
     def add_proposal(
         self,
@@ -447,10 +658,12 @@ class CompanionMemory:
                     now,
                 ),
             )
+        if unsolicited:
+            self._unsolicited.add(user_id, proposal_id, now)
         return self.get_proposal(proposal_id)
 
     def get_proposal(self, proposal_id: str) -> InitiativeProposal:
-        with self._db() as conn:
+        with self._read_db() as conn:
             row = conn.execute("SELECT * FROM initiative_proposals WHERE proposal_id=?", (proposal_id,)).fetchone()
             if not row:
                 raise ValueError("proposal not found")
@@ -470,7 +683,7 @@ class CompanionMemory:
 
     def list_proposals(self, status: str = "open", limit: int = 20, user_id: str = "local_user") -> list[InitiativeProposal]:
         limit = max(1, min(int(limit), 200))
-        with self._db() as conn:
+        with self._read_db() as conn:
             if status == "all":
                 rows = conn.execute(
                     "SELECT * FROM initiative_proposals WHERE user_id=? ORDER BY updated_at DESC LIMIT ?",
@@ -509,7 +722,10 @@ class CompanionMemory:
             raise ValueError("unsupported proposal status")
         now = time.time()
         with self._db() as conn:
-            row = conn.execute("SELECT proposal_id FROM initiative_proposals WHERE proposal_id=?", (proposal_id,)).fetchone()
+            row = conn.execute(
+                "SELECT user_id, unsolicited, created_at FROM initiative_proposals WHERE proposal_id=?",
+                (proposal_id,),
+            ).fetchone()
             if not row:
                 raise ValueError("proposal not found")
             conn.execute(
@@ -523,13 +739,18 @@ class CompanionMemory:
                 """,
                 (proposal_id, f"status_{status}", json.dumps({"status": status}, ensure_ascii=False), now),
             )
+        if row["unsolicited"]:
+            if status in UNSOLICITED_COUNTED_STATUSES:
+                self._unsolicited.add(row["user_id"], proposal_id, float(row["created_at"]))
+            else:
+                self._unsolicited.remove(row["user_id"], proposal_id)
 
         return self.get_proposal(proposal_id)
 
 
     def list_proposal_events(self, proposal_id: str, limit: int = 50) -> list[InitiativeProposalEvent]:
         limit = max(1, min(int(limit), 500))
-        with self._db() as conn:
+        with self._read_db() as conn:
             row = conn.execute("SELECT proposal_id FROM initiative_proposals WHERE proposal_id=?", (proposal_id,)).fetchone()
             if not row:
                 raise ValueError("proposal not found")
@@ -32,6 +32,12 @@ class ResponseTrace:
     counter_position_used: bool
     confidence: float
     ts: float
+    # GenerationStats of the LLM call behind this answer (TTFT, tokens/sec, ...), if any.
+    generation: Optional[dict] = None
+    # Context sources of the turn: {name: {"status", "ms", "used"}}.
+    context_sources: Optional[dict] = None
+    # Wall time per chat pipeline stage (behavior, facts, memory, web, autonomy, generation, persistence, total).
+    stage_timings_ms: Optional[dict] = None
 
 
 class CompanionState:
@@ -80,6 +86,9 @@ class CompanionState:
         uncertainty_markers: Optional[list[str]] = None,
         counter_position_used: bool = False,
         confidence: float = 0.5,
+        generation: Optional[dict] = None,
+        context_sources: Optional[dict] = None,
+        stage_timings_ms: Optional[dict] = None,
     ) -> ResponseTrace:
         sess = self._session
         trace = ResponseTrace(
@@ -92,9 +101,28 @@ class CompanionState:
             counter_position_used=counter_position_used,
             confidence=max(0.0, min(1.0, float(confidence))),
             ts=time.time(),
+            generation=generation,
+            context_sources=context_sources,
+            stage_timings_ms=stage_timings_ms,
         )
         self._last_trace = trace
         self._trace_history.append(trace)
         if len(self._trace_history) > self._trace_history_limit:
             self._trace_history = self._trace_history[-self._trace_history_limit:]
         return trace
+
+    def get_stage_percentiles(self, limit: int = 200) -> dict:
+        """p50/p95/max of each pipeline stage over the last `limit` traces that recorded timings."""
+        samples: dict[str, list[float]] = {}
+        for trace in self.get_trace_history(limit=limit):
+            for stage, ms in (trace.stage_timings_ms or {}).items():
+                samples.setdefault(stage, []).append(float(ms))
+
+        def _pct(values: list[float], q: float) -> float:
+            return round(values[min(len(values) - 1, int(q * len(values)))], 2)
+
+        result = {}
+        for stage, values in sorted(samples.items()):
+            values.sort()
+            result[stage] = {"count": len(values), "p50": _pct(values, 0.5), "p95": _pct(values, 0.95), "max": round(values[-1], 2)}
+        return result
@@ -0,0 +1,257 @@
+from __future__ import annotations
+
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from pathlib import Path
+import os
+import sqlite3
+import time
+import uuid
+from typing import Optional
+
+from backend.core.services.sqlite_pool import get_connection_manager
+
+
+# Messages kept in the in-memory tail per session; the prompt only ever needs the recent end.
+CONVERSATION_TAIL_MESSAGES = int(os.getenv("CONVERSATION_TAIL_MESSAGES", "40"))
+CONVERSATION_CACHED_SESSIONS = int(os.getenv("CONVERSATION_CACHED_SESSIONS", "32"))
+
+
+@dataclass
+class ConversationSession:
+    session_id: str
+    title: str
+    message_count: int
+    created_at: float
+    updated_at: float
+
+
+@dataclass
+class ConversationMessage:
+    seq: int
+    role: str
+    content: str
+    created_at: float
+
+
+@dataclass
+class ConversationSummary:
+    session_id: str
+    summary: str
+    # Highest message seq folded into the summary; later messages are kept verbatim.
+    covered_seq: int
+    updated_at: float
+
+
+class ConversationStore:
+    """Server-held chat sessions: append-only messages in SQLite plus an in-memory tail per session."""
+
+    def __init__(
+        self,
+        db_path: Optional[Path] = None,
+        tail_size: int = CONVERSATION_TAIL_MESSAGES,
+        cached_sessions: int = CONVERSATION_CACHED_SESSIONS,
+    ):
+        if db_path is None:
+            logs_dir = Path(__file__).resolve().parents[1] / "logs"
+            logs_dir.mkdir(parents=True, exist_ok=True)
+            db_path = logs_dir / "conversations.db"
+        self.db_path = db_path
+        self.tail_size = max(1, int(tail_size))
+        self._cached_sessions = max(1, int(cached_sessions))
+        self._tails: "OrderedDict[str, deque[ConversationMessage]]" = OrderedDict()
+        self._init_db()
+
+    def _db(self):
+        """Write transaction on the shared long-lived WAL connection of this database."""
+        return get_connection_manager(self.db_path).write()
+
+    def _read_db(self):
+        return get_connection_manager(self.db_path).read()
+
+    def _init_db(self):
+        with self._db() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS conversation_sessions (
+                    session_id TEXT PRIMARY KEY,
+                    title TEXT NOT NULL,
+                    message_count INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS conversation_messages (
+                    session_id TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    role TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (session_id, seq)
+                ) WITHOUT ROWID
+                """
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS conversation_summaries (
+                    session_id TEXT PRIMARY KEY,
+                    summary TEXT NOT NULL,
+                    covered_seq INTEGER NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+
+    @staticmethod
+    def _row_to_session(row: sqlite3.Row) -> ConversationSession:
+        return ConversationSession(
+            session_id=row["session_id"],
+            title=row["title"],
+            message_count=int(row["message_count"]),
+            created_at=float(row["created_at"]),
+            updated_at=float(row["updated_at"]),
+        )
+
+    def create_session(self, title: str = "") -> ConversationSession:
+        now = time.time()
+        session = ConversationSession(
+            session_id=f"conv_{uuid.uuid4().hex[:16]}",
+            title=(title or "").strip(),
+            message_count=0,
+            created_at=now,
+            updated_at=now,
+        )
+        with self._db() as conn:
+            conn.execute(
+                "INSERT INTO conversation_sessions (session_id, title, message_count, created_at, updated_at) VALUES (?, ?, 0, ?, ?)",
+                (session.session_id, session.title, now, now),
+            )
+        self._remember_tail(session.session_id, deque(maxlen=self.tail_size))
+        return session
+
+    def get_session(self, session_id: str) -> Optional[ConversationSession]:
+        with self._read_db() as conn:
+            row = conn.execute("SELECT * FROM conversation_sessions WHERE session_id=?", (session_id,)).fetchone()
+        return self._row_to_session(row) if row else None
+
+    def list_sessions(self, limit: int = 50) -> list[ConversationSession]:
+        with self._read_db() as conn:
+            rows = conn.execute(
+                "SELECT * FROM conversation_sessions ORDER BY updated_at DESC LIMIT ?",
+                (max(1, min(500, int(limit))),),
+            ).fetchall()
+        return [self._row_to_session(row) for row in rows]
+
+    def delete_session(self, session_id: str) -> bool:
+        with self._db() as conn:
+            conn.execute("DELETE FROM conversation_messages WHERE session_id=?", (session_id,))
+            conn.execute("DELETE FROM conversation_summaries WHERE session_id=?", (session_id,))
+            cur = conn.execute("DELETE FROM conversation_sessions WHERE session_id=?", (session_id,))
+        self._tails.pop(session_id, None)
+        return cur.rowcount > 0
+
+    def append_messages(self, session_id: str, messages: list[tuple[str, str]]) -> list[ConversationMessage]:
+        """Append (role, content) pairs to the session; returns the stored messages."""
+        now = time.time()
+        with self._db() as conn:
+            # The single writer serializes this read-then-insert, so concurrent turns cannot collide on seq.
+            row = conn.execute(
+                "SELECT message_count FROM conversation_sessions WHERE session_id=?",
+                (session_id,),
+            ).fetchone()
+            if row is None:
+                raise KeyError(session_id)
+            start = int(row["message_count"])
+            stored = [
+                ConversationMessage(seq=start + i, role=role, content=content, created_at=now)
+                for i, (role, content) in enumerate(messages)
+            ]
+            conn.executemany(
+                "INSERT INTO conversation_messages (session_id, seq, role, content, created_at) VALUES (?, ?, ?, ?, ?)",
+                [(session_id, m.seq, m.role, m.content, m.created_at) for m in stored],
+            )
+            conn.execute(
+                "UPDATE conversation_sessions SET message_count=?, updated_at=? WHERE session_id=?",
+                (start + len(stored), now, session_id),
+            )
+
+        tail = self._tails.get(session_id)
+        if tail is not None:
+            tail.extend(stored)
+            self._tails.move_to_end(session_id)
+        return stored
+
+    def get_messages(self, session_id: str, limit: Optional[int] = None) -> list[ConversationMessage]:
+        """Most recent `limit` messages in chronological order (tail cache first, then SQLite)."""
+        limit = self.tail_size if limit is None else max(1, int(limit))
+        tail = self._tails.get(session_id)
+        if tail is not None and limit <= self.tail_size:
+            self._tails.move_to_end(session_id)
+            return list(tail)[-limit:]
+
+        with self._read_db() as conn:
+            rows = conn.execute(
+                "SELECT seq, role, content, created_at FROM conversation_messages WHERE session_id=? ORDER BY seq DESC LIMIT ?",
+                (session_id, max(limit, self.tail_size)),
+            ).fetchall()
+        messages = [
+            ConversationMessage(seq=int(r["seq"]), role=r["role"], content=r["content"], created_at=float(r["created_at"]))
+            for r in reversed(rows)
+        ]
+        self._remember_tail(session_id, deque(messages[-self.tail_size:], maxlen=self.tail_size))
+        return messages[-limit:]
+
+    def get_messages_between(self, session_id: str, after_seq: int, before_seq: int) -> list[ConversationMessage]:
+        """Messages with after_seq < seq < before_seq, oldest first (always from SQLite)."""
+        with self._read_db() as conn:
+            rows = conn.execute(
+                "SELECT seq, role, content, created_at FROM conversation_messages "
+                "WHERE session_id=? AND seq>? AND seq<? ORDER BY seq",
+                (session_id, int(after_seq), int(before_seq)),
+            ).fetchall()
+        return [
+            ConversationMessage(seq=int(r["seq"]), role=r["role"], content=r["content"], created_at=float(r["created_at"]))
+            for r in rows
+        ]
+
+    def get_summary(self, session_id: str) -> Optional[ConversationSummary]:
+        with self._read_db() as conn:
+            row = conn.execute("SELECT * FROM conversation_summaries WHERE session_id=?", (session_id,)).fetchone()
+        if row is None:
+            return None
+        return ConversationSummary(
+            session_id=row["session_id"],
+            summary=row["summary"],
+            covered_seq=int(row["covered_seq"]),
+            updated_at=float(row["updated_at"]),
+        )
+
+    def save_summary(self, session_id: str, summary: str, covered_seq: int) -> ConversationSummary:
+        now = time.time()
+        with self._db() as conn:
+            # Never move the covered boundary backwards (a slower, older run must not win).
+            conn.execute(
+                """
+                INSERT INTO conversation_summaries (session_id, summary, covered_seq, updated_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(session_id) DO UPDATE SET
+                    summary=excluded.summary,
+                    covered_seq=excluded.covered_seq,
+                    updated_at=excluded.updated_at
+                WHERE excluded.covered_seq > conversation_summaries.covered_seq
+                """,
+                (session_id, summary, int(covered_seq), now),
+            )
+        return self.get_summary(session_id)
+
+    def _remember_tail(self, session_id: str, tail: "deque[ConversationMessage]"):
+        self._tails[session_id] = tail
+        self._tails.move_to_end(session_id)
+        while len(self._tails) > self._cached_sessions:
+            self._tails.popitem(last=False)
+
+    def get_stats(self) -> dict:
+        return {"cached_sessions": len(self._tails), "tail_size": self.tail_size}
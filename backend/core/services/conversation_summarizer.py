@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from typing import Optional
+
+from backend.core.services.conversation_store import ConversationStore, ConversationSummary
+from backend.core.services.llm_scheduler import LLMPriority, LLMScheduler
+from backend.core.services.metrics import llm_caller
+from backend.core.services.token_counter import estimate_tokens
+
+
+# Unsummarized history above this many (estimated) tokens gets folded into the running summary.
+SUMMARY_THRESHOLD_TOKENS = int(os.getenv("CONVERSATION_SUMMARY_THRESHOLD_TOKENS", "1500"))
+# Most recent messages that always stay verbatim in the prompt.
+SUMMARY_KEEP_MESSAGES = int(os.getenv("CONVERSATION_SUMMARY_KEEP_MESSAGES", "10"))
+# Fold at least this many messages at once, so the summary is not regenerated every turn.
+SUMMARY_MIN_NEW_MESSAGES = int(os.getenv("CONVERSATION_SUMMARY_MIN_NEW_MESSAGES", "4"))
+SUMMARY_MAX_TOKENS = int(os.getenv("CONVERSATION_SUMMARY_MAX_TOKENS", "320"))
+
+SUMMARY_PROMPT = (
+    "Ты ведёшь краткое содержание длинного разговора. "
+    "Обнови текущее содержание с учётом новых реплик: сохрани факты о пользователе, договорённости, "
+    "решения, открытые вопросы и важные числа/имена. Пиши сжато, списком, на русском. "
+    "Верни только обновлённое содержание."
+)
+
+
+def build_summary_message_text(summary: str) -> str:
+    return f"Краткое содержание предыдущей части разговора:\n{summary}"
+
+
+class ConversationSummarizer:
+    """Incremental rolling summary per conversation session.
+
+    Messages that fall out of the verbatim window are folded into the stored summary by a
+    background LLM call at BACKGROUND priority; only the newly dropped turns are sent together
+    with the previous summary, never the whole conversation.
+    """
+
+    def __init__(
+        self,
+        store: ConversationStore,
+        kobold,
+        scheduler: Optional[LLMScheduler] = None,
+        threshold_tokens: int = SUMMARY_THRESHOLD_TOKENS,
+        keep_messages: int = SUMMARY_KEEP_MESSAGES,
+        min_new_messages: int = SUMMARY_MIN_NEW_MESSAGES,
+        max_history_messages: int = 14,
+    ):
+        self.store = store
+        self.kobold = kobold
+        self.scheduler = scheduler
+        self.threshold_tokens = int(threshold_tokens)
+        self.keep_messages = max(1, int(keep_messages))
+        self.min_new_messages = max(1, int(min_new_messages))
+        # The chat prompt keeps at most this many history messages; anything older is lost unless folded.
+        self.max_history_messages = int(max_history_messages)
+        self._inflight: dict[str, asyncio.Task] = {}
+        self._stats = {"scheduled": 0, "summaries": 0, "skipped_below_threshold": 0, "failures": 0, "last_ms": None}
+
+    def _pending_range(self, session_id: str) -> Optional[tuple[int, int]]:
+        session = self.store.get_session(session_id)
+        if session is None:
+            return None
+        summary = self.store.get_summary(session_id)
+        covered = summary.covered_seq if summary else -1
+        window_start = session.message_count - self.keep_messages
+        if window_start - (covered + 1) < self.min_new_messages:
+            return None
+        return covered, window_start
+
+    def maybe_schedule(self, session_id: str) -> bool:
+        """Start a background fold for the session if enough turns left the window."""
+        task = self._inflight.get(session_id)
+        if task is not None and not task.done():
+            return False
+        if self._pending_range(session_id) is None:
+            return False
+        self._stats["scheduled"] += 1
+        task = asyncio.create_task(self.summarize(session_id))
+        self._inflight[session_id] = task
+        task.add_done_callback(lambda _t, sid=session_id: self._inflight.pop(sid, None))
+        return True
+
+    async def summarize(self, session_id: str) -> Optional[ConversationSummary]:
+        pending = self._pending_range(session_id)
+        if pending is None:
+            return None
+        covered, window_start = pending
+        previous = self.store.get_summary(session_id)
+        dropped = self.store.get_messages_between(session_id, covered, window_start)
+        if not dropped:
+            return None
+
+        # Short conversations that still fit verbatim are left alone.
+        unsummarized = self.store.get_messages_between(session_id, covered, window_start + self.keep_messages)
+        unsummarized_tokens = sum(estimate_tokens(m.content) for m in unsummarized)
+        if unsummarized_tokens < self.threshold_tokens and len(unsummarized) <= self.max_history_messages:
+            self._stats["skipped_below_threshold"] += 1
+            return None
+
+        transcript = "\n".join(f"{m.role}: {m.content}" for m in dropped)
+        messages = [
+            {"role": "system", "content": SUMMARY_PROMPT},
+            {
+                "role": "user",
+                "content": (
+                    f"Текущее содержание:\n{previous.summary if previous else '(пусто)'}\n\n"
+                    f"Новые реплики:\n{transcript}"
+                ),
+            },
+        ]
+
+        started = time.perf_counter()
+        try:
+            with llm_caller("summarizer"):
+                if self.scheduler is None:
+                    text = await self.kobold.generate(messages, max_tokens=SUMMARY_MAX_TOKENS, temperature=0.2)
+                else:
+                    text = await self.scheduler.run(
+                        lambda: self.kobold.generate(messages, max_tokens=SUMMARY_MAX_TOKENS, temperature=0.2),
+                        priority=LLMPriority.BACKGROUND,
+                        on_cancel=self.kobold.abort,
+                    )
+        except Exception:
+            self._stats["failures"] += 1
+            return None
+        finally:
+            self._stats["last_ms"] = round((time.perf_counter() - started) * 1000.0, 2)
+
+        text = (text or "").strip()
+        if not text:
+            self._stats["failures"] += 1
+            return None
+        self._stats["summaries"] += 1
+        return self.store.save_summary(session_id, text, covered_seq=dropped[-1].seq)
+
+    async def close(self):
+        tasks = [t for t in self._inflight.values() if not t.done()]
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    def get_stats(self) -> dict:
+        return {
+            **self._stats,
+            "inflight": sum(1 for t in self._inflight.values() if not t.done()),
+            "threshold_tokens": self.threshold_tokens,
+            "keep_messages": self.keep_messages,
+        }
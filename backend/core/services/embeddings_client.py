@@ -1,37 +1,258 @@
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+import asyncio
+import os
+import time
+
 import httpx
-from typing import List
+
+
+EMBEDDINGS_URL = os.getenv("EMBEDDINGS_URL", "http://localhost:8001")
+# Both services run on the same device; a Unix socket skips the TCP loopback stack entirely.
+EMBEDDINGS_UDS_PATH = os.getenv("EMBEDDINGS_UDS_PATH", "").strip() or None
+EMBEDDINGS_TIMEOUT_SECONDS = float(os.getenv("EMBEDDINGS_TIMEOUT_SECONDS", "30"))
+EMBEDDINGS_BATCH_SIZE = int(os.getenv("EMBEDDINGS_BATCH_SIZE", "32"))
+EMBEDDINGS_QUERY_CACHE_SIZE = int(os.getenv("EMBEDDINGS_QUERY_CACHE_SIZE", "256"))
+EMBEDDINGS_MAX_RETRIES = int(os.getenv("EMBEDDINGS_MAX_RETRIES", "2"))
+EMBEDDINGS_BREAKER_THRESHOLD = int(os.getenv("EMBEDDINGS_BREAKER_THRESHOLD", "3"))
+EMBEDDINGS_BREAKER_RESET_SECONDS = float(os.getenv("EMBEDDINGS_BREAKER_RESET_SECONDS", "15"))
+
+
+class EmbeddingsServiceError(Exception):
+    """Embeddings service request failed."""
+
+
+class EmbeddingsCircuitOpenError(EmbeddingsServiceError):
+    """Circuit breaker is open: the service recently failed and calls fail fast."""
+
+
+@dataclass(frozen=True)
+class BreakerPermit:
+    """Admission from CircuitBreaker.allow; `probe` marks the single half-open trial call."""
+
+    probe: bool = False
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker: closed -> open -> half_open (single probe) -> closed.
+
+    In half_open exactly one call is let through as a probe; others fail fast until it reports.
+    Only the probe's outcome decides half_open: stragglers admitted while the breaker was still
+    closed neither free the probe slot nor close or reopen the breaker.
+    """
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout_s: float = 15.0):
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.reset_timeout_s = max(0.0, float(reset_timeout_s))
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.probe_in_flight = False
+        self.open_total = 0
+        self.rejected_total = 0
+
+    def allow(self) -> Optional[BreakerPermit]:
+        """A permit for one call, or None if the call must fail fast."""
+        if self.state == "open" and self.opened_at is not None:
+            if time.monotonic() - self.opened_at >= self.reset_timeout_s:
+                self.state = "half_open"
+        if self.state == "closed":
+            return BreakerPermit()
+        if self.state == "half_open" and not self.probe_in_flight:
+            self.probe_in_flight = True
+            return BreakerPermit(probe=True)
+        self.rejected_total += 1
+        return None
+
+    def record_success(self, permit: BreakerPermit):
+        if self.state != "closed" and not permit.probe:
+            return
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.probe_in_flight = False
+
+    def record_failure(self, permit: BreakerPermit):
+        if self.state != "closed" and not permit.probe:
+            return
+        self.consecutive_failures += 1
+        self.probe_in_flight = False
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            if self.state != "open":
+                self.open_total += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def release(self, permit: BreakerPermit):
+        """Probe ended without a verdict (e.g. cancelled): let the next call probe instead."""
+        if permit.probe:
+            self.probe_in_flight = False
+
 
 class EmbeddingsClient:
     """Клиент для сервиса эмбеддингов"""
-    
-    def __init__(self, base_url: str = "http://localhost:8001"):
-        self.base_url = base_url
-        self.client = httpx.AsyncClient(timeout=30.0)
-    
-    async def embed(self, texts: List[str]) -> List[List[float]]:
-        """Получить эмбеддинги для текстов"""
-        
-        try:
-            response = await self.client.post(
-                f"{self.base_url}/embed",
-                json={"texts": texts}
+
+    def __init__(
+        self,
+        base_url: str = EMBEDDINGS_URL,
+        uds_path: Optional[str] = EMBEDDINGS_UDS_PATH,
+        timeout: float = EMBEDDINGS_TIMEOUT_SECONDS,
+        batch_size: int = EMBEDDINGS_BATCH_SIZE,
+        query_cache_size: int = EMBEDDINGS_QUERY_CACHE_SIZE,
+        max_retries: int = EMBEDDINGS_MAX_RETRIES,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.uds_path = uds_path
+        self.batch_size = max(1, int(batch_size))
+        self.max_retries = max(0, int(max_retries))
+        if transport is None:
+            # No transport-level retries: _post_embed is the single retry layer.
+            transport = httpx.AsyncHTTPTransport(
+                uds=uds_path,
+                limits=httpx.Limits(max_connections=4, max_keepalive_connections=4, keepalive_expiry=120.0),
             )
-            response.raise_for_status()
-            
-            result = response.json()
-            return result["embeddings"]
-            
-        except httpx.HTTPError as e:
-            raise Exception(f"Embeddings service error: {str(e)}")
-    
+        self.client = httpx.AsyncClient(
+            transport=transport,
+            timeout=httpx.Timeout(timeout, connect=min(timeout, 2.0)),
+        )
+        self.breaker = CircuitBreaker(EMBEDDINGS_BREAKER_THRESHOLD, EMBEDDINGS_BREAKER_RESET_SECONDS)
+
+        self._query_cache: "OrderedDict[tuple, List[float]]" = OrderedDict()
+        self._query_cache_size = max(0, int(query_cache_size))
+        self._latencies_ms: deque = deque(maxlen=200)
+        self._counters: Dict[str, int] = {
+            "requests": 0,
+            "failures": 0,
+            "texts_requested": 0,
+            "texts_sent": 0,
+            "dedupe_saved": 0,
+            "query_cache_hits": 0,
+            "query_cache_misses": 0,
+        }
+
+    async def embed(
+        self,
+        texts: List[str],
+        dimensions: Optional[int] = None,
+        precision: Optional[str] = None,
+    ) -> List[List[float]]:
+        """Получить эмбеддинги для текстов (dedupe + split into batches)."""
+
+        self._counters["texts_requested"] += len(texts)
+        unique: List[str] = list(dict.fromkeys(texts))
+        self._counters["dedupe_saved"] += len(texts) - len(unique)
+
+        by_text: Dict[str, List[float]] = {}
+        for start in range(0, len(unique), self.batch_size):
+            chunk = unique[start:start + self.batch_size]
+            vectors = await self._post_embed(chunk, dimensions, precision)
+            by_text.update(zip(chunk, vectors))
+
+        return [by_text[text] for text in texts]
+
+    async def embed_query(
+        self,
+        text: str,
+        dimensions: Optional[int] = None,
+        precision: Optional[str] = None,
+    ) -> List[float]:
+        """Single query embedding served from a small LRU of recent queries."""
+
+        key = (text, dimensions, precision)
+        cached = self._query_cache.get(key)
+        if cached is not None:
+            self._query_cache.move_to_end(key)
+            self._counters["query_cache_hits"] += 1
+            return cached
+
+        self._counters["query_cache_misses"] += 1
+        vector = (await self.embed([text], dimensions=dimensions, precision=precision))[0]
+        if self._query_cache_size:
+            self._query_cache[key] = vector
+            while len(self._query_cache) > self._query_cache_size:
+                self._query_cache.popitem(last=False)
+        return vector
+
+    async def _post_embed(
+        self,
+        texts: List[str],
+        dimensions: Optional[int],
+        precision: Optional[str],
+    ) -> List[List[float]]:
+        permit = self.breaker.allow()
+        if permit is None:
+            raise EmbeddingsCircuitOpenError("Embeddings service error: circuit open, service marked unavailable")
+
+        payload: dict = {"texts": texts}
+        if dimensions is not None:
+            payload["dimensions"] = dimensions
+        if precision is not None:
+            payload["precision"] = precision
+
+        self._counters["requests"] += 1
+        self._counters["texts_sent"] += len(texts)
+        started = time.perf_counter()
+        last_error: Optional[Exception] = None
+        try:
+            # The only retry layer: connect errors, timeouts and 5xx answers are retried here.
+            for attempt in range(self.max_retries + 1):
+                try:
+                    response = await self.client.post(f"{self.base_url}/embed", json=payload)
+                    response.raise_for_status()
+                    result = response.json()
+                    self._latencies_ms.append((time.perf_counter() - started) * 1000.0)
+                    self.breaker.record_success(permit)
+                    return result["embeddings"]
+                except httpx.HTTPStatusError as e:
+                    if e.response.status_code < 500:
+                        # The service answered: a bad request is the caller's fault, not an outage.
+                        self._counters["failures"] += 1
+                        self.breaker.record_success(permit)
+                        raise EmbeddingsServiceError(f"Embeddings service error: {str(e)}") from e
+                    last_error = e
+                except (httpx.TimeoutException, httpx.TransportError) as e:
+                    last_error = e
+                if attempt < self.max_retries:
+                    await asyncio.sleep(0.05 * (2 ** attempt))
+
+            self._counters["failures"] += 1
+            self.breaker.record_failure(permit)
+            raise EmbeddingsServiceError(f"Embeddings service error: {str(last_error)}")
+        finally:
+            # Any exit without a verdict (cancellation, bad JSON) frees the half-open probe slot.
+            self.breaker.release(permit)
+
+    def get_stats(self) -> dict:
+        latencies = sorted(self._latencies_ms)
+
+        def _pct(q: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))], 2)
+
+        lookups = self._counters["query_cache_hits"] + self._counters["query_cache_misses"]
+        return {
+            **self._counters,
+            "query_cache_size": len(self._query_cache),
+            "query_cache_hit_rate": (self._counters["query_cache_hits"] / lookups) if lookups else None,
+            "latency_ms_p50": _pct(0.5),
+            "latency_ms_p95": _pct(0.95),
+            "circuit_state": self.breaker.state,
+            "circuit_open_total": self.breaker.open_total,
+            "circuit_rejected_total": self.breaker.rejected_total,
+            "transport": "uds" if self.uds_path else "tcp",
+        }
+
     async def check_health(self) -> bool:
         """Проверка доступности сервиса"""
-        
+
         try:
             response = await self.client.get(f"{self.base_url}/health")
             return response.status_code == 200
-        except:
+        except Exception:
             return False
-    
+
     async def close(self):
         await self.client.aclose()
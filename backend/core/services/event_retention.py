@@ -0,0 +1,266 @@
+from __future__ import annotations
+
+from collections import Counter, defaultdict
+from contextlib import closing
+from dataclasses import dataclass
+from pathlib import Path
+import asyncio
+import gzip
+import json
+import os
+import sqlite3
+import time
+from typing import Callable, Dict, List, Optional, Union
+
+from backend.core.services.sqlite_pool import SQLiteConnectionManager, get_connection_manager
+
+
+# Events older than this are archived and removed from SQLite (0 = no age limit).
+EVENT_RETENTION_MAX_AGE_DAYS = float(os.getenv("EVENT_RETENTION_MAX_AGE_DAYS", "90"))
+# Newest events kept per fact/proposal/task; older ones are archived (0 = no count limit).
+EVENT_RETENTION_MAX_PER_PARENT = int(os.getenv("EVENT_RETENTION_MAX_PER_PARENT", "500"))
+EVENT_RETENTION_INTERVAL_SECONDS = float(os.getenv("EVENT_RETENTION_INTERVAL_SECONDS", str(6 * 3600)))
+EVENT_RETENTION_BATCH = int(os.getenv("EVENT_RETENTION_BATCH", "1000"))
+# Free pages that trigger `PRAGMA incremental_vacuum` after a retention run.
+EVENT_RETENTION_VACUUM_FREE_PAGES = int(os.getenv("EVENT_RETENTION_VACUUM_FREE_PAGES", "256"))
+# Bound for `id IN (...)` lists; old SQLite builds allow only 999 bound parameters.
+_MAX_SQL_VARIABLES = 500
+
+
+@dataclass
+class RetentionPolicy:
+    table: str
+    parent_column: str
+    kind_column: str
+    max_age_days: float = EVENT_RETENTION_MAX_AGE_DAYS
+    max_per_parent: int = EVENT_RETENTION_MAX_PER_PARENT
+    # Called as on_pruned(cutoff_ts, max_per_parent) so in-memory copies can drop the same events.
+    on_pruned: Optional[Callable[[Optional[float], int], None]] = None
+
+
+class EventRetention:
+    """Retention for append-only event tables: archive, roll up, delete, reclaim space.
+
+    Events past the age or per-parent count limit are appended to gzip JSONL files per table and
+    month (`<db>-<table>-YYYY-MM.jsonl.gz`), counted into `event_rollups` (per day and kind) and
+    deleted, one short write transaction per batch. The archive is written before the delete
+    commits, so a crash can duplicate an archived batch but never lose it. `migrate_auto_vacuum`
+    switches databases to incremental auto-vacuum once at startup; after that, retention runs return
+    freed pages with `incremental_vacuum` (a no-op on databases that were not migrated).
+    """
+
+    def __init__(
+        self,
+        databases: Dict[Union[str, Path], List[RetentionPolicy]],
+        archive_dir: Optional[Path] = None,
+        batch_size: int = EVENT_RETENTION_BATCH,
+        vacuum_free_pages: int = EVENT_RETENTION_VACUUM_FREE_PAGES,
+    ):
+        if archive_dir is None:
+            archive_dir = Path(__file__).resolve().parents[1] / "logs" / "archive"
+        self.archive_dir = Path(archive_dir)
+        self.databases = {Path(path): list(policies) for path, policies in databases.items()}
+        self.batch_size = max(1, int(batch_size))
+        self.vacuum_free_pages = max(0, int(vacuum_free_pages))
+        self._prepared: set[str] = set()
+        self._stats = {
+            "runs": 0,
+            "errors": 0,
+            "archived": defaultdict(int),
+            "vacuumed_pages": 0,
+            "migrations": {},
+            "last_run_ms": None,
+            "last_error": None,
+        }
+
+    def _prepare(self, manager: SQLiteConnectionManager):
+        if manager.path in self._prepared:
+            return
+        with manager.write() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS event_rollups (
+                    table_name TEXT NOT NULL,
+                    day TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    count INTEGER NOT NULL,
+                    PRIMARY KEY (table_name, day, kind)
+                ) WITHOUT ROWID
+                """
+            )
+        self._prepared.add(manager.path)
+
+    def migrate_auto_vacuum(self) -> Dict[str, float]:
+        """Switch every database to incremental auto-vacuum; run once at startup, before serving.
+
+        The switch takes effect only after a full VACUUM, which rewrites the file. It runs on its
+        own short-lived connection, not under the shared writer lock, and is paid once per database
+        file; the duration per migrated database is returned and kept in `get_stats()["migrations"]`.
+        """
+        migrated: Dict[str, float] = {}
+        for path in self.databases:
+            started = time.perf_counter()
+            with closing(sqlite3.connect(path, timeout=30.0)) as conn:
+                if int(conn.execute("PRAGMA auto_vacuum").fetchone()[0]) == 2:
+                    continue
+                conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+                conn.execute("VACUUM")
+            migrated[str(path)] = round((time.perf_counter() - started) * 1000.0, 2)
+        self._stats["migrations"].update(migrated)
+        return migrated
+
+    def _archive(self, manager: SQLiteConnectionManager, table: str, rows: List[dict]):
+        by_month: Dict[str, List[dict]] = defaultdict(list)
+        for row in rows:
+            by_month[time.strftime("%Y-%m", time.gmtime(row["ts"]))].append(row)
+        self.archive_dir.mkdir(parents=True, exist_ok=True)
+        for month, items in by_month.items():
+            path = self.archive_dir / f"{Path(manager.path).stem}-{table}-{month}.jsonl.gz"
+            # Appending adds a gzip member; gzip.open reads the members back as one stream.
+            with gzip.open(path, "at", encoding="utf-8") as f:
+                for item in items:
+                    f.write(json.dumps(item, ensure_ascii=False) + "\n")
+
+    def _prune(self, manager: SQLiteConnectionManager, policy: RetentionPolicy, now: float) -> int:
+        cutoff = now - policy.max_age_days * 86400.0 if policy.max_age_days > 0 else None
+        conditions, params = [], []
+        if cutoff is not None:
+            conditions.append("ts < ?")
+            params.append(cutoff)
+        if policy.max_per_parent > 0:
+            conditions.append("rn > ?")
+            params.append(policy.max_per_parent)
+        if not conditions:
+            return 0
+
+        # The window pass runs once per run; batches then only look rows up by primary key, so a
+        # large first-run backlog costs one table scan instead of one per batch.
+        with manager.read() as conn:
+            doomed_ids = [
+                row[0]
+                for row in conn.execute(
+                    f"""
+                    SELECT id FROM (
+                        SELECT id, ts, ROW_NUMBER() OVER (PARTITION BY {policy.parent_column} ORDER BY id DESC) AS rn
+                        FROM {policy.table}
+                    )
+                    WHERE {" OR ".join(conditions)}
+                    ORDER BY id
+                    """,
+                    params,
+                )
+            ]
+
+        total = 0
+        for start in range(0, len(doomed_ids), self.batch_size):
+            batch = doomed_ids[start:start + self.batch_size]
+            with manager.write() as conn:
+                rows = []
+                for offset in range(0, len(batch), _MAX_SQL_VARIABLES):
+                    chunk = batch[offset:offset + _MAX_SQL_VARIABLES]
+                    rows += conn.execute(
+                        f"SELECT * FROM {policy.table} WHERE id IN ({','.join('?' * len(chunk))}) ORDER BY id",
+                        chunk,
+                    ).fetchall()
+                if not rows:
+                    continue
+                doomed = [dict(row) for row in rows]
+                self._archive(manager, policy.table, doomed)
+                rollup = Counter(
+                    (time.strftime("%Y-%m-%d", time.gmtime(row["ts"])), row[policy.kind_column]) for row in doomed
+                )
+                conn.executemany(
+                    """
+                    INSERT INTO event_rollups (table_name, day, kind, count) VALUES (?, ?, ?, ?)
+                    ON CONFLICT(table_name, day, kind) DO UPDATE SET count = count + excluded.count
+                    """,
+                    [(policy.table, day, kind, count) for (day, kind), count in rollup.items()],
+                )
+                conn.executemany(f"DELETE FROM {policy.table} WHERE id=?", [(row["id"],) for row in doomed])
+            total += len(doomed)
+
+        if total and policy.on_pruned is not None:
+            policy.on_pruned(cutoff, policy.max_per_parent)
+        return total
+
+    def _vacuum(self, manager: SQLiteConnectionManager) -> int:
+        with manager.write() as conn:
+            free_pages = int(conn.execute("PRAGMA freelist_count").fetchone()[0])
+            if not free_pages or free_pages < self.vacuum_free_pages:
+                return 0
+            conn.execute("PRAGMA incremental_vacuum").fetchall()
+        return free_pages
+
+    def run_once(self, now: Optional[float] = None) -> dict:
+        """One retention pass over every configured table; returns archived counts per table."""
+        now = time.time() if now is None else float(now)
+        started = time.perf_counter()
+        archived: Dict[str, int] = {}
+        for path, policies in self.databases.items():
+            manager = get_connection_manager(path)
+            self._prepare(manager)
+            for policy in policies:
+                archived[policy.table] = self._prune(manager, policy, now)
+                self._stats["archived"][policy.table] += archived[policy.table]
+            self._stats["vacuumed_pages"] += self._vacuum(manager)
+        self._stats["runs"] += 1
+        self._stats["last_run_ms"] = round((time.perf_counter() - started) * 1000.0, 2)
+        return archived
+
+    async def run_loop(self, stop_event: asyncio.Event, interval_s: float = EVENT_RETENTION_INTERVAL_SECONDS):
+        """Background retention schedule, run by the app lifespan."""
+        while not stop_event.is_set():
+            try:
+                await asyncio.to_thread(self.run_once)
+            except (sqlite3.Error, OSError) as exc:
+                self._stats["errors"] += 1
+                self._stats["last_error"] = f"{exc.__class__.__name__}: {exc}"
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=interval_s)
+            except asyncio.TimeoutError:
+                continue
+
+    def get_daily_counts(self, table: str, days: int = 30) -> list[dict]:
+        """Events per day and kind: rollups of archived events plus the rows still in the table."""
+        for path, policies in self.databases.items():
+            policy = next((p for p in policies if p.table == table), None)
+            if policy is not None:
+                break
+        else:
+            raise ValueError("unknown event table")
+        since = time.time() - max(1, int(days)) * 86400.0
+        since_day = time.strftime("%Y-%m-%d", time.gmtime(since))
+        live = f"""
+            SELECT date(ts, 'unixepoch') AS day, {policy.kind_column} AS kind, COUNT(*) AS count
+            FROM {policy.table} WHERE ts>=? GROUP BY 1, 2
+        """
+        # Read-only: before the first retention pass there is no event_rollups table yet.
+        with get_connection_manager(path).read() as conn:
+            has_rollups = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type='table' AND name='event_rollups'"
+            ).fetchone()
+            if has_rollups:
+                rows = conn.execute(
+                    f"""
+                    SELECT day, kind, SUM(count) AS count FROM (
+                        SELECT day, kind, count FROM event_rollups WHERE table_name=? AND day>=?
+                        UNION ALL
+                        {live}
+                    )
+                    GROUP BY day, kind
+                    ORDER BY day, kind
+                    """,
+                    (table, since_day, since),
+                ).fetchall()
+            else:
+                rows = conn.execute(f"{live} ORDER BY 1, 2", (since,)).fetchall()
+        return [{"day": row["day"], "kind": row["kind"], "count": int(row["count"])} for row in rows]
+
+    def get_stats(self) -> dict:
+        return {
+            **self._stats,
+            "archived": dict(self._stats["archived"]),
+            "migrations": dict(self._stats["migrations"]),
+            "tables": [p.table for policies in self.databases.values() for p in policies],
+            "archive_dir": str(self.archive_dir),
+        }
@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+import asyncio
+import os
+import time
+from typing import Optional, Sequence
+
+import numpy as np
+
+from backend.core.services.companion_memory import RelationshipFact
+
+
+# Active facts considered per turn (list_facts caps a page at 200).
+FACT_INDEX_CANDIDATES = int(os.getenv("CHAT_FACT_INDEX_CANDIDATES", "200"))
+# score = (1 - w) * cosine + w * confidence
+FACT_CONFIDENCE_WEIGHT = float(os.getenv("CHAT_FACT_CONFIDENCE_WEIGHT", "0.2"))
+# Budget for embedding the query and any new facts; the turn falls back to recent facts past it.
+FACT_INDEX_TIMEOUT_SECONDS = float(os.getenv("CHAT_FACT_INDEX_TIMEOUT_SECONDS", "0.5"))
+
+
+@dataclass
+class _IndexedFact:
+    fact: str
+    vector: np.ndarray
+
+
+class FactVectorIndex:
+    """In-memory embeddings of relationship facts, ranked against the query by one matrix product.
+
+    A fact is embedded once and re-embedded only when its text changes; facts that are no longer
+    active drop out on the next selection. Embedding missing facts is shared between concurrent
+    turns and keeps running when a turn gives up waiting, so the next turn finds them ready.
+    """
+
+    def __init__(self, embeddings_client, confidence_weight: float = FACT_CONFIDENCE_WEIGHT):
+        self.embeddings_client = embeddings_client
+        self.confidence_weight = min(1.0, max(0.0, float(confidence_weight)))
+        self._vectors: dict[str, _IndexedFact] = {}
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_ids: list[str] = []
+        self._sync_task: Optional[asyncio.Task] = None
+        self._stats = {"selections": 0, "embedded": 0, "evicted": 0, "last_scan_ms": None}
+
+    @staticmethod
+    def _normalize(vectors) -> np.ndarray:
+        matrix = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        return matrix / np.where(norms == 0.0, 1.0, norms)
+
+    async def _embed_missing(self, missing: list[tuple[str, str]]):
+        vectors = await self.embeddings_client.embed([text for _, text in missing])
+        for (fact_id, text), vector in zip(missing, self._normalize(vectors)):
+            self._vectors[fact_id] = _IndexedFact(fact=text, vector=vector)
+        self._stats["embedded"] += len(missing)
+        self._matrix = None
+
+    async def sync(self, facts: Sequence[RelationshipFact]):
+        """Embed new or edited facts and forget the ones that are no longer active."""
+        active = {f.fact_id: f.fact for f in facts}
+        stale = [fact_id for fact_id in self._vectors if fact_id not in active]
+        for fact_id in stale:
+            del self._vectors[fact_id]
+        if stale:
+            self._stats["evicted"] += len(stale)
+            self._matrix = None
+
+        missing = [
+            (fact_id, text) for fact_id, text in active.items()
+            if fact_id not in self._vectors or self._vectors[fact_id].fact != text
+        ]
+        if not missing:
+            return
+        if self._sync_task is None or self._sync_task.done():
+            self._sync_task = asyncio.ensure_future(self._embed_missing(missing))
+        # Shielded: a turn that times out must not cancel work the next turn will reuse.
+        await asyncio.shield(self._sync_task)
+        if any(fact_id not in self._vectors for fact_id, _ in missing):
+            # The running batch was started by another turn for other facts; embed the rest now.
+            await self.sync(facts)
+
+    def _current_matrix(self) -> tuple[np.ndarray, list[str]]:
+        if self._matrix is None:
+            self._matrix_ids = list(self._vectors)
+            self._matrix = (
+                np.stack([self._vectors[fact_id].vector for fact_id in self._matrix_ids])
+                if self._matrix_ids else np.zeros((0, 0), dtype=np.float32)
+            )
+        return self._matrix, self._matrix_ids
+
+    async def select(self, query_text: str, facts: Sequence[RelationshipFact], limit: int) -> list[RelationshipFact]:
+        """Top `limit` facts by similarity to the query blended with fact confidence."""
+        query_vector, _ = await asyncio.gather(self.embeddings_client.embed_query(query_text), self.sync(facts))
+        started = time.perf_counter()
+        query = self._normalize(query_vector)
+        matrix, ids = self._current_matrix()
+        by_id = {f.fact_id: f for f in facts}
+        # Rows of facts another concurrent turn indexed but this turn did not list are skipped.
+        rows = [i for i, fact_id in enumerate(ids) if fact_id in by_id]
+        if not rows or matrix.shape[1] != query.shape[0]:
+            return list(facts[:limit])
+
+        ids = [ids[i] for i in rows]
+        similarity = (matrix if len(rows) == len(matrix) else matrix[rows]) @ query
+        confidence = np.array([by_id[fact_id].confidence for fact_id in ids], dtype=np.float32)
+        scores = (1.0 - self.confidence_weight) * similarity + self.confidence_weight * confidence
+        top = np.argsort(-scores, kind="stable")[:limit]
+        self._stats["selections"] += 1
+        self._stats["last_scan_ms"] = round((time.perf_counter() - started) * 1000.0, 3)
+        return [by_id[ids[i]] for i in top]
+
+    def get_stats(self) -> dict:
+        return {**self._stats, "facts_indexed": len(self._vectors), "confidence_weight": self.confidence_weight}
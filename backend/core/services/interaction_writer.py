@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+import uuid
+from typing import Dict, List, Optional
+
+
+INTERACTION_QUEUE_SIZE = int(os.getenv("INTERACTION_QUEUE_SIZE", "256"))
+INTERACTION_BATCH_SIZE = int(os.getenv("INTERACTION_BATCH_SIZE", "16"))
+# How long the writer waits for more items before flushing a partial batch.
+INTERACTION_FLUSH_INTERVAL_SECONDS = float(os.getenv("INTERACTION_FLUSH_INTERVAL_SECONDS", "0.5"))
+INTERACTION_DRAIN_TIMEOUT_SECONDS = float(os.getenv("INTERACTION_DRAIN_TIMEOUT_SECONDS", "10"))
+# How long feedback waits for its own still-queued interaction before handing the outcome to the writer.
+INTERACTION_OUTCOME_WAIT_SECONDS = float(os.getenv("INTERACTION_OUTCOME_WAIT_SECONDS", "1"))
+
+
+class InteractionWriter:
+    """Write-behind queue for chat interactions.
+
+    `submit` only enqueues (the chat response does not wait for embedding + Chroma insert);
+    a background task flushes batches to MemoryEngine. When the queue is full new interactions
+    are dropped and counted rather than blocking the chat turn. Each queued id has a future the
+    writer resolves once its batch is done; feedback for an id still in the queue is applied by
+    the writer right after that write.
+    """
+
+    def __init__(
+        self,
+        memory_engine,
+        max_queue: int = INTERACTION_QUEUE_SIZE,
+        batch_size: int = INTERACTION_BATCH_SIZE,
+        flush_interval_s: float = INTERACTION_FLUSH_INTERVAL_SECONDS,
+    ):
+        self.memory_engine = memory_engine
+        self.max_queue = max(1, int(max_queue))
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval_s = float(flush_interval_s)
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=self.max_queue)
+        self._task: Optional[asyncio.Task] = None
+        self._closed = False
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._deferred_outcomes: Dict[str, List[bool]] = {}
+        self._stats = {
+            "submitted": 0,
+            "written": 0,
+            "dropped": 0,
+            "failed": 0,
+            "outcomes_deferred": 0,
+            "outcomes_dropped": 0,
+            "batches": 0,
+            "last_flush_ms": None,
+        }
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def submit(self, query: str, response: str, context_used: List[dict]) -> Optional[str]:
+        """Enqueue an interaction; returns its pre-generated id, or None if it was dropped."""
+        if self._closed:
+            self._stats["dropped"] += 1
+            return None
+        interaction_id = str(uuid.uuid4())
+        item = {"query": query, "response": response, "context_used": context_used, "interaction_id": interaction_id}
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self._stats["dropped"] += 1
+            return None
+        self._pending[interaction_id] = asyncio.get_running_loop().create_future()
+        self._stats["submitted"] += 1
+        return interaction_id
+
+    async def _next_batch(self) -> list[dict]:
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval_s
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _write(self, batch: list[dict]):
+        started = time.perf_counter()
+        try:
+            add_many = getattr(self.memory_engine, "add_interactions", None)
+            if add_many is not None:
+                await add_many(batch)
+            else:
+                for item in batch:
+                    await self.memory_engine.add_interaction(
+                        query=item["query"],
+                        response=item["response"],
+                        context_used=item["context_used"],
+                    )
+            self._stats["written"] += len(batch)
+            written = True
+        except Exception:
+            self._stats["failed"] += len(batch)
+            written = False
+        self._stats["batches"] += 1
+        self._stats["last_flush_ms"] = round((time.perf_counter() - started) * 1000.0, 2)
+        try:
+            for item in batch:
+                interaction_id = item["interaction_id"]
+                future = self._pending.pop(interaction_id, None)
+                if future is not None and not future.done():
+                    future.set_result(written)
+                outcomes = self._deferred_outcomes.pop(interaction_id, [])
+                if not written:
+                    self._stats["outcomes_dropped"] += len(outcomes)
+                    continue
+                for helpful in outcomes:
+                    try:
+                        await self.memory_engine.record_outcome(interaction_id=interaction_id, helpful=helpful)
+                    except Exception:
+                        self._stats["outcomes_dropped"] += 1
+        finally:
+            for _ in batch:
+                self._queue.task_done()
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            await self._write(batch)
+
+    async def flush(self, timeout: Optional[float] = None):
+        """Wait until everything submitted so far has been written (or failed)."""
+        if self._task is None:
+            # Not started (e.g. tests without lifespan): write inline.
+            while not self._queue.empty():
+                batch = [self._queue.get_nowait() for _ in range(min(self.batch_size, self._queue.qsize()))]
+                await self._write(batch)
+            return
+        await asyncio.wait_for(self._queue.join(), timeout=timeout)
+
+    async def record_outcome(
+        self,
+        interaction_id: str,
+        helpful: bool,
+        timeout: float = INTERACTION_OUTCOME_WAIT_SECONDS,
+    ) -> str:
+        """Record feedback for an interaction: "recorded" now, or "queued" behind its pending write.
+
+        Only this interaction's own write is awaited, never the rest of the queue.
+        """
+        if self._task is None and interaction_id in self._pending:
+            # Not started (e.g. tests without lifespan): write inline.
+            await self.flush()
+        future = self._pending.get(interaction_id)
+        if future is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(future), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            if not future.done():
+                # No await since the check: the writer applies this right after the write.
+                self._deferred_outcomes.setdefault(interaction_id, []).append(helpful)
+                self._stats["outcomes_deferred"] += 1
+                return "queued"
+        await self.memory_engine.record_outcome(interaction_id=interaction_id, helpful=helpful)
+        return "recorded"
+
+    async def close(self, timeout: float = INTERACTION_DRAIN_TIMEOUT_SECONDS):
+        """Stop accepting new items and drain the queue (bounded by timeout) on shutdown."""
+        self._closed = True
+        try:
+            await self.flush(timeout=timeout)
+        except asyncio.TimeoutError:
+            self._stats["dropped"] += self._queue.qsize()
+        finally:
+            if self._task is not None:
+                self._task.cancel()
+                try:
+                    await self._task
+                except asyncio.CancelledError:
+                    pass
+                self._task = None
+            for future in self._pending.values():
+                future.cancel()
+            self._pending.clear()
+            self._stats["outcomes_dropped"] += sum(len(o) for o in self._deferred_outcomes.values())
+            self._deferred_outcomes.clear()
+
+    def get_stats(self) -> dict:
+        return {
+            **self._stats,
+            "queue_depth": self._queue.qsize(),
+            "deferred_outcomes": sum(len(o) for o in self._deferred_outcomes.values()),
+            "max_queue": self.max_queue,
+            "batch_size": self.batch_size,
+            "running": self._task is not None and not self._task.done(),
+        }
@@ -1,5 +1,13 @@
+from collections import deque
+import json
+import os
+import time
+
 import httpx
-from typing import List, Dict
+from typing import AsyncIterator, List, Dict, Optional
+
+from backend.core.services.metrics import GenerationStats, current_llm_caller, record_generation
+from backend.core.services.token_counter import TokenCounter
 
 
 DEFAULT_SYSTEM_PROMPT = (
@@ -8,26 +16,86 @@ DEFAULT_SYSTEM_PROMPT = (
     "Если пользователь запрашивает другой язык, переключайся только для этого запроса."
 )
 
+MODEL_ID_CACHE_SECONDS = float(os.getenv("KOBOLD_MODEL_ID_CACHE_SECONDS", "300"))
+# Opt-in: after each generation ask /api/extra/perf for exact token counts and prompt-processing time.
+# Off by default: it costs one more round trip inside the scheduler slot, and with concurrent callers
+# on one backend "last" may already describe another generation. Without it prompt tokens come from
+# the backend's tokencount endpoint (cached) and TTFT is measured for streamed calls only.
+KOBOLD_PERF_STATS = os.getenv("KOBOLD_PERF_STATS", "0").lower() not in {"0", "false", "no", ""}
+
+
+class PromptPrefixTracker:
+    """Measures how much of each prompt matches the previous one sent to the same KoboldCpp server.
+
+    KoboldCpp keeps the KV cache of the last prompt, so the shared prefix is the part
+    that does not have to be re-evaluated.
+    """
+
+    def __init__(self, window: int = 100):
+        self._last_prompt = ""
+        self._ratios: deque = deque(maxlen=window)
+        self.observations = 0
+        self.last_prefix_chars = 0
+        self.last_prompt_chars = 0
+
+    def observe(self, prompt: str) -> int:
+        previous = self._last_prompt
+        limit = min(len(previous), len(prompt))
+        matched = 0
+        while matched < limit and previous[matched] == prompt[matched]:
+            matched += 1
+
+        self.observations += 1
+        self.last_prefix_chars = matched
+        self.last_prompt_chars = len(prompt)
+        if previous:
+            self._ratios.append(matched / len(prompt) if prompt else 0.0)
+        self._last_prompt = prompt
+        return matched
+
+    def get_metrics(self) -> dict:
+        return {
+            "observations": self.observations,
+            "last_prefix_chars": self.last_prefix_chars,
+            "last_prompt_chars": self.last_prompt_chars,
+            "last_prefix_ratio": (self.last_prefix_chars / self.last_prompt_chars) if self.last_prompt_chars else None,
+            "avg_prefix_ratio": (sum(self._ratios) / len(self._ratios)) if self._ratios else None,
+        }
+
+
+_prefix_trackers: Dict[str, PromptPrefixTracker] = {}
+
+
+def get_prefix_tracker(base_url: str) -> PromptPrefixTracker:
+    """Trackers are per server: every client talking to the same KoboldCpp shares its KV cache."""
+    return _prefix_trackers.setdefault(base_url.rstrip("/"), PromptPrefixTracker())
+
+
 class KoboldClient:
     """Клиент для KoboldCpp API"""
     
-    def __init__(self, base_url: str = "http://localhost:5001"):
-        self.base_url = base_url
-        self.client = httpx.AsyncClient(timeout=120.0)
+    def __init__(self, base_url: str = "http://localhost:5001", client: Optional[httpx.AsyncClient] = None):
+        self.base_url = base_url.rstrip("/")
+        self.client = client or httpx.AsyncClient(timeout=120.0)
+        self.prefix_tracker = get_prefix_tracker(base_url)
+        self._model_id: Optional[str] = None
+        self._model_id_checked_at = 0.0
+        # Prompt tokens for metrics when /api/extra/perf is off; counted with this backend's tokenizer.
+        self.token_counter = TokenCounter(base_url=self.base_url, client=self.client)
     
-    async def generate(
+    def _build_payload(
         self,
         messages: List[Dict],
-        max_tokens: int = 512,
-        temperature: float = 0.7,
-        top_p: float = 0.9,
-        top_k: int = 40
-    ) -> str:
-        """Генерация текста через KoboldCpp"""
-        
+        max_tokens: int,
+        temperature: float,
+        top_p: float,
+        top_k: int,
+        grammar: Optional[str] = None,
+    ) -> Dict:
         # Форматирование сообщений в промпт
         prompt = self._format_messages(messages)
-        
+        self.prefix_tracker.observe(prompt)
+
         payload = {
             "prompt": prompt,
             "max_length": max_tokens,
@@ -38,7 +106,25 @@ class KoboldClient:
             # Keep stop markers conservative to avoid premature stop on transcript tokens.
             "stop_sequence": ["</s>"]
         }
-        
+        if grammar:
+            # GBNF: KoboldCpp samples only tokens the grammar allows and stops once the root rule is complete.
+            payload["grammar"] = grammar
+        return payload
+
+    async def generate(
+        self,
+        messages: List[Dict],
+        max_tokens: int = 512,
+        temperature: float = 0.7,
+        top_p: float = 0.9,
+        top_k: int = 40,
+        grammar: Optional[str] = None,
+    ) -> str:
+        """Генерация текста через KoboldCpp (grammar — необязательная GBNF-грамматика)"""
+
+        payload = self._build_payload(messages, max_tokens, temperature, top_p, top_k, grammar=grammar)
+        started = time.perf_counter()
+
         try:
             response = await self.client.post(
                 f"{self.base_url}/api/v1/generate",
@@ -47,11 +133,132 @@ class KoboldClient:
             response.raise_for_status()
             
             result = response.json()
-            return result["results"][0]["text"].strip()
+            text = result["results"][0]["text"].strip()
             
         except httpx.HTTPError as e:
+            self._record_failure(started, streamed=False)
             raise Exception(f"KoboldCpp error: {str(e)}")
-    
+
+        total_s = time.perf_counter() - started
+        perf = await self._fetch_perf()
+        prompt_tokens, generated_tokens = perf.get("last_input_count"), perf.get("last_token_count")
+        if not prompt_tokens or not generated_tokens:
+            counted = await self.token_counter.count_many([payload["prompt"], text])
+            prompt_tokens, generated_tokens = prompt_tokens or counted[0], generated_tokens or counted[1]
+        prompt_tokens, generated_tokens = int(prompt_tokens), int(generated_tokens)
+        # Non-streamed calls have no first-token event: only KoboldCpp's prompt processing time gives a
+        # TTFT; without it the call is counted in llm_ttft_unmeasured_total instead.
+        ttft_ms = float(perf["last_process"]) * 1000.0 if perf.get("last_process") is not None else None
+        eval_s = float(perf.get("last_eval") or 0.0) or total_s
+        record_generation(
+            GenerationStats(
+                caller=current_llm_caller(),
+                backend=self.base_url,
+                streamed=False,
+                ok=True,
+                prompt_tokens=prompt_tokens,
+                generated_tokens=generated_tokens,
+                ttft_ms=ttft_ms,
+                total_ms=total_s * 1000.0,
+                tokens_per_sec=(generated_tokens / eval_s) if eval_s > 0 else None,
+            )
+        )
+        return text
+
+    async def generate_stream(
+        self,
+        messages: List[Dict],
+        max_tokens: int = 512,
+        temperature: float = 0.7,
+        top_p: float = 0.9,
+        top_k: int = 40
+    ) -> AsyncIterator[str]:
+        """Потоковая генерация через SSE endpoint KoboldCpp (/api/extra/generate/stream)."""
+
+        payload = self._build_payload(messages, max_tokens, temperature, top_p, top_k)
+        leading = True
+        started = time.perf_counter()
+        first_token_at: Optional[float] = None
+        token_events = 0
+
+        try:
+            async with self.client.stream(
+                "POST",
+                f"{self.base_url}/api/extra/generate/stream",
+                json=payload,
+            ) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    try:
+                        data = json.loads(line[5:].strip())
+                    except json.JSONDecodeError:
+                        continue
+                    token = str(data.get("token", "") or "")
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    token_events += 1
+                    # Mirror generate(): the completion is returned without leading whitespace.
+                    if leading:
+                        token = token.lstrip()
+                    if not token:
+                        continue
+                    leading = False
+                    yield token
+
+        except httpx.HTTPError as e:
+            self._record_failure(started, streamed=True)
+            raise Exception(f"KoboldCpp error: {str(e)}")
+
+        finished_at = time.perf_counter()
+        perf = await self._fetch_perf()
+        ttft_s = (first_token_at - started) if first_token_at is not None else None
+        decode_s = (finished_at - first_token_at) if first_token_at is not None else 0.0
+        # Each SSE event carries one sampled token.
+        generated_tokens = int(perf.get("last_token_count") or token_events)
+        record_generation(
+            GenerationStats(
+                caller=current_llm_caller(),
+                backend=self.base_url,
+                streamed=True,
+                ok=True,
+                prompt_tokens=int(perf.get("last_input_count") or await self.token_counter.count(payload["prompt"])),
+                generated_tokens=generated_tokens,
+                ttft_ms=ttft_s * 1000.0 if ttft_s is not None else None,
+                total_ms=(finished_at - started) * 1000.0,
+                tokens_per_sec=((token_events - 1) / decode_s) if token_events > 1 and decode_s > 0 else None,
+            )
+        )
+
+    async def _fetch_perf(self) -> Dict:
+        """Статистика последней генерации (/api/extra/perf); пустой dict, если недоступна."""
+
+        if not KOBOLD_PERF_STATS:
+            return {}
+        try:
+            response = await self.client.get(f"{self.base_url}/api/extra/perf")
+            response.raise_for_status()
+            data = response.json()
+            return data if isinstance(data, dict) else {}
+        except Exception:
+            return {}
+
+    def _record_failure(self, started: float, streamed: bool):
+        record_generation(
+            GenerationStats(
+                caller=current_llm_caller(),
+                backend=self.base_url,
+                streamed=streamed,
+                ok=False,
+                prompt_tokens=0,
+                generated_tokens=0,
+                ttft_ms=None,
+                total_ms=(time.perf_counter() - started) * 1000.0,
+                tokens_per_sec=None,
+            )
+        )
+
     def _format_messages(self, messages: List[Dict]) -> str:
         """Форматирование сообщений в промпт"""
 
@@ -70,6 +277,32 @@ class KoboldClient:
         formatted.append("Assistant:")
         return "\n\n".join(formatted)
     
+    async def abort(self) -> bool:
+        """Прервать текущую генерацию KoboldCpp (/api/extra/abort)."""
+
+        try:
+            response = await self.client.post(f"{self.base_url}/api/extra/abort", json={})
+            return response.status_code == 200
+        except Exception:
+            return False
+
+    async def get_model_id(self) -> str:
+        """Имя загруженной модели (/api/v1/model), кэшируется на MODEL_ID_CACHE_SECONDS."""
+
+        now = time.monotonic()
+        if self._model_id is not None and now - self._model_id_checked_at < MODEL_ID_CACHE_SECONDS:
+            return self._model_id
+        try:
+            response = await self.client.get(f"{self.base_url}/api/v1/model")
+            response.raise_for_status()
+            model_id = str(response.json().get("result") or "").strip() or "unknown"
+        except Exception:
+            # Не кэшируем ошибку: модель узнаем при следующем обращении.
+            return self._model_id or "unknown"
+        self._model_id = model_id
+        self._model_id_checked_at = now
+        return model_id
+
     async def check_health(self) -> bool:
         """Проверка доступности KoboldCpp"""
         
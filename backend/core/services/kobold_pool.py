@@ -0,0 +1,282 @@
+from __future__ import annotations
+
+from collections import deque
+from dataclasses import dataclass, field
+import asyncio
+import contextvars
+import json
+import os
+import time
+from typing import AsyncIterator, Dict, List, Optional
+
+from backend.core.services.kobold_client import KoboldClient, PromptPrefixTracker
+from backend.core.services.token_counter import estimate_tokens
+
+
+KOBOLD_URL = os.getenv("KOBOLD_URL", "http://localhost:5001")
+# JSON list: [{"name": "small", "url": "http://localhost:5002", "capabilities": ["planner"], "max_context": 4096}, ...]
+KOBOLD_BACKENDS = os.getenv("KOBOLD_BACKENDS", "")
+KOBOLD_HEALTH_INTERVAL_SECONDS = float(os.getenv("KOBOLD_HEALTH_INTERVAL_SECONDS", "15"))
+
+REQUEST_CLASSES = ("chat", "planner", "background")
+
+
+@dataclass
+class KoboldBackend:
+    name: str
+    client: KoboldClient
+    capabilities: set[str] = field(default_factory=lambda: set(REQUEST_CLASSES))
+    max_context: int = 4096
+    # None = not probed yet; treated as usable.
+    healthy: Optional[bool] = None
+    last_probe_at: float = 0.0
+    requests: int = 0
+    failures: int = 0
+    latency_ms: deque = field(default_factory=lambda: deque(maxlen=200))
+    tokens_per_sec: deque = field(default_factory=lambda: deque(maxlen=200))
+
+    @property
+    def base_url(self) -> str:
+        return self.client.base_url
+
+    def record_success(self, elapsed_s: float, output_tokens: int):
+        self.requests += 1
+        self.healthy = True
+        self.latency_ms.append(elapsed_s * 1000.0)
+        if elapsed_s > 0 and output_tokens > 0:
+            self.tokens_per_sec.append(output_tokens / elapsed_s)
+
+    def record_failure(self):
+        self.requests += 1
+        self.failures += 1
+        self.healthy = False
+        self.last_probe_at = time.monotonic()
+
+    def get_metrics(self) -> dict:
+        def _pct(values: deque, q: float) -> Optional[float]:
+            ordered = sorted(values)
+            if not ordered:
+                return None
+            return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 2)
+
+        return {
+            "name": self.name,
+            "url": self.base_url,
+            "capabilities": sorted(self.capabilities),
+            "max_context": self.max_context,
+            "healthy": self.healthy,
+            "requests": self.requests,
+            "failures": self.failures,
+            "latency_ms_p50": _pct(self.latency_ms, 0.5),
+            "latency_ms_p95": _pct(self.latency_ms, 0.95),
+            "tokens_per_sec_p50": _pct(self.tokens_per_sec, 0.5),
+        }
+
+
+class KoboldPool:
+    """Several KoboldCpp servers (e.g. a small fast model and a large one) behind one router.
+
+    Requests are routed by class (chat / planner / background) to backends that declare the
+    capability, skipping backends that are known to be down or whose context is too small;
+    on errors the next candidate is tried. Health is refreshed by cached `check_health` probes.
+    """
+
+    def __init__(self, backends: List[KoboldBackend], probe_interval_s: float = KOBOLD_HEALTH_INTERVAL_SECONDS):
+        if not backends:
+            raise ValueError("KoboldPool needs at least one backend")
+        self.backends = backends
+        self.probe_interval_s = float(probe_interval_s)
+        self._failovers = 0
+
+    @classmethod
+    def from_env(cls) -> "KoboldPool":
+        if not KOBOLD_BACKENDS.strip():
+            return cls([KoboldBackend(name="default", client=KoboldClient(KOBOLD_URL))])
+
+        specs = json.loads(KOBOLD_BACKENDS)
+        backends = []
+        for index, spec in enumerate(specs):
+            backends.append(
+                KoboldBackend(
+                    name=str(spec.get("name") or f"backend-{index}"),
+                    client=KoboldClient(str(spec["url"])),
+                    capabilities=set(spec.get("capabilities") or REQUEST_CLASSES),
+                    max_context=int(spec.get("max_context", 4096)),
+                )
+            )
+        return cls(backends)
+
+    async def probe(self, backend: KoboldBackend, force: bool = False) -> bool:
+        if not force and backend.healthy is not None and time.monotonic() - backend.last_probe_at < self.probe_interval_s:
+            return bool(backend.healthy)
+        backend.healthy = await backend.client.check_health()
+        backend.last_probe_at = time.monotonic()
+        return backend.healthy
+
+    async def probe_all(self, force: bool = False):
+        await asyncio.gather(*(self.probe(backend, force=force) for backend in self.backends))
+
+    async def probe_loop(self, stop_event: asyncio.Event):
+        """Background refresh of backend health, run by the app lifespan."""
+        while not stop_event.is_set():
+            await self.probe_all(force=True)
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=self.probe_interval_s)
+            except asyncio.TimeoutError:
+                continue
+
+    async def route(self, request_class: str, context_tokens: int = 0) -> List[KoboldBackend]:
+        """Backends to try, best first: healthy before down, then context fit, then capability."""
+
+        def _rank(backend: KoboldBackend) -> tuple[int, int, int]:
+            capable = request_class in backend.capabilities
+            fits = context_tokens <= backend.max_context
+            # A prompt that overflows the context gets truncated by KoboldCpp, so fit beats capability.
+            return (0 if fits else 1, 0 if capable else 1, self.backends.index(backend))
+
+        ordered = sorted(self.backends, key=_rank)
+        # Backends marked down get a (cached) re-probe so they rejoin once KoboldCpp is back.
+        for backend in ordered:
+            if backend.healthy is False:
+                await self.probe(backend)
+        usable = [b for b in ordered if b.healthy is not False]
+        down = [b for b in ordered if b.healthy is False]
+        # If everything looks down, still try: the probe may be stale.
+        return usable + down
+
+    def record_failover(self):
+        self._failovers += 1
+
+    def client_for(self, request_class: str) -> "RoutedKoboldClient":
+        return RoutedKoboldClient(self, request_class)
+
+    async def close(self):
+        for backend in self.backends:
+            await backend.client.close()
+
+    def get_metrics(self) -> dict:
+        return {
+            "failovers": self._failovers,
+            "backends": [backend.get_metrics() for backend in self.backends],
+        }
+
+
+class RoutedKoboldClient:
+    """KoboldClient-compatible view of the pool for one request class."""
+
+    def __init__(self, pool: KoboldPool, request_class: str):
+        self.pool = pool
+        self.request_class = request_class
+        # Backend serving the current task's generation. Each request runs in its own task, so
+        # concurrent requests on this shared client never see (or abort) each other's backend.
+        self._served_by: contextvars.ContextVar[Optional[KoboldBackend]] = contextvars.ContextVar(
+            f"kobold_served_by_{request_class}_{id(self)}", default=None
+        )
+
+    @property
+    def primary(self) -> KoboldBackend:
+        return self._served_by.get() or next(
+            (b for b in self.pool.backends if self.request_class in b.capabilities),
+            self.pool.backends[0],
+        )
+
+    @property
+    def base_url(self) -> str:
+        return self.primary.base_url
+
+    @property
+    def prefix_tracker(self) -> PromptPrefixTracker:
+        return self.primary.client.prefix_tracker
+
+    def _context_tokens(self, messages: List[Dict], max_tokens: int) -> int:
+        return estimate_tokens("\n\n".join(str(m.get("content", "")) for m in messages)) + max_tokens
+
+    async def generate(
+        self,
+        messages: List[Dict],
+        max_tokens: int = 512,
+        temperature: float = 0.7,
+        top_p: float = 0.9,
+        top_k: int = 40,
+        grammar: Optional[str] = None,
+    ) -> str:
+        candidates = await self.pool.route(self.request_class, self._context_tokens(messages, max_tokens))
+        last_error: Optional[Exception] = None
+        for attempt, backend in enumerate(candidates):
+            if attempt:
+                self.pool.record_failover()
+            self._served_by.set(backend)
+            started = time.perf_counter()
+            try:
+                text = await backend.client.generate(
+                    messages,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    top_p=top_p,
+                    top_k=top_k,
+                    grammar=grammar,
+                )
+            except Exception as exc:
+                backend.record_failure()
+                last_error = exc
+                continue
+            backend.record_success(time.perf_counter() - started, estimate_tokens(text))
+            return text
+        raise last_error or Exception("KoboldCpp error: no backends available")
+
+    async def generate_stream(
+        self,
+        messages: List[Dict],
+        max_tokens: int = 512,
+        temperature: float = 0.7,
+        top_p: float = 0.9,
+        top_k: int = 40,
+    ) -> AsyncIterator[str]:
+        candidates = await self.pool.route(self.request_class, self._context_tokens(messages, max_tokens))
+        last_error: Optional[Exception] = None
+        for attempt, backend in enumerate(candidates):
+            if attempt:
+                self.pool.record_failover()
+            self._served_by.set(backend)
+            started = time.perf_counter()
+            emitted: list[str] = []
+            try:
+                async for token in backend.client.generate_stream(
+                    messages,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    top_p=top_p,
+                    top_k=top_k,
+                ):
+                    emitted.append(token)
+                    yield token
+            except Exception as exc:
+                backend.record_failure()
+                # Tokens already reached the client: switching backends would splice two answers.
+                if emitted:
+                    raise
+                last_error = exc
+                continue
+            backend.record_success(time.perf_counter() - started, estimate_tokens("".join(emitted)))
+            return
+        raise last_error or Exception("KoboldCpp error: no backends available")
+
+    async def abort(self) -> bool:
+        """Abort the generation of the calling task; a task that has not generated has nothing to abort."""
+        backend = self._served_by.get()
+        if backend is None:
+            return False
+        return await backend.client.abort()
+
+    async def get_model_id(self) -> str:
+        # Model of the backend the next request of this class is routed to (the plan cache key).
+        candidates = await self.pool.route(self.request_class)
+        return await candidates[0].client.get_model_id()
+
+    async def check_health(self) -> bool:
+        candidates = await self.pool.route(self.request_class)
+        return any(backend.healthy is not False for backend in candidates)
+
+    async def close(self):
+        # Backend clients belong to the pool.
+        return None
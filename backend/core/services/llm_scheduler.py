@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+from collections import deque
+from contextlib import asynccontextmanager
+from enum import IntEnum
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from typing import AsyncIterator, Awaitable, Callable, Optional, TypeVar
+
+
+T = TypeVar("T")
+
+LLM_SCHEDULER_MAX_QUEUE = int(os.getenv("LLM_SCHEDULER_MAX_QUEUE", "16"))
+# KoboldCpp serves one generation at a time; more slots only make sense for a multi-slot backend.
+LLM_SCHEDULER_CONCURRENCY = int(os.getenv("LLM_SCHEDULER_CONCURRENCY", "1"))
+
+
+class LLMPriority(IntEnum):
+    INTERACTIVE = 0
+    PLANNER = 1
+    BACKGROUND = 2
+
+
+DEFAULT_DEADLINES_S = {
+    LLMPriority.INTERACTIVE: float(os.getenv("LLM_DEADLINE_INTERACTIVE_SECONDS", "180")),
+    LLMPriority.PLANNER: float(os.getenv("LLM_DEADLINE_PLANNER_SECONDS", "90")),
+    LLMPriority.BACKGROUND: float(os.getenv("LLM_DEADLINE_BACKGROUND_SECONDS", "600")),
+}
+
+
+class SchedulerQueueFullError(Exception):
+    """The bounded LLM queue has no room for another waiting request."""
+
+
+class SchedulerClosedError(Exception):
+    """The scheduler was shut down while the request was waiting."""
+
+
+class LLMScheduler:
+    """Priority gate in front of KoboldCpp shared by chat, planner and background jobs.
+
+    Requests wait in a bounded priority queue (interactive < planner < background, FIFO within a
+    class). Each request has a deadline covering queue wait and generation; when a running request
+    is cancelled (client disconnect, deadline) its `on_cancel` hook is fired, e.g. KoboldCpp abort.
+    """
+
+    def __init__(self, max_queue: int = LLM_SCHEDULER_MAX_QUEUE, concurrency: int = LLM_SCHEDULER_CONCURRENCY):
+        self.max_queue = max(0, int(max_queue))
+        self.concurrency = max(1, int(concurrency))
+        self._active = 0
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._closed = False
+        self._background: set[asyncio.Task] = set()
+        self._wait_ms: dict[LLMPriority, deque] = {p: deque(maxlen=200) for p in LLMPriority}
+        self._counters = {
+            "submitted_total": 0,
+            "completed_total": 0,
+            "rejected_total": 0,
+            "deadline_exceeded_total": 0,
+            "cancelled_total": 0,
+        }
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(1 for _, _, fut in self._waiters if not fut.done())
+
+    async def _acquire(self, priority: LLMPriority, timeout: Optional[float]):
+        if self._closed:
+            raise SchedulerClosedError("LLM scheduler is closed")
+        if self._active < self.concurrency and self.queue_depth == 0:
+            self._active += 1
+            return
+        if self.queue_depth >= self.max_queue:
+            self._counters["rejected_total"] += 1
+            raise SchedulerQueueFullError("LLM queue is full")
+
+        fut: asyncio.Future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (int(priority), next(self._seq), fut))
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), timeout=timeout)
+        except BaseException:
+            if fut.done() and not fut.cancelled() and fut.exception() is None:
+                # Slot was handed over while we were giving up: pass it on.
+                self._release()
+            else:
+                fut.cancel()
+            raise
+
+    def _release(self):
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                fut.set_result(True)
+                return
+        self._active = max(0, self._active - 1)
+
+    def _fire(self, hook: Callable[[], Awaitable[object]]):
+        # The cancelled caller cannot await anymore, so the hook runs as its own task.
+        task = asyncio.ensure_future(hook())
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        priority: LLMPriority = LLMPriority.INTERACTIVE,
+        deadline_s: Optional[float] = None,
+        on_cancel: Optional[Callable[[], Awaitable[object]]] = None,
+    ) -> AsyncIterator[None]:
+        """Hold the LLM for the body of the block (works for streamed generations too)."""
+
+        priority = LLMPriority(priority)
+        deadline_s = DEFAULT_DEADLINES_S[priority] if deadline_s is None else deadline_s
+        loop = asyncio.get_running_loop()
+        deadline_at = loop.time() + deadline_s
+        self._counters["submitted_total"] += 1
+
+        queued_at = time.perf_counter()
+        try:
+            await self._acquire(priority, timeout=deadline_s)
+        except asyncio.TimeoutError:
+            self._counters["deadline_exceeded_total"] += 1
+            raise asyncio.TimeoutError(f"LLM request waited longer than {deadline_s:.0f}s in queue")
+        except asyncio.CancelledError:
+            self._counters["cancelled_total"] += 1
+            raise
+        self._wait_ms[priority].append((time.perf_counter() - queued_at) * 1000.0)
+
+        try:
+            async with asyncio.timeout_at(deadline_at):
+                yield
+            self._counters["completed_total"] += 1
+        except TimeoutError:
+            self._counters["deadline_exceeded_total"] += 1
+            if on_cancel is not None:
+                self._fire(on_cancel)
+            raise
+        except (asyncio.CancelledError, GeneratorExit):
+            # GeneratorExit: a streaming response generator was closed mid-stream.
+            self._counters["cancelled_total"] += 1
+            if on_cancel is not None:
+                self._fire(on_cancel)
+            raise
+        finally:
+            self._release()
+
+    async def run(
+        self,
+        factory: Callable[[], Awaitable[T]],
+        priority: LLMPriority = LLMPriority.INTERACTIVE,
+        deadline_s: Optional[float] = None,
+        on_cancel: Optional[Callable[[], Awaitable[object]]] = None,
+    ) -> T:
+        async with self.slot(priority, deadline_s=deadline_s, on_cancel=on_cancel):
+            return await factory()
+
+    def close(self):
+        self._closed = True
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                fut.set_exception(SchedulerClosedError("LLM scheduler is closed"))
+
+    def get_metrics(self) -> dict:
+        def _pct(values: list[float], q: float) -> Optional[float]:
+            if not values:
+                return None
+            return round(values[min(len(values) - 1, int(q * len(values)))], 2)
+
+        wait = {}
+        for priority, samples in self._wait_ms.items():
+            values = sorted(samples)
+            wait[priority.name.lower()] = {"p50_ms": _pct(values, 0.5), "p95_ms": _pct(values, 0.95), "samples": len(values)}
+
+        return {
+            "queue_depth": self.queue_depth,
+            "active": self._active,
+            "max_queue": self.max_queue,
+            "concurrency": self.concurrency,
+            **self._counters,
+            "wait_time": wait,
+        }
@@ -1,4 +1,5 @@
 from pathlib import Path
+import asyncio
 import uuid
 from typing import List, Dict, Optional
 import time
@@ -67,39 +68,67 @@ class MemoryEngine:
         }
         return memory_id
 
-    async def add_interaction(self, query: str, response: str, context_used: List[Dict]) -> str:
+    async def add_interaction(
+        self,
+        query: str,
+        response: str,
+        context_used: List[Dict],
+        interaction_id: Optional[str] = None,
+    ) -> str:
         """Сохранить взаимодействие для outcome learning"""
 
-        interaction_id = str(uuid.uuid4())
-        interaction_meta = {
-            "type": "interaction",
-            "timestamp": time.time(),
-            "outcome_score": 0.0,
-            "context_ids": [c.get("id") for c in context_used],
-        }
-
-        text = f"Q: {query}\nA: {response}"
+        ids = await self.add_interactions([
+            {"query": query, "response": response, "context_used": context_used, "interaction_id": interaction_id}
+        ])
+        return ids[0]
+
+    async def add_interactions(self, items: List[Dict]) -> List[str]:
+        """Сохранить пачку взаимодействий одним вызовом Chroma (эмбеддинги считаются батчем).
+
+        Элемент: {"query", "response", "context_used", "interaction_id"?}.
+        """
+
+        if not items:
+            return []
+
+        ids: List[str] = []
+        documents: List[str] = []
+        metadatas: List[Dict] = []
+        for item in items:
+            interaction_id = item.get("interaction_id") or str(uuid.uuid4())
+            context_used = item.get("context_used") or []
+            ids.append(interaction_id)
+            documents.append(f"Q: {item['query']}\nA: {item['response']}")
+            metadatas.append({
+                "type": "interaction",
+                "timestamp": time.time(),
+                "outcome_score": 0.0,
+                "context_ids": [c.get("id") for c in context_used],
+            })
 
         if self.chroma_available and self.collection is not None:
-            self.collection.add(documents=[text], ids=[interaction_id], metadatas=[interaction_meta])
+            # Chroma embeds and writes synchronously; keep it off the event loop.
+            await asyncio.to_thread(self.collection.add, documents=documents, ids=ids, metadatas=metadatas)
         else:
-            self.in_memory_store[interaction_id] = {
-                "id": interaction_id,
-                "content": text,
-                "metadata": interaction_meta,
-                "timestamp": interaction_meta["timestamp"],
-                "outcome_score": 0.0,
-                "type": "interaction",
-            }
+            for interaction_id, text, interaction_meta in zip(ids, documents, metadatas):
+                self.in_memory_store[interaction_id] = {
+                    "id": interaction_id,
+                    "content": text,
+                    "metadata": interaction_meta,
+                    "timestamp": interaction_meta["timestamp"],
+                    "outcome_score": 0.0,
+                    "type": "interaction",
+                }
 
-        self.interactions[interaction_id] = {
-            "query": query,
-            "response": response,
-            "context_used": context_used,
-            "timestamp": time.time(),
-        }
+        for interaction_id, item in zip(ids, items):
+            self.interactions[interaction_id] = {
+                "query": item["query"],
+                "response": item["response"],
+                "context_used": item.get("context_used") or [],
+                "timestamp": time.time(),
+            }
 
-        return interaction_id
+        return ids
 
     async def record_outcome(self, interaction_id: str, helpful: bool):
         """Записать результат (outcome-based learning)"""
@@ -136,13 +165,24 @@ class MemoryEngine:
         if new_score < -0.5:
             await self.delete_memory(interaction_id)
 
-    async def search(self, query: str, limit: int = 10) -> List[Dict]:
-        """Поиск с учетом outcome scores"""
+    async def search(self, query: str, limit: int = 10, include_embeddings: bool = False) -> List[Dict]:
+        """Поиск с учетом outcome scores.
+
+        include_embeddings: вернуть вектор каждого элемента (`embedding`) — для MMR-переранжирования.
+        """
 
         if self.chroma_available and self.collection is not None:
-            results = self.collection.query(query_texts=[query], n_results=limit * 3)
+            include = ["documents", "metadatas", "distances"]
+            if include_embeddings:
+                include.append("embeddings")
+            # Embedding the query + ANN search block for tens of ms; keep them off the event loop so the
+            # other context sources run meanwhile and the per-source deadline can actually fire.
+            results = await asyncio.to_thread(
+                self.collection.query, query_texts=[query], n_results=limit * 3, include=include
+            )
             if not results["ids"] or not results["ids"][0]:
                 return []
+            embeddings = results.get("embeddings") if include_embeddings else None
 
             scored_results = []
             for i, doc_id in enumerate(results["ids"][0]):
@@ -153,15 +193,16 @@ class MemoryEngine:
                 outcome_score = metadata.get("outcome_score", 0.0)
                 combined_score = (1 - distance) * 0.6 + (outcome_score + 1) * 0.4
 
-                scored_results.append(
-                    {
-                        "id": doc_id,
-                        "content": document,
-                        "score": combined_score,
-                        "outcome_score": outcome_score,
-                        "metadata": metadata,
-                    }
-                )
+                item = {
+                    "id": doc_id,
+                    "content": document,
+                    "score": combined_score,
+                    "outcome_score": outcome_score,
+                    "metadata": metadata,
+                }
+                if embeddings is not None and embeddings[0] is not None:
+                    item["embedding"] = [float(x) for x in embeddings[0][i]]
+                scored_results.append(item)
 
             scored_results.sort(key=lambda x: x["score"], reverse=True)
             return scored_results[:limit]
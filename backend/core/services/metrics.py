@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass
+import os
+import threading
+from typing import Iterator, Optional
+
+
+METRICS_HISTOGRAM_WINDOW = int(os.getenv("METRICS_HISTOGRAM_WINDOW", "500"))
+
+
+def _label_key(name: str, labels: Optional[dict]) -> str:
+    if not labels:
+        return name
+    rendered = ",".join(f"{k}={labels[k]}" for k in sorted(labels))
+    return f"{name}{{{rendered}}}"
+
+
+class RollingHistogram:
+    """Keeps the last `window` observations; percentiles are computed on read."""
+
+    def __init__(self, window: int = METRICS_HISTOGRAM_WINDOW):
+        self._values: deque = deque(maxlen=max(1, int(window)))
+        self.total_count = 0
+
+    def observe(self, value: float):
+        self._values.append(float(value))
+        self.total_count += 1
+
+    def snapshot(self) -> dict:
+        values = sorted(self._values)
+        if not values:
+            return {"count": 0, "total_count": self.total_count, "mean": None, "p50": None, "p95": None, "max": None}
+
+        def _pct(q: float) -> float:
+            return round(values[min(len(values) - 1, int(q * len(values)))], 2)
+
+        return {
+            "count": len(values),
+            "total_count": self.total_count,
+            "mean": round(sum(values) / len(values), 2),
+            "p50": _pct(0.5),
+            "p95": _pct(0.95),
+            "max": round(values[-1], 2),
+        }
+
+
+class MetricsRegistry:
+    """In-process counters and rolling histograms, keyed by name plus labels."""
+
+    def __init__(self, histogram_window: int = METRICS_HISTOGRAM_WINDOW):
+        self._lock = threading.Lock()
+        self._counters: dict[str, float] = {}
+        self._histograms: dict[str, RollingHistogram] = {}
+        self._histogram_window = histogram_window
+
+    def inc(self, name: str, labels: Optional[dict] = None, value: float = 1):
+        key = _label_key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, labels: Optional[dict] = None):
+        key = _label_key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = RollingHistogram(self._histogram_window)
+            histogram.observe(value)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "counters": dict(sorted(self._counters.items())),
+                "histograms": {key: h.snapshot() for key, h in sorted(self._histograms.items())},
+            }
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+_registry = MetricsRegistry()
+
+
+def get_registry() -> MetricsRegistry:
+    return _registry
+
+
+@dataclass
+class GenerationStats:
+    """One LLM call as seen by KoboldClient."""
+
+    caller: str
+    backend: str
+    streamed: bool
+    ok: bool
+    prompt_tokens: int
+    generated_tokens: int
+    ttft_ms: Optional[float]
+    total_ms: float
+    tokens_per_sec: Optional[float]
+
+    def as_dict(self) -> dict:
+        data = asdict(self)
+        for key in ("ttft_ms", "total_ms", "tokens_per_sec"):
+            if data[key] is not None:
+                data[key] = round(data[key], 2)
+        return data
+
+
+_llm_caller: ContextVar[str] = ContextVar("llm_caller", default="unknown")
+_generation_sink: ContextVar[Optional[list]] = ContextVar("generation_sink", default=None)
+
+
+@contextmanager
+def llm_caller(name: str) -> Iterator[None]:
+    """Tag LLM calls made inside the block (chat, planner, ...) for the generation metrics."""
+    token = _llm_caller.set(name)
+    try:
+        yield
+    finally:
+        _llm_caller.reset(token)
+
+
+def current_llm_caller() -> str:
+    return _llm_caller.get()
+
+
+@contextmanager
+def capture_generation_stats() -> Iterator[list[GenerationStats]]:
+    """Collect GenerationStats of the LLM calls made inside the block (including child tasks)."""
+    sink: list[GenerationStats] = []
+    token = _generation_sink.set(sink)
+    try:
+        yield sink
+    finally:
+        _generation_sink.reset(token)
+
+
+def record_generation(stats: GenerationStats):
+    registry = get_registry()
+    labels = {"caller": stats.caller}
+    registry.inc("llm_calls_total", {**labels, "outcome": "ok" if stats.ok else "error"})
+    registry.observe("llm_total_ms", stats.total_ms, labels)
+    if stats.ok:
+        registry.observe("llm_prompt_tokens", stats.prompt_tokens, labels)
+        registry.observe("llm_generated_tokens", stats.generated_tokens, labels)
+        if stats.ttft_ms is not None:
+            registry.observe("llm_ttft_ms", stats.ttft_ms, labels)
+        else:
+            # Non-streamed calls without KOBOLD_PERF_STATS: llm_ttft_ms covers streamed calls only.
+            registry.inc("llm_ttft_unmeasured_total", labels)
+        if stats.tokens_per_sec is not None:
+            registry.observe("llm_tokens_per_sec", stats.tokens_per_sec, labels)
+
+    sink = _generation_sink.get()
+    if sink is not None:
+        sink.append(stats)
@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+import hashlib
+import json
+import os
+import time
+
+from backend.core.services.sqlite_pool import get_connection_manager
+
+
+PLAN_CACHE_MEMORY_ENTRIES = int(os.getenv("PLANNER_CACHE_MEMORY_ENTRIES", "128"))
+PLAN_CACHE_TTL_SECONDS = float(os.getenv("PLANNER_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+
+def normalize_goal(goal: str) -> str:
+    # Only whitespace is normalized: goals often carry code, where case matters.
+    return " ".join((goal or "").split())
+
+
+class PlanCache:
+    """Two-tier cache for planner results: in-memory LRU in front of an SQLite table with TTL.
+
+    Entries are plain plan payloads (tool/language/code/timeout) keyed by the normalized goal,
+    planner prompt version and model id, so prompt or model changes never serve stale plans.
+    """
+
+    def __init__(
+        self,
+        db_path: Optional[Path] = None,
+        memory_entries: int = PLAN_CACHE_MEMORY_ENTRIES,
+        ttl_s: float = PLAN_CACHE_TTL_SECONDS,
+    ):
+        if db_path is None:
+            logs_dir = Path(__file__).resolve().parents[1] / "logs"
+            logs_dir.mkdir(parents=True, exist_ok=True)
+            db_path = logs_dir / "plan_cache.db"
+        self.db_path = db_path
+        self.ttl_s = float(ttl_s)
+        self._memory: "OrderedDict[str, tuple[float, dict]]" = OrderedDict()
+        self._memory_entries = max(1, int(memory_entries))
+        self._stats = {"memory_hits": 0, "sqlite_hits": 0, "misses": 0, "stores": 0, "expired": 0}
+        self._init_db()
+
+    def _db(self):
+        """Write transaction on the shared long-lived WAL connection of this database."""
+        return get_connection_manager(self.db_path).write()
+
+    def _read_db(self):
+        return get_connection_manager(self.db_path).read()
+
+    def _init_db(self):
+        with self._db() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS plan_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    goal TEXT NOT NULL,
+                    prompt_version TEXT NOT NULL,
+                    model_id TEXT NOT NULL,
+                    plan_json TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_plan_cache_expires ON plan_cache(expires_at)")
+
+    @staticmethod
+    def make_key(goal: str, prompt_version: str, model_id: str) -> str:
+        raw = f"{prompt_version}|{model_id}|{normalize_goal(goal)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, expires_at: float, plan: dict):
+        self._memory[key] = (expires_at, plan)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self._memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[dict]:
+        now = time.time()
+        cached = self._memory.get(key)
+        if cached is not None:
+            expires_at, plan = cached
+            if expires_at > now:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return dict(plan)
+            self._memory.pop(key, None)
+
+        with self._read_db() as conn:
+            row = conn.execute(
+                "SELECT plan_json, expires_at FROM plan_cache WHERE cache_key=?",
+                (key,),
+            ).fetchone()
+        if row is not None and float(row["expires_at"]) <= now:
+            with self._db() as conn:
+                conn.execute("DELETE FROM plan_cache WHERE cache_key=? AND expires_at<=?", (key, now))
+            self._stats["expired"] += 1
+            row = None
+
+        if row is None:
+            self._stats["misses"] += 1
+            return None
+
+        try:
+            plan = json.loads(row["plan_json"])
+        except json.JSONDecodeError:
+            self._stats["misses"] += 1
+            return None
+        self._remember(key, float(row["expires_at"]), plan)
+        self._stats["sqlite_hits"] += 1
+        return dict(plan)
+
+    def put(self, key: str, goal: str, prompt_version: str, model_id: str, plan: dict):
+        now = time.time()
+        expires_at = now + self.ttl_s
+        with self._db() as conn:
+            conn.execute(
+                """
+                INSERT INTO plan_cache (cache_key, goal, prompt_version, model_id, plan_json, created_at, expires_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(cache_key) DO UPDATE SET
+                    plan_json=excluded.plan_json,
+                    created_at=excluded.created_at,
+                    expires_at=excluded.expires_at
+                """,
+                (key, normalize_goal(goal), prompt_version, model_id, json.dumps(plan, ensure_ascii=False), now, expires_at),
+            )
+        self._remember(key, expires_at, dict(plan))
+        self._stats["stores"] += 1
+
+    def purge_expired(self) -> int:
+        with self._db() as conn:
+            cur = conn.execute("DELETE FROM plan_cache WHERE expires_at<=?", (time.time(),))
+            return cur.rowcount
+
+    def get_stats(self) -> dict:
+        lookups = self._stats["memory_hits"] + self._stats["sqlite_hits"] + self._stats["misses"]
+        hits = self._stats["memory_hits"] + self._stats["sqlite_hits"]
+        return {
+            **self._stats,
+            "memory_entries": len(self._memory),
+            "hit_rate": (hits / lookups) if lookups else None,
+        }
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from dataclasses import dataclass, field
+import asyncio
+import os
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+
+# A draft older than this is not trusted: memory may have changed since it was fetched.
+CHAT_PREFETCH_TTL_SECONDS = float(os.getenv("CHAT_PREFETCH_TTL_SECONDS", "30"))
+CHAT_PREFETCH_MAX_SLOTS = int(os.getenv("CHAT_PREFETCH_MAX_SLOTS", "16"))
+
+
+@dataclass
+class PrefetchSlot:
+    text: str
+    created_at: float
+    # Source name -> task producing exactly what prepare_chat_turn would have fetched itself.
+    tasks: Dict[str, asyncio.Task] = field(default_factory=dict)
+
+
+def _retrieve_exception(task: asyncio.Task):
+    # Nobody may ever await a superseded prefetch; keep asyncio from logging its error.
+    if not task.cancelled():
+        task.exception()
+
+
+class PrefetchCache:
+    """Short-lived per-session slots with context fetched while the user is still typing.
+
+    Each new draft replaces (and cancels) the previous one of the same slot. The chat turn
+    `take`s the slot only if its text matches the sent message; a slot is used at most once.
+    """
+
+    def __init__(self, ttl_s: float = CHAT_PREFETCH_TTL_SECONDS, max_slots: int = CHAT_PREFETCH_MAX_SLOTS):
+        self.ttl_s = float(ttl_s)
+        self.max_slots = max(1, int(max_slots))
+        self._slots: "OrderedDict[str, PrefetchSlot]" = OrderedDict()
+        self._stats = {"prefetches": 0, "unchanged": 0, "superseded": 0, "hits": 0, "misses": 0, "expired": 0}
+
+    @staticmethod
+    def _cancel(slot: PrefetchSlot):
+        for task in slot.tasks.values():
+            if not task.done():
+                task.cancel()
+
+    def _expired(self, slot: PrefetchSlot) -> bool:
+        return time.monotonic() - slot.created_at > self.ttl_s
+
+    def prefetch(self, slot_key: str, text: str, loaders: Dict[str, Callable[[], Awaitable]]) -> bool:
+        """Start loading `loaders` for the draft; returns False if the same draft is already prefetched."""
+        current = self._slots.get(slot_key)
+        if current is not None and current.text == text and not self._expired(current):
+            self._stats["unchanged"] += 1
+            return False
+        if current is not None:
+            self._cancel(current)
+            self._stats["superseded"] += 1
+
+        slot = PrefetchSlot(text=text, created_at=time.monotonic())
+        for name, loader in loaders.items():
+            task = asyncio.ensure_future(loader())
+            task.add_done_callback(_retrieve_exception)
+            slot.tasks[name] = task
+        self._slots[slot_key] = slot
+        self._slots.move_to_end(slot_key)
+        while len(self._slots) > self.max_slots:
+            _, evicted = self._slots.popitem(last=False)
+            self._cancel(evicted)
+        self._stats["prefetches"] += 1
+        return True
+
+    def take(self, slot_key: str, text: str) -> Optional[Dict[str, asyncio.Task]]:
+        """Prefetched tasks (possibly still running) for this exact message, or None."""
+        slot = self._slots.pop(slot_key, None)
+        if slot is None:
+            # No draft was prefetched for this slot (client without prefetch); not a miss.
+            return None
+        if slot.text != text:
+            self._cancel(slot)
+            self._stats["misses"] += 1
+            return None
+        if self._expired(slot):
+            self._cancel(slot)
+            self._stats["expired"] += 1
+            return None
+        self._stats["hits"] += 1
+        return slot.tasks
+
+    def get_stats(self) -> dict:
+        taken = self._stats["hits"] + self._stats["misses"] + self._stats["expired"]
+        return {
+            **self._stats,
+            "slots": len(self._slots),
+            "hit_rate": round(self._stats["hits"] / taken, 4) if taken else None,
+        }
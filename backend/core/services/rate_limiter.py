@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+import threading
+import time
+from typing import Dict, Iterable, Optional
+
+
+class SlidingWindowCounter:
+    """In-memory sliding-window counter of events per key (e.g. unsolicited proposals per user).
+
+    Events are tracked by id so they can be withdrawn again (a dismissed proposal no longer
+    counts). Per key the events are kept in time order; counting only drops expired events
+    from the front, so a check is O(1) amortized and never touches the database.
+    """
+
+    def __init__(self, window_s: float):
+        self.window_s = float(window_s)
+        self._events: Dict[str, "OrderedDict[str, float]"] = {}
+        self._lock = threading.Lock()
+
+    def seed(self, events: Iterable[tuple[str, str, float]]):
+        """Replace the state with (key, event_id, ts) tuples, e.g. loaded from SQLite at startup."""
+        with self._lock:
+            self._events = {}
+            for key, event_id, ts in sorted(events, key=lambda e: e[2]):
+                self._events.setdefault(key, OrderedDict())[event_id] = float(ts)
+
+    def add(self, key: str, event_id: str, ts: Optional[float] = None):
+        ts = time.time() if ts is None else float(ts)
+        with self._lock:
+            events = self._events.setdefault(key, OrderedDict())
+            events.pop(event_id, None)
+            last_ts = next(reversed(events.values()), None)
+            events[event_id] = ts
+            if last_ts is not None and ts < last_ts:
+                # Re-added older event (proposal reopened): restore time order, rare path.
+                self._events[key] = OrderedDict(sorted(events.items(), key=lambda item: item[1]))
+
+    def remove(self, key: str, event_id: str):
+        with self._lock:
+            events = self._events.get(key)
+            if events is not None:
+                events.pop(event_id, None)
+
+    def count(self, key: str, now: Optional[float] = None) -> int:
+        since = (time.time() if now is None else float(now)) - self.window_s
+        with self._lock:
+            events = self._events.get(key)
+            if not events:
+                return 0
+            while events and next(iter(events.values())) < since:
+                events.popitem(last=False)
+            return len(events)
@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from dataclasses import dataclass, field
+import hashlib
+import os
+import time
+import uuid
+from typing import Optional, Sequence
+
+import numpy as np
+
+
+# Opt-in: a cached answer is only correct while memory/profile stay the same, so it is off by default.
+RESPONSE_CACHE_ENABLED = os.getenv("CHAT_RESPONSE_CACHE_ENABLED", "0") == "1"
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("CHAT_RESPONSE_CACHE_SIMILARITY", "0.95"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("CHAT_RESPONSE_CACHE_MAX_ENTRIES", "256"))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("CHAT_RESPONSE_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+# Lookup budget for the query embedding; on timeout the turn just goes through the normal path.
+RESPONSE_CACHE_EMBED_TIMEOUT_SECONDS = float(os.getenv("CHAT_RESPONSE_CACHE_EMBED_TIMEOUT_SECONDS", "1.0"))
+
+
+def make_fingerprint(*parts) -> str:
+    """Everything besides the query that shapes the answer (modes, profile version, ...)."""
+    return hashlib.sha256("\x1f".join(str(p) for p in parts).encode("utf-8")).hexdigest()[:16]
+
+
+@dataclass
+class CachedResponse:
+    entry_id: str
+    fingerprint: str
+    query: str
+    response: str
+    embedding: np.ndarray
+    interaction_id: Optional[str]
+    context_ids: set[str] = field(default_factory=set)
+    created_at: float = 0.0
+    hits: int = 0
+
+
+class SemanticResponseCache:
+    """Answers to near-identical questions, matched by cosine similarity of the query embedding.
+
+    Entries only match within the same fingerprint. They are dropped when a memory they were
+    built from changes, when memories/facts are added (`clear`) and on negative feedback.
+    """
+
+    def __init__(
+        self,
+        similarity_threshold: float = RESPONSE_CACHE_SIMILARITY,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+        ttl_s: float = RESPONSE_CACHE_TTL_SECONDS,
+    ):
+        self.similarity_threshold = float(similarity_threshold)
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_s = float(ttl_s)
+        self._entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self._stats = {
+            "lookups": 0,
+            "hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evicted": 0,
+            "invalidated": 0,
+            "accepted_after_hit": 0,
+            "rejected_after_hit": 0,
+        }
+
+    @staticmethod
+    def _normalize(embedding: Sequence[float]) -> Optional[np.ndarray]:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        if vector.ndim != 1 or norm == 0.0:
+            return None
+        return vector / norm
+
+    def _expired(self, entry: CachedResponse, now: float) -> bool:
+        return self.ttl_s > 0 and now - entry.created_at > self.ttl_s
+
+    def lookup(self, embedding: Sequence[float], fingerprint: str) -> Optional[CachedResponse]:
+        self._stats["lookups"] += 1
+        query = self._normalize(embedding)
+        now = time.time()
+        candidates: list[CachedResponse] = []
+        if query is not None:
+            # A model switch on the embeddings service changes the dimension; old vectors never match.
+            candidates = [
+                e for e in self._entries.values()
+                if e.fingerprint == fingerprint and not self._expired(e, now) and e.embedding.shape == query.shape
+            ]
+        best: Optional[CachedResponse] = None
+        if candidates:
+            scores = np.stack([e.embedding for e in candidates]) @ query
+            index = int(np.argmax(scores))
+            if float(scores[index]) >= self.similarity_threshold:
+                best = candidates[index]
+        if best is None:
+            self._stats["misses"] += 1
+            return None
+        best.hits += 1
+        self._entries.move_to_end(best.entry_id)
+        self._stats["hits"] += 1
+        return best
+
+    def put(
+        self,
+        embedding: Sequence[float],
+        fingerprint: str,
+        query: str,
+        response: str,
+        interaction_id: Optional[str] = None,
+        context_ids: Sequence[str] = (),
+    ) -> Optional[CachedResponse]:
+        vector = self._normalize(embedding)
+        if vector is None:
+            return None
+        entry = CachedResponse(
+            entry_id=uuid.uuid4().hex,
+            fingerprint=fingerprint,
+            query=query,
+            response=response,
+            embedding=vector,
+            interaction_id=interaction_id,
+            context_ids={str(c) for c in context_ids if c},
+            created_at=time.time(),
+        )
+        self._entries[entry.entry_id] = entry
+        self._stats["stores"] += 1
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats["evicted"] += 1
+        return entry
+
+    def _drop(self, predicate) -> int:
+        doomed = [entry_id for entry_id, entry in self._entries.items() if predicate(entry)]
+        for entry_id in doomed:
+            del self._entries[entry_id]
+        self._stats["invalidated"] += len(doomed)
+        return len(doomed)
+
+    def invalidate_memory(self, memory_id: str) -> int:
+        """Drop answers built from (or stored as) the given memory item."""
+        return self._drop(lambda e: memory_id in e.context_ids or e.interaction_id == memory_id)
+
+    def record_feedback(self, interaction_id: str, helpful: bool) -> bool:
+        """Track accepted answers / regressions of served hits; negative feedback evicts the answer."""
+        entry = next((e for e in self._entries.values() if e.interaction_id == interaction_id), None)
+        if entry is None:
+            return False
+        if entry.hits:
+            self._stats["accepted_after_hit" if helpful else "rejected_after_hit"] += 1
+        if not helpful:
+            self._drop(lambda e: e.entry_id == entry.entry_id)
+        return True
+
+    def clear(self) -> int:
+        return self._drop(lambda _e: True)
+
+    def get_stats(self) -> dict:
+        lookups = self._stats["lookups"]
+        served = self._stats["accepted_after_hit"] + self._stats["rejected_after_hit"]
+        return {
+            **self._stats,
+            "entries": len(self._entries),
+            "hit_rate": round(self._stats["hits"] / lookups, 4) if lookups else None,
+            # Share of judged cache hits the user rejected: the regression signal for the threshold.
+            "hit_regression_rate": round(self._stats["rejected_after_hit"] / served, 4) if served else None,
+            "similarity_threshold": self.similarity_threshold,
+        }
@@ -1,6 +1,8 @@
 import os
 from typing import Any
 
+import numpy as np
+
 from backend.core.services.memory_engine import MemoryEngine
 
 
@@ -13,7 +15,9 @@ class LegacyMemoryRetriever:
     def __init__(self, memory_engine: MemoryEngine):
         self._memory_engine = memory_engine
 
-    async def search(self, query: str, limit: int = 10) -> list[dict[str, Any]]:
+    async def search(self, query: str, limit: int = 10, include_embeddings: bool = False) -> list[dict[str, Any]]:
+        if include_embeddings:
+            return await self._memory_engine.search(query, limit=limit, include_embeddings=True)
         return await self._memory_engine.search(query, limit=limit)
 
 
@@ -34,6 +38,7 @@ async def search_with_backend(
     query_text: str,
     limit: int = 10,
     multimodal_retriever: Any = None,
+    include_embeddings: bool = False,
 ) -> tuple[list[dict[str, Any]], str]:
     """Resolve active retrieval backend and execute search."""
 
@@ -41,4 +46,32 @@ async def search_with_backend(
         return await multimodal_retriever.search(query_text, limit=limit), "multimodal"
 
     legacy_retriever = LegacyMemoryRetriever(memory_engine)
-    return await legacy_retriever.search(query_text, limit=limit), "legacy"
+    return await legacy_retriever.search(query_text, limit=limit, include_embeddings=include_embeddings), "legacy"
+
+
+def mmr_select(items: list[dict[str, Any]], limit: int, lambda_: float) -> list[dict[str, Any]]:
+    """Maximal marginal relevance over retrieved items.
+
+    Relevance is the item's own `score` (min-max scaled), redundancy the highest cosine similarity
+    to an already selected item. Items without an `embedding` keep their retrieval order.
+    """
+
+    if limit <= 0 or len(items) <= 1 or any(item.get("embedding") is None for item in items):
+        return items[:limit] if limit > 0 else []
+
+    vectors = np.asarray([item["embedding"] for item in items], dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors = vectors / np.where(norms == 0, 1.0, norms)
+    scores = np.asarray([float(item.get("score") or 0.0) for item in items], dtype=np.float32)
+    spread = float(scores.max() - scores.min())
+    relevance = (scores - scores.min()) / spread if spread > 0 else np.ones_like(scores)
+
+    selected: list[int] = [int(np.argmax(relevance))]
+    remaining = [i for i in range(len(items)) if i != selected[0]]
+    while remaining and len(selected) < limit:
+        redundancy = (vectors[remaining] @ vectors[selected].T).max(axis=1)
+        marginal = lambda_ * relevance[remaining] - (1.0 - lambda_) * redundancy
+        best = remaining[int(np.argmax(marginal))]
+        selected.append(best)
+        remaining.remove(best)
+    return [items[i] for i in selected]
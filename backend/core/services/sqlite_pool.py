@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+from contextlib import contextmanager
+from pathlib import Path
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterator, Union
+
+
+# NORMAL is durable in WAL mode except for the last transactions before a power loss; no fsync per commit.
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL").upper()
+# Negative = KiB (PRAGMA cache_size semantics).
+SQLITE_CACHE_SIZE_KIB = int(os.getenv("SQLITE_CACHE_SIZE_KIB", "4096"))
+SQLITE_STATEMENT_CACHE_SIZE = int(os.getenv("SQLITE_STATEMENT_CACHE_SIZE", "256"))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+
+class SQLiteConnectionManager:
+    """Long-lived connections to one SQLite file in WAL mode.
+
+    Single writer, many readers: all writes go through one connection under a lock (SQLite allows
+    one writer anyway, so waiting on the lock replaces busy retries), reads use a per-thread
+    connection and never block on the writer. Both are plain blocking calls, safe from the event
+    loop thread and from `asyncio.to_thread` workers alike, as long as no `await` happens inside.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = str(path)
+        self._write_lock = threading.RLock()
+        self._writer: sqlite3.Connection | None = None
+        self._local = threading.local()
+        self._readers: list[sqlite3.Connection] = []
+        self._readers_lock = threading.Lock()
+        self._stats = {"writes": 0, "reads": 0, "connections_opened": 0}
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path,
+            check_same_thread=False,
+            cached_statements=SQLITE_STATEMENT_CACHE_SIZE,
+            timeout=SQLITE_BUSY_TIMEOUT_MS / 1000.0,
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        conn.execute(f"PRAGMA cache_size={-abs(SQLITE_CACHE_SIZE_KIB)}")
+        self._stats["connections_opened"] += 1
+        return conn
+
+    @contextmanager
+    def write(self) -> Iterator[sqlite3.Connection]:
+        """Writer connection; commits on success, rolls back on error (like `with sqlite3.connect(...)`)."""
+        with self._write_lock:
+            if self._writer is None:
+                self._writer = self._connect()
+            conn = self._writer
+            self._stats["writes"] += 1
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            else:
+                conn.commit()
+
+    @contextmanager
+    def read(self) -> Iterator[sqlite3.Connection]:
+        """Per-thread reader connection; sees everything committed before the call."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+            with self._readers_lock:
+                self._readers.append(conn)
+        self._stats["reads"] += 1
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+
+    def data_version(self) -> tuple[int, int]:
+        """(reader id, `PRAGMA data_version`) on this thread's reader, without the write lock.
+
+        The reader is a separate connection, so the version changes on every commit, including
+        those made through this manager's writer. Values are per connection and only comparable
+        together with the reader id.
+        """
+        with self.read() as conn:
+            return id(conn), int(conn.execute("PRAGMA data_version").fetchone()[0])
+
+    def close(self):
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        with self._readers_lock:
+            for conn in self._readers:
+                conn.close()
+            self._readers.clear()
+        self._local = threading.local()
+
+    def get_stats(self) -> dict:
+        return {**self._stats, "path": self.path, "readers": len(self._readers)}
+
+
+_managers: Dict[str, SQLiteConnectionManager] = {}
+_managers_lock = threading.Lock()
+
+
+def get_connection_manager(path: Union[str, Path]) -> SQLiteConnectionManager:
+    """One manager per database file, shared by every component that opens it."""
+    key = str(Path(path).resolve())
+    with _managers_lock:
+        manager = _managers.get(key)
+        if manager is None:
+            manager = _managers[key] = SQLiteConnectionManager(key)
+        return manager
+
+
+def close_all_connections():
+    with _managers_lock:
+        managers = list(_managers.values())
+        _managers.clear()
+    for manager in managers:
+        manager.close()
@@ -1,9 +1,29 @@
+from collections import deque
 import json
 import os
 import re
-from dataclasses import dataclass
+import time
+from dataclasses import asdict, dataclass
 
 from backend.core.services.kobold_client import KoboldClient
+from backend.core.services.llm_scheduler import LLMPriority, LLMScheduler
+from backend.core.services.metrics import llm_caller
+from backend.core.services.plan_cache import PlanCache
+
+
+# Bump whenever the planner prompt or output parsing changes: cached plans are keyed by it.
+PLANNER_PROMPT_VERSION = "planner-v2-gbnf"
+
+# GBNF for the plan object. Key order is fixed, so the model cannot wander off after the
+# closing brace and generation ends as soon as the JSON is complete.
+PLAN_GRAMMAR = r"""
+root     ::= "{" ws "\"tool\":" ws "\"sandbox.execute\"" ws "," ws "\"language\":" ws language ws "," ws "\"code\":" ws string ws "," ws "\"timeout\":" ws timeout ws "}"
+language ::= "\"python\"" | "\"javascript\"" | "\"bash\""
+string   ::= "\"" ( [^"\\\x00-\x1F] | "\\" ( ["\\/bfnrt] | "u" hex hex hex hex ) )* "\""
+hex      ::= [0-9a-fA-F]
+timeout  ::= [1-9] [0-9]? [0-9]?
+ws       ::= [ ]?
+""".strip()
 
 
 @dataclass
@@ -28,6 +48,29 @@ class TaskPlanner:
 
     def __init__(self):
         self.kobold = KoboldClient()
+        # Shared LLM scheduler, attached by the app lifespan; planner calls then yield to chat turns.
+        self.scheduler: LLMScheduler | None = None
+        # Shared plan cache, attached by the app lifespan; without it every run asks the LLM.
+        self.plan_cache: PlanCache | None = None
+        self._llm_latency_ms: deque = deque(maxlen=200)
+        self._counters = {
+            "plans_total": 0,
+            "llm_plans": 0,
+            "cache_hits": 0,
+            "guarded_plans": 0,
+            "fallback_llm_error": 0,
+            "fallback_parse_error": 0,
+        }
+
+    async def _generate(self, messages: list[dict], **kwargs) -> str:
+        with llm_caller("planner"):
+            if self.scheduler is None:
+                return await self.kobold.generate(messages, **kwargs)
+            return await self.scheduler.run(
+                lambda: self.kobold.generate(messages, **kwargs),
+                priority=LLMPriority.PLANNER,
+                on_cancel=self.kobold.abort,
+            )
 
     def _infer_language(self, goal: str) -> str:
         lowered = goal.lower()
@@ -118,24 +161,56 @@ class TaskPlanner:
             raise ValueError("json payload not found")
         return json.loads(match.group(0))
 
-    async def build_plan(self, goal: str) -> TaskExecutionPlan:
+    def _plan_from_payload(self, payload: dict) -> TaskExecutionPlan:
+        language = str(payload.get("language", "")).strip().lower()
+        if language not in {"python", "javascript", "bash"}:
+            raise ValueError(f"unsupported language: {language}")
+        tool = str(payload.get("tool", "sandbox.execute")).strip() or "sandbox.execute"
+        if tool != "sandbox.execute":
+            tool = "sandbox.execute"
+        code = str(payload.get("code", "")).strip()
+        if not code:
+            raise ValueError("empty code")
+        timeout_raw = int(payload.get("timeout", 30))
+        timeout = max(1, min(120, timeout_raw))
+        return TaskExecutionPlan(tool=tool, language=language, code=code, timeout=timeout)
+
+    async def build_plan(self, goal: str, bypass_cache: bool = False) -> TaskExecutionPlan:
+        self._counters["plans_total"] += 1
         raw_goal = (goal or "").strip()
         if not raw_goal:
             return self._heuristic_plan(goal)
 
         safe_termux_plan = self._safe_termux_install_plan(raw_goal)
         if safe_termux_plan is not None:
+            self._counters["guarded_plans"] += 1
             return safe_termux_plan
 
+        cache_key = None
+        model_id = ""
+        if self.plan_cache is not None:
+            model_id = await self.kobold.get_model_id()
+            cache_key = self.plan_cache.make_key(raw_goal, PLANNER_PROMPT_VERSION, model_id)
+            cached = None if bypass_cache else self.plan_cache.get(cache_key)
+            if cached is not None:
+                try:
+                    plan = TaskExecutionPlan(**cached)
+                except TypeError:
+                    pass
+                else:
+                    self._counters["cache_hits"] += 1
+                    return plan
+
         prompt = (
             "You are a task planner for a sandbox executor. "
-            "Return ONLY valid JSON with keys: tool, language, code, timeout. "
-            "tool must be sandbox.execute. language must be one of python/javascript/bash. "
-            "timeout must be integer 1..120. code must contain runnable code only."
+            "Return JSON with keys: tool, language, code, timeout. "
+            "tool is sandbox.execute, language is python/javascript/bash, "
+            "timeout is integer 1..120, code is runnable code only."
         )
 
+        started = time.perf_counter()
         try:
-            output = await self.kobold.generate(
+            output = await self._generate(
                 [
                     {"role": "system", "content": prompt},
                     {"role": "user", "content": f"Goal:\n{raw_goal}"},
@@ -143,19 +218,46 @@ class TaskPlanner:
                 max_tokens=220,
                 temperature=0.0,
                 top_p=0.9,
+                grammar=PLAN_GRAMMAR,
             )
-            payload = self._extract_json(output)
-            language = str(payload.get("language", "")).strip().lower()
-            if language not in {"python", "javascript", "bash"}:
-                raise ValueError(f"unsupported language: {language}")
-            tool = str(payload.get("tool", "sandbox.execute")).strip() or "sandbox.execute"
-            if tool != "sandbox.execute":
-                tool = "sandbox.execute"
-            code = str(payload.get("code", "")).strip()
-            if not code:
-                raise ValueError("empty code")
-            timeout_raw = int(payload.get("timeout", 30))
-            timeout = max(1, min(120, timeout_raw))
-            return TaskExecutionPlan(tool=tool, language=language, code=code, timeout=timeout)
         except Exception:
+            self._counters["fallback_llm_error"] += 1
             return self._heuristic_plan(raw_goal)
+        finally:
+            self._llm_latency_ms.append((time.perf_counter() - started) * 1000.0)
+
+        try:
+            # The grammar makes the output a bare JSON object; _extract_json still copes with
+            # servers that ignore the grammar field.
+            plan = self._plan_from_payload(self._extract_json(output))
+        except (ValueError, TypeError, AttributeError):
+            # Heuristic fallbacks are not cached so the LLM plan replaces them once KoboldCpp is back.
+            self._counters["fallback_parse_error"] += 1
+            return self._heuristic_plan(raw_goal)
+
+        self._counters["llm_plans"] += 1
+        if cache_key is not None:
+            self.plan_cache.put(cache_key, raw_goal, PLANNER_PROMPT_VERSION, model_id, asdict(plan))
+        return plan
+
+    def get_metrics(self) -> dict:
+        latencies = sorted(self._llm_latency_ms)
+
+        def _pct(q: float):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))], 2)
+
+        llm_attempts = (
+            self._counters["llm_plans"]
+            + self._counters["fallback_llm_error"]
+            + self._counters["fallback_parse_error"]
+        )
+        fallbacks = self._counters["fallback_llm_error"] + self._counters["fallback_parse_error"]
+        return {
+            **self._counters,
+            "fallback_rate": (fallbacks / llm_attempts) if llm_attempts else None,
+            "llm_latency_ms_p50": _pct(0.5),
+            "llm_latency_ms_p95": _pct(0.95),
+            "prompt_version": PLANNER_PROMPT_VERSION,
+        }
@@ -8,9 +8,12 @@ import hashlib
 import json
 import re
 import sqlite3
+import threading
 import time
 import uuid
 
+from backend.core.services.sqlite_pool import get_connection_manager
+
 
 class TaskStatus(str, Enum):
     PENDING = "PENDING"
@@ -64,6 +67,8 @@ class TaskRunner:
 
     def __init__(self):
         self.tasks: Dict[str, TaskRecord] = {}
+        # Guards task.events: retention trims them from a worker thread while the loop appends.
+        self._events_lock = threading.Lock()
         logs_dir = Path(__file__).resolve().parents[1] / "logs"
         logs_dir.mkdir(parents=True, exist_ok=True)
         self.log_path = logs_dir / "task_audit.log"
@@ -71,10 +76,12 @@ class TaskRunner:
         self.db_path = logs_dir / "tasks.db"
         self._init_db()
 
-    def _db(self) -> sqlite3.Connection:
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        return conn
+    def _db(self):
+        """Write transaction on the shared long-lived WAL connection of this database."""
+        return get_connection_manager(self.db_path).write()
+
+    def _read_db(self):
+        return get_connection_manager(self.db_path).read()
 
     def _init_db(self):
         with self._db() as conn:
@@ -247,7 +254,7 @@ class TaskRunner:
 
     def load_state(self):
         loaded_tasks: Dict[str, TaskRecord] = {}
-        with self._db() as conn:
+        with self._read_db() as conn:
             rows = conn.execute(
                 """
                 SELECT task_id, goal, status, attempt, max_attempts, created_at, updated_at,
@@ -324,10 +331,24 @@ class TaskRunner:
         if migrated:
             self.save_state()
 
+    def trim_events(self, before_ts: Optional[float], keep_last: int = 0):
+        """Drop in-memory events the retention job removed from task_events (same age/count rule).
+
+        Keeps save_state from writing archived events back into the table. Runs in the retention
+        worker thread, so the swap happens under the same lock as the append in _event.
+        """
+        with self._events_lock:
+            for task in list(self.tasks.values()):
+                events = task.events[-keep_last:] if keep_last > 0 else task.events
+                if before_ts is not None:
+                    events = [e for e in events if e.ts >= before_ts]
+                task.events = list(events)
+
     def _event(self, rec: TaskRecord, kind: str, message: str, payload: Optional[dict] = None):
         rec.updated_at = time.time()
         event = TaskEvent(ts=rec.updated_at, kind=kind, message=message, payload=payload or {})
-        rec.events.append(event)
+        with self._events_lock:
+            rec.events.append(event)
         self._audit(rec.task_id, kind, message, payload or {})
         with self._db() as conn:
             self._upsert_task(conn, rec)
@@ -449,7 +470,7 @@ class TaskRunner:
         return items[: max(1, min(limit, 200))]
 
     def _load_task_from_db(self, task_id: str) -> Optional[TaskRecord]:
-        with self._db() as conn:
+        with self._read_db() as conn:
             row = conn.execute(
                 """
                 SELECT task_id, goal, status, attempt, max_attempts, created_at, updated_at,
@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+import asyncio
+import hashlib
+import math
+import os
+import time
+from typing import Iterable, Optional
+
+import httpx
+
+
+KOBOLD_URL = os.getenv("KOBOLD_URL", "http://localhost:5001")
+TOKEN_COUNT_CACHE_SIZE = int(os.getenv("TOKEN_COUNT_CACHE_SIZE", "4096"))
+# After a failed remote count, use the local estimate for this long before asking KoboldCpp again.
+TOKEN_COUNT_RETRY_SECONDS = float(os.getenv("TOKEN_COUNT_RETRY_SECONDS", "30"))
+# Chars per token on llama-family tokenizers, rounded down so the estimate errs high: ASCII text
+# averages ~4, Cyrillic and other non-Latin scripts split into far more pieces (~2 or less).
+ESTIMATE_CHARS_PER_TOKEN = 3.0
+ESTIMATE_NON_ASCII_CHARS_PER_TOKEN = 1.5
+
+
+def estimate_tokens(text: str) -> int:
+    """Local estimate used when KoboldCpp token counting is unavailable; errs high for both scripts."""
+    if not text:
+        return 0
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    ascii_chars = len(text) - non_ascii
+    return max(1, math.ceil(ascii_chars / ESTIMATE_CHARS_PER_TOKEN + non_ascii / ESTIMATE_NON_ASCII_CHARS_PER_TOKEN))
+
+
+class TokenCounter:
+    """Token counts from KoboldCpp's /api/extra/tokencount with a local LRU cache.
+
+    `kobold` (e.g. the pool's RoutedKoboldClient) makes counts follow routing: its `base_url` is
+    read per request. Without `kobold` and `base_url` the counter only estimates locally.
+    """
+
+    def __init__(
+        self,
+        base_url: Optional[str] = KOBOLD_URL,
+        cache_size: int = TOKEN_COUNT_CACHE_SIZE,
+        client: Optional[httpx.AsyncClient] = None,
+        kobold=None,
+    ):
+        self.kobold = kobold
+        self._base_url = base_url.rstrip("/") if base_url else None
+        remote = kobold is not None or self._base_url is not None
+        self.client = client or (httpx.AsyncClient(timeout=httpx.Timeout(5.0, connect=1.0)) if remote else None)
+        self._cache: "OrderedDict[bytes, int]" = OrderedDict()
+        self._cache_size = max(1, int(cache_size))
+        self._remote_disabled_until = 0.0
+        self._stats = {"cache_hits": 0, "remote_counts": 0, "estimated_counts": 0, "remote_failures": 0}
+
+    @property
+    def base_url(self) -> Optional[str]:
+        if self.kobold is not None:
+            return self.kobold.base_url.rstrip("/")
+        return self._base_url
+
+    @staticmethod
+    def _key(text: str) -> bytes:
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+    async def count(self, text: str) -> int:
+        text = text or ""
+        if not text:
+            return 0
+
+        key = self._key(text)
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            self._stats["cache_hits"] += 1
+            return cached
+
+        value = await self._count_remote(text)
+        if value is None:
+            # Estimates are not cached so the exact count replaces them once KoboldCpp is back.
+            self._stats["estimated_counts"] += 1
+            return estimate_tokens(text)
+
+        self._cache[key] = value
+        while len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+        return value
+
+    async def count_many(self, texts: Iterable[str]) -> list[int]:
+        """Counts for several texts; cache misses are sent concurrently (KoboldCpp has no batch endpoint)."""
+        texts = list(texts)
+        unique = list(dict.fromkeys(t or "" for t in texts))
+        counts = dict(zip(unique, await asyncio.gather(*(self.count(t) for t in unique))))
+        return [counts[t or ""] for t in texts]
+
+    async def _count_remote(self, text: str) -> Optional[int]:
+        base_url = self.base_url
+        if self.client is None or base_url is None or time.monotonic() < self._remote_disabled_until:
+            return None
+        try:
+            response = await self.client.post(f"{base_url}/api/extra/tokencount", json={"prompt": text})
+            response.raise_for_status()
+            value = int(response.json()["value"])
+        except Exception:
+            self._stats["remote_failures"] += 1
+            self._remote_disabled_until = time.monotonic() + TOKEN_COUNT_RETRY_SECONDS
+            return None
+        self._stats["remote_counts"] += 1
+        return value
+
+    async def truncate(self, text: str, max_tokens: int) -> str:
+        """Cut text so that it fits into max_tokens (proportional cut, re-checked a few times)."""
+        if max_tokens <= 0:
+            return ""
+        current = await self.count(text)
+        attempts = 0
+        while current > max_tokens and text and attempts < 4:
+            keep_chars = int(len(text) * max_tokens / current * 0.95)
+            text = text[:max(0, keep_chars)].rstrip()
+            current = await self.count(text)
+            attempts += 1
+        return text if current <= max_tokens else ""
+
+    def get_stats(self) -> dict:
+        return {
+            **self._stats,
+            "cache_size": len(self._cache),
+            "remote_available": self.client is not None and time.monotonic() >= self._remote_disabled_until,
+        }
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
@@ -21,7 +21,7 @@ from backend.core.services.task_runner import TaskRunner
 
 
 class FakeMemoryEngine:
-    async def search(self, query: str, limit: int = 5):
+    async def search(self, query: str, limit: int = 5, **_kwargs):
         return []
 
     async def add_interaction(self, query: str, response: str, context_used):
@@ -39,6 +39,23 @@ class FakeCompanionMemory:
         ]
 
 
+def test_build_memory_context_items_uses_mmr_when_embeddings_present():
+    items = [
+        {"content": "Termux ставится из F-Droid", "score": 0.9, "embedding": [1.0, 0.0]},
+        {"content": "Termux лучше ставить из F-Droid", "score": 0.89, "embedding": [0.98, 0.1]},
+        {"content": "Модель Kobold лежит в ~/models", "score": 0.6, "embedding": [0.0, 1.0]},
+    ]
+
+    assert build_memory_context_items(items, limit=2) == [
+        "Termux ставится из F-Droid",
+        "Termux лучше ставить из F-Droid",
+    ]
+    assert build_memory_context_items(items, limit=2, mmr_lambda=0.5) == [
+        "Termux ставится из F-Droid",
+        "Модель Kobold лежит в ~/models",
+    ]
+
+
 def test_serialize_messages_with_pydantic_v2_models():
     msgs = [ChatMessage(role="user", content="hello")]
     data = serialize_messages(msgs)
@@ -430,3 +447,622 @@ def test_chat_autonomy_can_be_disabled_per_request(monkeypatch):
     assert response.status_code == 200
     body = response.json()
     assert body.get("autonomous") is None
+
+
+def test_chat_stream_emits_tokens_then_persists_and_traces(monkeypatch):
+    app = FastAPI()
+    app.include_router(chat_router.router, prefix="/api/chat")
+    app.state.companion_state = CompanionState()
+    app.state.companion_memory = FakeCompanionMemory()
+
+    persisted = {}
+
+    class RecordingMemoryEngine(FakeMemoryEngine):
+        async def add_interaction(self, query: str, response: str, context_used):
+            persisted["response"] = response
+            return "interaction_1"
+
+    app.state.memory_engine = RecordingMemoryEngine()
+
+    async def fake_generate_stream(messages, max_tokens=512, temperature=0.7):
+        for token in ["Воз", "можно", " так"]:
+            yield token
+
+    monkeypatch.setattr(chat_router.kobold, "generate_stream", fake_generate_stream)
+
+    client = TestClient(app)
+    response = client.post(
+        "/api/chat/stream",
+        json={"messages": [{"role": "user", "content": "Привет"}], "autonomous_mode": "off"},
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    body = response.text
+    assert body.count("event: token") == 3
+    assert body.rstrip().split("\n\n")[-1].startswith("event: done")
+    assert persisted["response"] == "Возможно так"
+    trace = app.state.companion_state.get_last_trace()
+    assert trace is not None
+    assert "hypothesis_present" in trace.uncertainty_markers
+
+
+class WordCounter:
+    """Deterministic token counter for budget tests: one token per whitespace-separated word."""
+
+    async def count(self, text: str) -> int:
+        return len((text or "").split())
+
+    async def count_many(self, texts) -> list[int]:
+        return [len((text or "").split()) for text in texts]
+
+    async def truncate(self, text: str, max_tokens: int) -> str:
+        return " ".join(text.split()[:max(0, max_tokens)])
+
+
+def test_allocate_prompt_budget_prioritizes_policy_latest_and_context_over_history():
+    import asyncio
+
+    from backend.core.routers.chat import PromptBlocks, PromptBudget, allocate_prompt_budget, assemble_prompt_messages
+
+    history = [ChatMessage(role="user" if i % 2 == 0 else "assistant", content=f"h{i} " + "x " * 20) for i in range(10)]
+    blocks = PromptBlocks(
+        policy=[ChatMessage(role="system", content="policy " * 10)],
+        memory=ChatMessage(role="system", content="memory " * 500),
+        history=history,
+        latest=[ChatMessage(role="user", content="latest question")],
+    )
+    budget = PromptBudget(context_tokens=400, memory_share=0.25)
+
+    allocated, usage = asyncio.run(allocate_prompt_budget(blocks, WordCounter(), budget, max_new_tokens=100))
+    messages = assemble_prompt_messages(allocated)
+
+    assert messages[0].content.startswith("policy")
+    assert messages[-1].content == "latest question"
+    assert messages[-2].content.startswith("memory")
+    assert usage["memory"] <= int((usage["budget"] - usage["policy"] - usage["latest"]) * 0.25)
+    assert usage["total"] <= usage["budget"]
+    assert 0 < len(allocated.history) < len(history)
+    assert allocated.history[-1].content == history[-1].content
+    assert usage["history_dropped"] == len(history) - len(allocated.history)
+
+
+def test_prefix_stable_layout_keeps_history_prefix_across_turns(monkeypatch):
+    app = FastAPI()
+    app.include_router(chat_router.router, prefix="/api/chat")
+    app.state.companion_state = CompanionState()
+    app.state.companion_memory = FakeCompanionMemory()
+    app.state.token_counter = WordCounter()
+
+    class TurnMemoryEngine(FakeMemoryEngine):
+        async def search(self, query: str, limit: int = 5, **_kwargs):
+            return [{"id": "m1", "content": f"контекст для {query}"}]
+
+    app.state.memory_engine = TurnMemoryEngine()
+    prompts: list[str] = []
+
+    async def fake_generate(messages, max_tokens=512, temperature=0.7):
+        prompts.append(chat_router.kobold._format_messages(messages))
+        return "ok"
+
+    monkeypatch.setattr(chat_router.kobold, "generate", fake_generate)
+    client = TestClient(app)
+
+    history = [{"role": "user", "content": "первый вопрос"}, {"role": "assistant", "content": "первый ответ"}]
+    for question in ["второй вопрос", "третий вопрос"]:
+        response = client.post(
+            "/api/chat/",
+            json={
+                "messages": [*history, {"role": "user", "content": question}],
+                "autonomous_mode": "off",
+                "prompt_layout": "prefix_stable",
+            },
+        )
+        assert response.status_code == 200
+        history += [{"role": "user", "content": question}, {"role": "assistant", "content": "ok"}]
+
+    first, second = prompts
+    stable_prefix = first.split("System: Политика поведения")[0]
+    assert "User: первый вопрос" in stable_prefix
+    assert second.startswith(stable_prefix)
+    assert second.index("Релевантный контекст") > second.index("Assistant: ok")
+
+
+def test_chat_gathers_sources_concurrently_and_drops_slow_ones(monkeypatch):
+    import asyncio
+    import time
+
+    class SlowMemoryEngine(FakeMemoryEngine):
+        async def search(self, query: str, limit: int = 5, **_kwargs):
+            await asyncio.sleep(0.3)
+            return [{"content": "too late"}]
+
+    async def slow_web_search(query: str, limit: int = 3):
+        await asyncio.sleep(0.2)
+        return [{"title": "T", "snippet": "fresh web snippet", "url": "https://example.org"}]
+
+    captured = {}
+
+    async def fake_generate(messages, max_tokens=512, temperature=0.7):
+        captured["messages"] = messages
+        return "ok"
+
+    app = FastAPI()
+    app.include_router(chat_router.router, prefix="/api/chat")
+    app.state.memory_engine = SlowMemoryEngine()
+    app.state.companion_state = CompanionState()
+    app.state.companion_memory = FakeCompanionMemory()
+    monkeypatch.setattr(chat_router.kobold, "generate", fake_generate)
+    monkeypatch.setattr(chat_router, "web_search", slow_web_search)
+    monkeypatch.setenv("ENABLE_ONLINE_TOOLS", "1")
+    monkeypatch.setenv("CHAT_AUTONOMY_ENABLED", "0")
+    monkeypatch.setitem(chat_router.CONTEXT_SOURCE_DEADLINES_S, "memory", 0.25)
+    monkeypatch.setitem(chat_router.CONTEXT_SOURCE_DEADLINES_S, "web", 1.0)
+
+    client = TestClient(app)
+    started = time.perf_counter()
+    response = client.post(
+        "/api/chat/",
+        json={"messages": [{"role": "user", "content": "web: news"}], "use_memory": True},
+    )
+    elapsed = time.perf_counter() - started
+
+    assert response.status_code == 200
+    # Sequential gathering would take memory deadline + web latency (~0.45 s).
+    assert elapsed < 0.4
+    contents = "\n".join(m["content"] for m in captured["messages"])
+    assert "fresh web snippet" in contents
+    assert "too late" not in contents
+
+    sources = app.state.companion_state.get_last_trace().context_sources
+    assert sources["memory"]["status"] == "timeout"
+    assert sources["memory"]["used"] is False
+    assert sources["web"]["status"] == "ok"
+    assert sources["web"]["used"] is True
+    assert sources["facts"]["used"] is True
+
+
+def test_blocking_chroma_query_runs_off_the_loop_and_respects_the_deadline(monkeypatch):
+    import asyncio
+    import time
+
+    from backend.core.services.memory_engine import MemoryEngine
+
+    class BlockingCollection:
+        def query(self, **_kwargs):
+            # Chroma embeds the query and runs the ANN search synchronously.
+            time.sleep(0.3)
+            return {"ids": [["m1"]], "documents": [["too late"]], "metadatas": [[{}]], "distances": [[0.1]]}
+
+        def add(self, **_kwargs):
+            return None
+
+    engine = MemoryEngine()
+    engine.chroma_available = True
+    engine.collection = BlockingCollection()
+
+    async def slow_web_search(query: str, limit: int = 3):
+        await asyncio.sleep(0.2)
+        return [{"title": "T", "snippet": "fresh web snippet", "url": "https://example.org"}]
+
+    async def fake_generate(messages, max_tokens=512, temperature=0.7):
+        return "ok"
+
+    app = FastAPI()
+    app.include_router(chat_router.router, prefix="/api/chat")
+    app.state.memory_engine = engine
+    app.state.companion_state = CompanionState()
+    app.state.companion_memory = FakeCompanionMemory()
+    monkeypatch.setattr(chat_router.kobold, "generate", fake_generate)
+    monkeypatch.setattr(chat_router, "web_search", slow_web_search)
+    monkeypatch.setenv("ENABLE_ONLINE_TOOLS", "1")
+    monkeypatch.setenv("CHAT_AUTONOMY_ENABLED", "0")
+    monkeypatch.setitem(chat_router.CONTEXT_SOURCE_DEADLINES_S, "memory", 0.1)
+    monkeypatch.setitem(chat_router.CONTEXT_SOURCE_DEADLINES_S, "web", 1.0)
+
+    client = TestClient(app)
+    started = time.perf_counter()
+    response = client.post("/api/chat/", json={"messages": [{"role": "user", "content": "web: news"}]})
+    elapsed = time.perf_counter() - started
+    assert response.status_code == 200
+
+    sources = app.state.companion_state.get_last_trace().context_sources
+    assert sources["memory"]["status"] == "timeout"
+    assert sources["memory"]["ms"] < 0.25 * 1000
+    assert sources["web"]["status"] == "ok"
+    # On the loop the query would block web for 0.3 s before its own 0.2 s even started.
+    assert sources["web"]["ms"] < 0.28 * 1000
+    assert elapsed < 0.5
+
+
+def test_chat_session_sends_only_new_turn_and_keeps_history(tmp_path, monkeypatch):
+    from backend.core.services.conversation_store import ConversationStore
+
+    app = FastAPI()
+    app.include_router(chat_router.router, prefix="/api/chat")
+    app.state.memory_engine = FakeMemoryEngine()
+    app.state.conversation_store = ConversationStore(db_path=tmp_path / "conversations.db")
+    captured = []
+
+    async def fake_generate(messages, max_tokens=512, temperature=0.7):
+        captured.append(messages)
+        return f"ответ {len(captured)}"
+
+    monkeypatch.setattr(chat_router.kobold, "generate", fake_generate)
+    monkeypatch.setenv("CHAT_AUTONOMY_ENABLED", "0")
+    client = TestClient(app)
+
+    session_id = client.post("/api/chat/sessions", json={"title": "t"}).json()["session_id"]
+    for text in ("первый вопрос", "второй вопрос"):
+        response = client.post(
+            "/api/chat/",
+            json={"session_id": session_id, "use_memory": False, "messages": [{"role": "user", "content": text}]},
+        )
+        assert response.status_code == 200
+        assert response.json()["session_id"] == session_id
+
+    second_prompt = [m["content"] for m in captured[1] if m["role"] != "system"]
+    assert second_prompt == ["первый вопрос", "ответ 1", "второй вопрос"]
+
+    resumed = client.get(f"/api/chat/sessions/{session_id}").json()
+    assert resumed["message_count"] == 4
+    assert [m["content"] for m in resumed["messages"]][-1] == "ответ 2"
+
+    missing = client.post(
+        "/api/chat/",
+        json={"session_id": "conv_missing", "messages": [{"role": "user", "content": "x"}]},
+    )
+    assert missing.status_code == 404
+
+
+def test_chat_session_ignores_a_resent_transcript(tmp_path, monkeypatch):
+    from backend.core.services.conversation_store import ConversationStore
+
+    app = FastAPI()
+    app.include_router(chat_router.router, prefix="/api/chat")
+    app.state.memory_engine = FakeMemoryEngine()
+    app.state.conversation_store = ConversationStore(db_path=tmp_path / "conversations.db")
+    captured = []
+
+    async def fake_generate(messages, max_tokens=512, temperature=0.7):
+        captured.append(messages)
+        return f"ответ {len(captured)}"
+
+    monkeypatch.setattr(chat_router.kobold, "generate", fake_generate)
+    monkeypatch.setenv("CHAT_AUTONOMY_ENABLED", "0")
+    client = TestClient(app)
+
+    session_id = client.post("/api/chat/sessions", json={"title": "t"}).json()["session_id"]
+    transcript = [{"role": "user", "content": "первый вопрос"}]
+    for text in ("второй вопрос", "третий вопрос"):
+        response = client.post(
+            "/api/chat/",
+            json={"session_id": session_id, "use_memory": False, "messages": transcript},
+        )
+        assert response.status_code == 200
+        transcript += [{"role": "assistant", "content": response.json()["response"]}, {"role": "user", "content": text}]
+    client.post("/api/chat/", json={"session_id": session_id, "use_memory": False, "messages": transcript})
+
+    third_prompt = [m["content"] for m in captured[2] if m["role"] != "system"]
+    assert third_prompt == ["первый вопрос", "ответ 1", "второй вопрос", "ответ 2", "третий вопрос"]
+    stored = client.get(f"/api/chat/sessions/{session_id}").json()
+    assert [m["content"] for m in stored["messages"]] == third_prompt + ["ответ 3"]
+
+
+def test_chat_session_history_uses_rolling_summary(tmp_path, monkeypatch):
+    from backend.core.services.conversation_store import ConversationStore
+
+    app = FastAPI()
+    app.include_router(chat_router.router, prefix="/api/chat")
+    app.state.memory_engine = FakeMemoryEngine()
+    store = ConversationStore(db_path=tmp_path / "conversations.db")
+    app.state.conversation_store = store
+    session = store.create_session()
+    store.append_messages(session.session_id, [("user", "старый вопрос"), ("assistant", "старый ответ")])
+    store.append_messages(session.session_id, [("user", "свежий вопрос"), ("assistant", "свежий ответ")])
+    store.save_summary(session.session_id, "- пользователь спрашивал про старое", covered_seq=1)
+    captured = {}
+
+    async def fake_generate(messages, max_tokens=512, temperature=0.7):
+        captured["messages"] = messages
+        return "ok"
+
+    monkeypatch.setattr(chat_router.kobold, "generate", fake_generate)
+    monkeypatch.setenv("CHAT_AUTONOMY_ENABLED", "0")
+    client = TestClient(app)
+
+    response = client.post(
+        "/api/chat/",
+        json={"session_id": session.session_id, "use_memory": False, "messages": [{"role": "user", "content": "новый"}]},
+    )
+    assert response.status_code == 200
+    contents = "\n".join(m["content"] for m in captured["messages"])
+    assert "пользователь спрашивал про старое" in contents
+    assert "старый ответ" not in contents
+    assert "свежий ответ" in contents
+
+    resumed = client.get(f"/api/chat/sessions/{session.session_id}").json()
+    assert resumed["summary"] == "- пользователь спрашивал про старое"
+
+
+def test_chat_session_history_keeps_turns_the_lagging_summary_does_not_cover(tmp_path, monkeypatch):
+    from backend.core.services.conversation_store import ConversationStore
+
+    app = FastAPI()
+    app.include_router(chat_router.router, prefix="/api/chat")
+    app.state.memory_engine = FakeMemoryEngine()
+    store = ConversationStore(db_path=tmp_path / "conversations.db", tail_size=2)
+    app.state.conversation_store = store
+    session = store.create_session()
+    store.append_messages(session.session_id, [("user", "старый вопрос"), ("assistant", "старый ответ")])
+    store.append_messages(session.session_id, [("user", "средний вопрос"), ("assistant", "средний ответ")])
+    store.append_messages(session.session_id, [("user", "свежий вопрос"), ("assistant", "свежий ответ")])
+    # The summarizer has only folded the first turn; the middle one is outside the 2-message tail.
+    store.save_summary(session.session_id, "- пользователь спрашивал про старое", covered_seq=1)
+    captured = {}
+
+    async def fake_generate(messages, max_tokens=512, temperature=0.7):
+        captured["messages"] = messages
+        return "ok"
+
+    monkeypatch.setattr(chat_router.kobold, "generate", fake_generate)
+    monkeypatch.setenv("CHAT_AUTONOMY_ENABLED", "0")
+    client = TestClient(app)
+
+    response = client.post(
+        "/api/chat/",
+        json={"session_id": session.session_id, "use_memory": False, "messages": [{"role": "user", "content": "новый"}]},
+    )
+    assert response.status_code == 200
+    dialogue = [m["content"] for m in captured["messages"] if m["role"] != "system"]
+    assert dialogue == ["средний вопрос", "средний ответ", "свежий вопрос", "свежий ответ", "новый"]
+
+
+def test_chat_semantic_cache_serves_repeated_question_without_generation(monkeypatch):
+    from backend.core.services.response_cache import SemanticResponseCache
+
+    class FakeEmbeddings:
+        async def embed_query(self, text):
+            return [1.0, 0.1] if "termux" in text else [0.0, 1.0]
+
+    app = FastAPI()
+    app.include_router(chat_router.router, prefix="/api/chat")
+    app.state.memory_engine = FakeMemoryEngine()
+    app.state.embeddings_client = FakeEmbeddings()
+    app.state.response_cache = SemanticResponseCache(similarity_threshold=0.95)
+    calls = []
+
+    async def fake_generate(messages, max_tokens=512, temperature=0.7):
+        calls.append(messages)
+        return "поставь пакет"
+
+    monkeypatch.setattr(chat_router.kobold, "generate", fake_generate)
+    monkeypatch.setenv("CHAT_AUTONOMY_ENABLED", "0")
+    client = TestClient(app)
+
+    def ask(text):
+        return client.post("/api/chat/", json={"messages": [{"role": "user", "content": text}]}).json()
+
+    first = ask("как настроить termux?")
+    second = ask("Как настроить Termux")
+    assert first["cached"] is False and second["cached"] is True
+    assert second["response"] == "поставь пакет"
+    assert second["interaction_id"] == first["interaction_id"] == "interaction_1"
+    assert len(calls) == 1
+
+    assert client.post("/api/chat/feedback", params={"interaction_id": "interaction_1", "helpful": False}).status_code == 200
+    assert ask("как настроить termux?")["cached"] is False
+    assert len(calls) == 2
+
+    stats = client.get("/api/chat/response-cache").json()
+    assert stats["enabled"] is True
+    assert stats["rejected_after_hit"] == 1
+
+
+def test_chat_trace_records_stage_timings(monkeypatch):
+    app = FastAPI()
+    app.include_router(chat_router.router, prefix="/api/chat")
+    app.state.memory_engine = FakeMemoryEngine()
+    app.state.companion_state = CompanionState()
+    app.state.companion_memory = FakeCompanionMemory()
+
+    async def fake_generate(messages, max_tokens=512, temperature=0.7):
+        return "ok"
+
+    monkeypatch.setattr(chat_router.kobold, "generate", fake_generate)
+    monkeypatch.setenv("CHAT_AUTONOMY_ENABLED", "0")
+    client = TestClient(app)
+
+    response = client.post("/api/chat/", json={"messages": [{"role": "user", "content": "привет"}]})
+    assert response.status_code == 200
+
+    timings = app.state.companion_state.get_last_trace().stage_timings_ms
+    for stage in ("behavior", "facts", "memory", "context", "prompt_budget", "generation", "persistence", "total"):
+        assert stage in timings
+    assert "web" not in timings
+    assert timings["total"] >= timings["generation"]
+
+
+def test_chat_consumes_prefetched_context_for_matching_text(monkeypatch):
+    from backend.core.services.prefetch_cache import PrefetchCache
+
+    class CountingMemoryEngine(FakeMemoryEngine):
+        def __init__(self):
+            self.queries = []
+
+        async def search(self, query: str, limit: int = 5, **_kwargs):
+            self.queries.append(query)
+            return [{"id": "m1", "content": f"заметка про {query}"}]
+
+    app = FastAPI()
+    app.include_router(chat_router.router, prefix="/api/chat")
+    app.state.memory_engine = CountingMemoryEngine()
+    app.state.companion_state = CompanionState()
+    app.state.prefetch_cache = PrefetchCache()
+    captured = {}
+
+    async def fake_generate(messages, max_tokens=512, temperature=0.7):
+        captured["messages"] = messages
+        return "ok"
+
+    monkeypatch.setattr(chat_router.kobold, "generate", fake_generate)
+    monkeypatch.setenv("CHAT_AUTONOMY_ENABLED", "0")
+    client = TestClient(app)
+
+    prefetch = client.post("/api/chat/prefetch", json={"text": "как  обновить termux"})
+    assert prefetch.json() == {"status": "scheduled", "sources": ["memory"]}
+    assert client.post("/api/chat/prefetch", json={"text": "как обновить termux"}).json()["status"] == "unchanged"
+
+    response = client.post("/api/chat/", json={"messages": [{"role": "user", "content": "как обновить termux"}]})
+    assert response.status_code == 200
+    assert app.state.memory_engine.queries == ["как  обновить termux"]
+    assert app.state.companion_state.get_last_trace().context_sources["memory"]["prefetched"] is True
+
+    # A different final message ignores the stale draft and fetches fresh context.
+    client.post("/api/chat/prefetch", json={"text": "черновик"})
+    client.post("/api/chat/", json={"messages": [{"role": "user", "content": "другой вопрос"}]})
+    assert app.state.memory_engine.queries[-1] == "другой вопрос"
+
+    stats = client.get("/api/chat/prefetch/stats").json()
+    assert stats["hits"] == 1 and stats["misses"] == 1 and stats["unchanged"] == 1
+
+
+def test_warm_prompt_is_a_prefix_of_the_prefix_stable_turn(tmp_path, monkeypatch):
+    import time
+
+    from backend.core.services.conversation_store import ConversationStore
+    from backend.core.services.prefetch_cache import PrefetchCache
+
+    app = FastAPI()
+    app.include_router(chat_router.router, prefix="/api/chat")
+    app.state.memory_engine = FakeMemoryEngine()
+    app.state.companion_state = CompanionState()
+    app.state.prefetch_cache = PrefetchCache()
+    app.state.token_counter = WordCounter()
+    store = ConversationStore(db_path=tmp_path / "conversations.db")
+    app.state.conversation_store = store
+    session = store.create_session()
+    store.append_messages(
+        session.session_id,
+        [("user" if i % 2 == 0 else "assistant", f"реплика {i} " + "слово " * 14) for i in range(12)],
+    )
+    prompts: list[list[dict]] = []
+
+    async def fake_generate(messages, max_tokens=512, temperature=0.7):
+        prompts.append(messages)
+        return "ok"
+
+    monkeypatch.setattr(chat_router.kobold, "generate", fake_generate)
+    monkeypatch.setenv("CHAT_AUTONOMY_ENABLED", "0")
+    # Room for about nine of the twelve history messages: the oldest page of six is dropped.
+    monkeypatch.setenv("CHAT_CONTEXT_TOKENS", "340")
+    client = TestClient(app)
+    body = {"session_id": session.session_id, "max_tokens": 64, "prompt_layout": "prefix_stable"}
+
+    legacy = client.post("/api/chat/prefetch", json={**body, "text": "черновик", "warm_prompt": True, "prompt_layout": "legacy"})
+    assert "prompt" not in legacy.json()["sources"]
+
+    prefetch = client.post("/api/chat/prefetch", json={**body, "text": "новый вопрос", "warm_prompt": True})
+    assert "prompt" in prefetch.json()["sources"]
+    for _ in range(50):
+        if prompts:
+            break
+        time.sleep(0.01)
+    warm = prompts[0]
+
+    response = client.post("/api/chat/", json={**body, "messages": [{"role": "user", "content": "новый вопрос"}]})
+    assert response.status_code == 200
+    real = prompts[-1]
+    assert len(warm) == 6
+    assert real[:len(warm)] == warm
+    # Policy and the new turn follow the warmed history.
+    assert real[len(warm)]["content"].startswith("Политика поведения")
+
+
+def test_eval_batch_streams_ndjson_with_bounded_concurrency(monkeypatch):
+    import asyncio
+    import json
+
+    app = FastAPI()
+    app.include_router(chat_router.router, prefix="/api/chat")
+    app.state.memory_engine = FakeMemoryEngine()
+    state = {"active": 0, "peak": 0}
+
+    async def fake_generate(messages, max_tokens=512, temperature=0.7):
+        state["active"] += 1
+        state["peak"] = max(state["peak"], state["active"])
+        await asyncio.sleep(0.01)
+        state["active"] -= 1
+        question = messages[-1]["content"]
+        if question == "сломай":
+            raise Exception("KoboldCpp error: boom")
+        return f"ответ: {question}"
+
+    monkeypatch.setattr(chat_router.kobold, "generate", fake_generate)
+    client = TestClient(app)
+
+    response = client.post(
+        "/api/chat/eval/batch",
+        json={
+            "prompts": ["вопрос 1", {"id": "q2", "prompt": "вопрос 2", "expected": "ВОПРОС 2"}, "вопрос 3", "сломай"],
+            "concurrency": 2,
+        },
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+
+    results, summary = lines[:-1], lines[-1]["summary"]
+    assert sorted(r["index"] for r in results) == [0, 1, 2, 3]
+    by_index = {r["index"]: r for r in results}
+    assert by_index[1]["id"] == "q2" and by_index[1]["matched"] is True
+    assert by_index[3]["ok"] is False and "boom" in by_index[3]["error"]
+    assert "generation" in by_index[0]["stage_timings_ms"]
+    assert state["peak"] == 2
+
+    assert summary["ok"] == 3 and summary["failed"] == 1
+    assert summary["match_rate"] == 1.0
+    assert summary["stages"]["generation"]["count"] == 4
+
+
+def test_chat_injects_relationship_facts_relevant_to_the_question(monkeypatch):
+    from backend.core.services.companion_memory import RelationshipFact
+    from backend.core.services.fact_index import FactVectorIndex
+
+    def fact(fact_id, text):
+        return RelationshipFact(fact_id, "local_user", text, 0.8, "chat_message", None, "active", None, 0.0, 0.0)
+
+    class ManyFactsMemory:
+        def list_facts(self, query: str = "", limit: int = 20):
+            facts = [fact("rf_1", "Любит горы"), fact("rf_2", "Работает по ночам")]
+            facts += [fact(f"rf_x{i}", f"Прочее {i}") for i in range(3)]
+            facts.append(fact("rf_9", "Пишет бэкенд на Python"))
+            return facts[:limit]
+
+    class FakeEmbeddings:
+        async def embed(self, texts):
+            return [[1.0, 0.0] if "python" in t.lower() else [0.0, 1.0] for t in texts]
+
+        async def embed_query(self, text):
+            return [1.0, 0.0] if "python" in text else [0.0, 1.0]
+
+    app = FastAPI()
+    app.include_router(chat_router.router, prefix="/api/chat")
+    app.state.memory_engine = FakeMemoryEngine()
+    app.state.companion_memory = ManyFactsMemory()
+    app.state.fact_index = FactVectorIndex(FakeEmbeddings())
+    prompts = []
+
+    async def fake_generate(messages, max_tokens=512, temperature=0.7):
+        prompts.append(messages)
+        return "ok"
+
+    monkeypatch.setattr(chat_router.kobold, "generate", fake_generate)
+    monkeypatch.setenv("CHAT_AUTONOMY_ENABLED", "0")
+    client = TestClient(app)
+
+    response = client.post("/api/chat/", json={"messages": [{"role": "user", "content": "Как ускорить Python?"}]})
+    assert response.status_code == 200
+    facts_block = next(m["content"] for m in prompts[0] if "[Fact " in m["content"])
+    assert facts_block.splitlines()[1].startswith("[Fact rf_9]")
+    assert len(facts_block.splitlines()) == 4
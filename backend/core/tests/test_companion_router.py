@@ -1,3 +1,4 @@
+import pytest
 from fastapi import FastAPI
 from fastapi.testclient import TestClient
 
@@ -236,3 +237,178 @@ def test_response_traces_history_endpoint(tmp_path):
     assert data['items'][1]['response_id'] == 'resp_2'
     assert data['items'][0]['retrieval_backend'] == 'legacy'
     assert data['items'][1]['retrieval_backend'] == 'legacy'
+
+
+def test_relationship_facts_search_is_ranked_and_migrates_old_databases(tmp_path):
+    memory = CompanionMemory()
+    memory.db_path = tmp_path / "companion.db"
+    memory._init_db()
+    memory._ensure_default_profile()
+    memory.add_fact("Пользователь пьёт кофе по утрам", "chat_message", None, 0.9, None)
+    memory.add_fact("Кофе без сахара, кофе только чёрный", "chat_message", None, 0.9, None)
+    memory.add_fact("Любит длинные прогулки", "chat_message", None, 0.9, None)
+
+    found = memory.list_facts(query="Кофе", limit=10)
+    assert [f.fact for f in found] == ["Кофе без сахара, кофе только чёрный", "Пользователь пьёт кофе по утрам"]
+    # Prefix terms: a word stem still finds the fact, like the old substring search did.
+    assert [f.fact for f in memory.list_facts(query="прогул")] == ["Любит длинные прогулки"]
+
+    # A database created before the index existed is backfilled on startup.
+    with memory._db() as conn:
+        conn.execute("DROP TABLE relationship_facts_fts")
+        conn.execute("DROP TRIGGER relationship_facts_fts_ai")
+    migrated = CompanionMemory()
+    migrated.db_path = memory.db_path
+    migrated._init_db()
+    assert migrated.fts_enabled is True
+    assert len(migrated.list_facts(query="кофе утрам")) == 2
+    assert migrated.list_facts(query="утрам")[0].fact == "Пользователь пьёт кофе по утрам"
+
+
+def test_profile_and_active_facts_are_cached_until_a_write_or_external_change(tmp_path):
+    import sqlite3
+
+    memory = CompanionMemory()
+    memory.db_path = tmp_path / "companion.db"
+    memory._init_db()
+    memory._ensure_default_profile()
+
+    memory.get_profile()
+    memory.list_facts(limit=3)
+    assert memory.get_profile().verbosity == "medium"
+    assert memory.list_facts(limit=3) == []
+    assert memory.get_stats()["hits"] == 2
+
+    fact = memory.add_fact("Любит горы", "chat_message", None, 0.8, None)
+    assert [f.fact_id for f in memory.list_facts(limit=3)] == [fact.fact_id]
+    memory.invalidate_fact(fact.fact_id)
+    assert memory.list_facts(limit=3) == []
+    assert memory.patch_profile({"style": {"tone": "soft"}}).tone == "soft"
+
+    # A commit from another connection (e.g. the sqlite3 CLI) is picked up through PRAGMA data_version.
+    external = sqlite3.connect(memory.db_path)
+    with external:
+        external.execute("UPDATE relationship_profiles SET verbosity='high' WHERE user_id='local_user'")
+    external.close()
+    assert memory.get_profile().verbosity == "high"
+
+    # So is a commit by another in-process component through the same shared writer.
+    from backend.core.services.sqlite_pool import get_connection_manager
+
+    with get_connection_manager(memory.db_path).write() as conn:
+        conn.execute("UPDATE relationship_profiles SET verbosity='low' WHERE user_id='local_user'")
+    assert memory.get_profile().verbosity == "low"
+
+
+def test_expired_facts_are_hidden_and_swept_in_batches(tmp_path):
+    import asyncio
+    import time
+
+    memory = CompanionMemory()
+    memory.db_path = tmp_path / "companion.db"
+    memory._init_db()
+    memory._ensure_default_profile()
+    keep = memory.add_fact("Любит горы", "chat_message", None, 0.8, None)
+    short = [memory.add_fact(f"Временный факт {i}", "chat_message", None, 0.8, 1) for i in range(3)]
+    assert short[0].expires_at is not None and keep.expires_at is None
+    assert len(memory.list_facts(limit=10)) == 4
+
+    # Once expires_at has passed the facts are excluded at query time, even before the sweeper ran.
+    later = time.time() + 2 * 86400
+    with memory._db() as conn:
+        conn.execute("UPDATE relationship_facts SET expires_at=? WHERE ttl_days IS NOT NULL", (time.time() - 1,))
+    memory._invalidate_cache()
+    assert [f.fact_id for f in memory.list_facts(limit=10)] == [keep.fact_id]
+    assert memory.list_facts(query="факт") == []
+
+    assert memory.expire_facts(now=later, batch_size=2) == 3
+    assert memory.get_fact(short[0].fact_id).status == "expired"
+    with memory._read_db() as conn:
+        kinds = [r[0] for r in conn.execute("SELECT event_kind FROM relationship_fact_events WHERE event_kind='expired'")]
+    assert len(kinds) == 3
+    assert memory.expire_facts(now=later) == 0
+
+    # The background loop sweeps once per interval until stopped.
+    memory.add_fact("Ещё один временный", "chat_message", None, 0.8, 1)
+    expired_counts = []
+
+    async def run_loop():
+        stop = asyncio.Event()
+        with memory._db() as conn:
+            conn.execute("UPDATE relationship_facts SET expires_at=? WHERE status='active' AND ttl_days IS NOT NULL", (time.time() - 1,))
+        task = asyncio.create_task(memory.expiry_loop(stop, interval_s=60, on_expired=expired_counts.append))
+        await asyncio.sleep(0.2)
+        stop.set()
+        await task
+
+    asyncio.run(run_loop())
+    assert expired_counts == [1]
+
+
+def test_zero_ttl_expires_immediately_like_the_backfill(tmp_path):
+    memory = CompanionMemory()
+    memory.db_path = tmp_path / "companion.db"
+    memory._init_db()
+    memory._ensure_default_profile()
+    created = memory.add_fact("Мгновенный факт", "chat_message", None, 0.8, 0)
+    assert created.expires_at == created.created_at
+    assert memory.list_facts(limit=10) == []
+    assert memory.expire_facts(now=created.created_at) == 1
+    assert memory.get_fact(created.fact_id).status == "expired"
+
+
+def test_expires_at_is_backfilled_for_old_databases(tmp_path):
+    import sqlite3
+
+    path = tmp_path / "companion.db"
+    conn = sqlite3.connect(path)
+    conn.execute(
+        """
+        CREATE TABLE relationship_facts (
+          fact_id TEXT PRIMARY KEY, user_id TEXT NOT NULL, fact TEXT NOT NULL, confidence REAL NOT NULL,
+          source_type TEXT NOT NULL, source_ref_id TEXT, status TEXT NOT NULL DEFAULT 'active',
+          ttl_days INTEGER, created_at REAL NOT NULL, updated_at REAL NOT NULL
+        )
+        """
+    )
+    conn.execute("INSERT INTO relationship_facts VALUES ('rf_old', 'local_user', 'Старый факт', 0.5, 'chat', NULL, 'active', 2, 100.0, 100.0)")
+    conn.commit()
+    conn.close()
+
+    memory = CompanionMemory()
+    memory.db_path = path
+    memory._init_db()
+    assert memory.get_fact("rf_old").expires_at == 100.0 + 2 * 86400
+    assert memory.list_facts(limit=10) == []
+
+
+def test_unsolicited_limit_uses_in_memory_window_seeded_from_db(tmp_path):
+    memory = CompanionMemory()
+    memory.db_path = tmp_path / "companion.db"
+    memory._init_db()
+    memory._ensure_default_profile()
+    memory.patch_profile({"initiative_preferences": {"max_unsolicited_per_hour": 2}})
+
+    def propose():
+        return memory.add_proposal("Текст", "Причина", "Польза", "low", "Стоп", unsolicited=True)
+
+    first, second = propose(), propose()
+    memory.add_proposal("Запрошено", "Причина", "Польза", "low", "Стоп", unsolicited=False)
+    assert memory._recent_unsolicited_count() == 2
+
+    # Dismissing frees a slot, reopening takes it back (only open/accepted count, like the SQL did).
+    memory.update_proposal_status(first.proposal_id, "dismissed")
+    assert memory._recent_unsolicited_count() == 1
+    memory.update_proposal_status(first.proposal_id, "open")
+    memory.update_proposal_status(second.proposal_id, "accepted")
+    assert memory._recent_unsolicited_count() == 2
+    with pytest.raises(ValueError, match="rate limit"):
+        propose()
+
+    # A fresh instance rebuilds the window from SQLite; proposals older than an hour fall out.
+    with memory._db() as conn:
+        conn.execute("UPDATE initiative_proposals SET created_at=created_at-7200 WHERE proposal_id=?", (second.proposal_id,))
+    restarted = CompanionMemory()
+    restarted.db_path = memory.db_path
+    restarted._init_db()
+    assert restarted._recent_unsolicited_count() == 1
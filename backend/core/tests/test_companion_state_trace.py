@@ -11,3 +11,14 @@ def test_set_last_trace_accepts_retrieval_backend_override():
     state = CompanionState()
     trace = state.set_last_trace(response_id="resp_2", retrieval_backend="multimodal")
     assert trace.retrieval_backend == "multimodal"
+
+
+def test_stage_percentiles_aggregate_trace_history():
+    state = CompanionState()
+    for ms in (10.0, 20.0, 30.0, 40.0):
+        state.set_last_trace(response_id=f"resp_{ms}", stage_timings_ms={"memory": ms, "generation": ms * 10})
+    state.set_last_trace(response_id="resp_untimed")
+
+    stats = state.get_stage_percentiles()
+    assert stats["memory"] == {"count": 4, "p50": 30.0, "p95": 40.0, "max": 40.0}
+    assert stats["generation"]["max"] == 400.0
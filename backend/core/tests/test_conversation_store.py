@@ -0,0 +1,43 @@
+from backend.core.services.conversation_store import ConversationStore
+
+
+def test_conversation_store_appends_and_serves_tail(tmp_path):
+    store = ConversationStore(db_path=tmp_path / "conversations.db", tail_size=3)
+    session = store.create_session(title="demo")
+    store.append_messages(session.session_id, [("user", "u1"), ("assistant", "a1")])
+    store.append_messages(session.session_id, [("user", "u2"), ("assistant", "a2")])
+
+    tail = store.get_messages(session.session_id)
+    assert [m.content for m in tail] == ["a1", "u2", "a2"]
+    assert [m.seq for m in tail] == [1, 2, 3]
+    assert store.get_session(session.session_id).message_count == 4
+
+    # A fresh instance (e.g. after restart) rebuilds the tail from SQLite.
+    reopened = ConversationStore(db_path=tmp_path / "conversations.db", tail_size=3)
+    assert [m.content for m in reopened.get_messages(session.session_id, limit=10)] == ["u1", "a1", "u2", "a2"]
+    assert [m.content for m in reopened.get_messages(session.session_id)] == ["a1", "u2", "a2"]
+
+
+def test_conversation_store_delete_and_missing_session(tmp_path):
+    store = ConversationStore(db_path=tmp_path / "conversations.db")
+    session = store.create_session()
+    assert store.delete_session(session.session_id) is True
+    assert store.get_session(session.session_id) is None
+    try:
+        store.append_messages(session.session_id, [("user", "x")])
+    except KeyError:
+        pass
+    else:
+        raise AssertionError("append to a deleted session must fail")
+
+
+def test_conversation_store_reuses_pooled_connections(tmp_path):
+    from backend.core.services.sqlite_pool import get_connection_manager
+
+    store = ConversationStore(db_path=tmp_path / "conversations.db", tail_size=2, cached_sessions=1)
+    sessions = [store.create_session() for _ in range(5)]
+    for session in sessions:
+        store.append_messages(session.session_id, [("user", "u"), ("assistant", "a")])
+        store.save_summary(session.session_id, "итог", covered_seq=0)
+        assert [m.content for m in store.get_messages(session.session_id, limit=5)] == ["u", "a"]
+    assert get_connection_manager(tmp_path / "conversations.db").get_stats()["connections_opened"] == 2
@@ -0,0 +1,68 @@
+import asyncio
+
+from backend.core.services.conversation_store import ConversationStore
+from backend.core.services.conversation_summarizer import ConversationSummarizer
+
+
+class FakeKobold:
+    def __init__(self):
+        self.calls = []
+
+    async def generate(self, messages, max_tokens=512, temperature=0.7):
+        self.calls.append(messages)
+        return f"summary {len(self.calls)}"
+
+    async def abort(self):
+        return True
+
+
+def _fill(store, session_id, pairs):
+    for i in range(pairs):
+        store.append_messages(session_id, [("user", f"u{i}"), ("assistant", f"a{i}")])
+
+
+def test_summarizer_folds_only_dropped_turns_incrementally(tmp_path):
+    store = ConversationStore(db_path=tmp_path / "conversations.db")
+    kobold = FakeKobold()
+    summarizer = ConversationSummarizer(
+        store, kobold, threshold_tokens=0, keep_messages=4, min_new_messages=4, max_history_messages=4
+    )
+    session = store.create_session()
+    _fill(store, session.session_id, 5)  # seq 0..9, window keeps 6..9
+
+    summary = asyncio.run(summarizer.summarize(session.session_id))
+    assert summary.covered_seq == 5
+    assert summary.summary == "summary 1"
+    assert "u0" in kobold.calls[0][1]["content"] and "a2" in kobold.calls[0][1]["content"]
+
+    # Too few new turns left the window: no regeneration.
+    _fill(store, session.session_id, 1)
+    assert asyncio.run(summarizer.summarize(session.session_id)) is None
+    assert len(kobold.calls) == 1
+
+    _fill(store, session.session_id, 1)  # seq 0..13, window keeps 10..13
+    summary = asyncio.run(summarizer.summarize(session.session_id))
+    assert summary.covered_seq == 9
+    prompt = kobold.calls[1][1]["content"]
+    # Only the previous summary plus the newly dropped turns are sent.
+    assert "summary 1" in prompt
+    assert "u3" in prompt and "a4" in prompt
+    assert "u2" not in prompt
+
+    # An older result can never move the boundary back.
+    store.save_summary(session.session_id, "stale", covered_seq=5)
+    assert store.get_summary(session.session_id).summary == "summary 2"
+
+
+def test_summarizer_skips_short_conversations(tmp_path):
+    store = ConversationStore(db_path=tmp_path / "conversations.db")
+    kobold = FakeKobold()
+    summarizer = ConversationSummarizer(
+        store, kobold, threshold_tokens=10_000, keep_messages=4, min_new_messages=2, max_history_messages=14
+    )
+    session = store.create_session()
+    _fill(store, session.session_id, 4)
+
+    assert asyncio.run(summarizer.summarize(session.session_id)) is None
+    assert kobold.calls == []
+    assert summarizer.get_stats()["skipped_below_threshold"] == 1
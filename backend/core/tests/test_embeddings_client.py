@@ -0,0 +1,185 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from backend.core.services.embeddings_client import (
+    EmbeddingsCircuitOpenError,
+    EmbeddingsClient,
+    EmbeddingsServiceError,
+)
+
+
+def make_client(handler, **kwargs) -> EmbeddingsClient:
+    return EmbeddingsClient(base_url="http://embeddings.test", transport=httpx.MockTransport(handler), **kwargs)
+
+
+def test_embed_dedupes_and_splits_batches():
+    batches: list[list[str]] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        texts = json.loads(request.content)["texts"]
+        batches.append(texts)
+        return httpx.Response(200, json={"embeddings": [[float(len(t))] for t in texts]})
+
+    client = make_client(handler, batch_size=2)
+    vectors = asyncio.run(client.embed(["a", "bb", "a", "ccc", "dddd"]))
+
+    assert vectors == [[1.0], [2.0], [1.0], [3.0], [4.0]]
+    assert batches == [["a", "bb"], ["ccc", "dddd"]]
+    stats = client.get_stats()
+    assert stats["dedupe_saved"] == 1
+    assert stats["requests"] == 2
+    assert stats["latency_ms_p50"] is not None
+
+
+def test_embed_query_uses_lru_cache():
+    calls = {"n": 0}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls["n"] += 1
+        return httpx.Response(200, json={"embeddings": [[0.5, 0.5]]})
+
+    client = make_client(handler, query_cache_size=1)
+
+    async def _run():
+        await client.embed_query("привет")
+        await client.embed_query("привет")
+        await client.embed_query("другое")
+        await client.embed_query("привет")
+
+    asyncio.run(_run())
+    assert calls["n"] == 3
+    stats = client.get_stats()
+    assert stats["query_cache_hits"] == 1
+    assert stats["query_cache_misses"] == 3
+
+
+def test_circuit_breaker_fails_fast_after_repeated_errors():
+    calls = {"n": 0}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls["n"] += 1
+        return httpx.Response(503, json={"detail": "down"})
+
+    client = make_client(handler, max_retries=0)
+    client.breaker.failure_threshold = 2
+
+    async def _run():
+        for _ in range(2):
+            with pytest.raises(EmbeddingsServiceError):
+                await client.embed(["x"])
+        with pytest.raises(EmbeddingsCircuitOpenError):
+            await client.embed(["x"])
+
+    asyncio.run(_run())
+    assert calls["n"] == 2
+    assert client.get_stats()["circuit_state"] == "open"
+
+
+def test_half_open_breaker_lets_a_single_probe_through():
+    calls = {"n": 0}
+    release = asyncio.Event()
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        calls["n"] += 1
+        await release.wait()
+        return httpx.Response(200, json={"embeddings": [[1.0]]})
+
+    client = make_client(handler, max_retries=0)
+    client.breaker.state = "open"
+    client.breaker.opened_at = 0.0
+    client.breaker.reset_timeout_s = 0.0
+
+    async def _run():
+        probe = asyncio.create_task(client.embed(["probe"]))
+        await asyncio.sleep(0.01)
+        with pytest.raises(EmbeddingsCircuitOpenError):
+            await client.embed(["other"])
+        release.set()
+        assert await probe == [[1.0]]
+        # The successful probe closes the breaker for everyone.
+        assert await client.embed(["other"]) == [[1.0]]
+
+    asyncio.run(_run())
+    assert calls["n"] == 2
+    assert client.get_stats()["circuit_state"] == "closed"
+
+
+def test_client_errors_do_not_open_the_breaker():
+    calls = {"n": 0}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls["n"] += 1
+        return httpx.Response(422, json={"detail": "bad"})
+
+    client = make_client(handler, max_retries=2)
+    client.breaker.failure_threshold = 1
+
+    async def _run():
+        for _ in range(3):
+            with pytest.raises(EmbeddingsServiceError) as exc_info:
+                await client.embed(["x"])
+            assert not isinstance(exc_info.value, EmbeddingsCircuitOpenError)
+
+    asyncio.run(_run())
+    # 4xx is neither retried nor counted as an outage.
+    assert calls["n"] == 3
+    assert client.get_stats()["circuit_state"] == "closed"
+
+
+def test_connect_errors_are_retried_by_a_single_layer():
+    calls = {"n": 0}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls["n"] += 1
+        raise httpx.ConnectError("refused", request=request)
+
+    client = make_client(handler, max_retries=2)
+    with pytest.raises(EmbeddingsServiceError):
+        asyncio.run(client.embed(["x"]))
+    assert calls["n"] == 3
+    assert client.breaker.consecutive_failures == 1
+
+
+def test_straggler_from_before_the_open_does_not_decide_half_open():
+    gates = {"straggler": asyncio.Event(), "probe": asyncio.Event()}
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        text = json.loads(request.content)["texts"][0]
+        if text == "down":
+            return httpx.Response(503, json={"detail": "down"})
+        if text in gates:
+            await gates[text].wait()
+        if text == "straggler":
+            return httpx.Response(503, json={"detail": "late failure"})
+        return httpx.Response(200, json={"embeddings": [[1.0]]})
+
+    client = make_client(handler, max_retries=0)
+    client.breaker.failure_threshold = 1
+    client.breaker.reset_timeout_s = 0.0
+
+    async def _run():
+        # Admitted while closed, finishes only after the breaker opened and a probe is running.
+        straggler = asyncio.create_task(client.embed(["straggler"]))
+        await asyncio.sleep(0.01)
+        with pytest.raises(EmbeddingsServiceError):
+            await client.embed(["down"])
+        probe = asyncio.create_task(client.embed(["probe"]))
+        await asyncio.sleep(0.01)
+        assert client.breaker.state == "half_open"
+
+        gates["straggler"].set()
+        with pytest.raises(EmbeddingsServiceError):
+            await straggler
+        # The straggler's failure neither reopened the breaker nor freed the probe slot.
+        assert client.breaker.state == "half_open"
+        with pytest.raises(EmbeddingsCircuitOpenError):
+            await client.embed(["other"])
+
+        gates["probe"].set()
+        assert await probe == [[1.0]]
+        assert client.breaker.state == "closed"
+
+    asyncio.run(_run())
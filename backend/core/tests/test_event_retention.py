@@ -0,0 +1,171 @@
+import gzip
+import json
+import time
+
+from backend.core.services.companion_memory import CompanionMemory
+from backend.core.services.event_retention import EventRetention, RetentionPolicy
+from backend.core.services.task_runner import TaskEvent, TaskRunner
+
+
+DAY = 86400.0
+
+
+def make_memory(tmp_path) -> CompanionMemory:
+    memory = CompanionMemory()
+    memory.db_path = tmp_path / "companion.db"
+    memory._init_db()
+    memory._ensure_default_profile()
+    return memory
+
+
+def test_retention_archives_old_events_with_rollups_and_incremental_vacuum(tmp_path):
+    memory = make_memory(tmp_path)
+    proposal = memory.add_proposal("Текст", "Причина", "Польза", "low", "Стоп", unsolicited=False)
+    now = time.time()
+    old_ts = now - 120 * DAY
+    with memory._db() as conn:
+        conn.executemany(
+            "INSERT INTO initiative_proposal_events (proposal_id, event_kind, payload_json, ts) VALUES (?, ?, '{}', ?)",
+            [(proposal.proposal_id, "status_open", old_ts + i) for i in range(5)],
+        )
+
+    retention = EventRetention(
+        {memory.db_path: [RetentionPolicy("initiative_proposal_events", "proposal_id", "event_kind", max_age_days=90, max_per_parent=0)]},
+        archive_dir=tmp_path / "archive",
+        batch_size=2,
+    )
+    assert list(retention.migrate_auto_vacuum()) == [str(memory.db_path)]
+    assert retention.migrate_auto_vacuum() == {}
+    assert retention.run_once(now=now) == {"initiative_proposal_events": 5}
+
+    # Only the fresh 'created' event stays in SQLite.
+    assert [e.event_kind for e in memory.list_proposal_events(proposal.proposal_id)] == ["created"]
+    month = time.strftime("%Y-%m", time.gmtime(old_ts))
+    with gzip.open(tmp_path / "archive" / f"companion-initiative_proposal_events-{month}.jsonl.gz", "rt", encoding="utf-8") as f:
+        archived = [json.loads(line) for line in f]
+    assert len(archived) == 5
+    assert archived[0]["proposal_id"] == proposal.proposal_id and "rn" not in archived[0]
+
+    with memory._read_db() as conn:
+        assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    counts = retention.get_daily_counts("initiative_proposal_events", days=365)
+    assert sum(c["count"] for c in counts if c["kind"] == "status_open") == 5
+    assert sum(c["count"] for c in counts if c["kind"] == "created") == 1
+    assert retention.get_stats()["archived"] == {"initiative_proposal_events": 5}
+    assert retention.run_once(now=now) == {"initiative_proposal_events": 0}
+
+
+def test_retention_count_policy_trims_task_events_in_db_and_memory(tmp_path):
+    runner = TaskRunner()
+    runner.log_path = tmp_path / "task_audit.log"
+    runner.state_path = tmp_path / "tasks_state.json"
+    runner.db_path = tmp_path / "tasks.db"
+    runner._init_db()
+    runner.tasks = {}
+    task = runner.create_task("echo hi")
+    for i in range(6):
+        runner._event(task, "progress", f"step {i}")
+
+    retention = EventRetention(
+        {runner.db_path: [RetentionPolicy("task_events", "task_id", "kind", max_age_days=0, max_per_parent=3, on_pruned=runner.trim_events)]},
+        archive_dir=tmp_path / "archive",
+    )
+    retention.run_once()
+
+    assert [e.message for e in runner._load_task_from_db(task.task_id).events] == ["step 3", "step 4", "step 5"]
+    assert [e.message for e in runner.tasks[task.task_id].events] == ["step 3", "step 4", "step 5"]
+    # Writing the in-memory state back does not resurrect archived events.
+    runner.save_state()
+    assert len(runner._load_task_from_db(task.task_id).events) == 3
+    assert isinstance(runner.tasks[task.task_id].events[0], TaskEvent)
+
+
+def test_trim_events_from_worker_thread_does_not_lose_concurrent_appends(tmp_path):
+    import threading
+
+    runner = TaskRunner()
+    runner.log_path = tmp_path / "task_audit.log"
+    runner.state_path = tmp_path / "tasks_state.json"
+    runner.db_path = tmp_path / "tasks.db"
+    runner._init_db()
+    runner.tasks = {}
+    task = runner.create_task("echo hi")
+    initial = len(task.events)
+    stop = threading.Event()
+
+    def trim_repeatedly():
+        # Nothing is old enough to drop: every swap must keep every event.
+        while not stop.is_set():
+            runner.trim_events(before_ts=0.0, keep_last=0)
+
+    worker = threading.Thread(target=trim_repeatedly)
+    worker.start()
+    try:
+        for i in range(200):
+            runner._event(task, "progress", f"step {i}")
+    finally:
+        stop.set()
+        worker.join()
+    assert len(runner.tasks[task.task_id].events) == initial + 200
+
+
+def test_retention_computes_the_window_once_per_run(tmp_path):
+    from backend.core.services.sqlite_pool import get_connection_manager
+
+    memory = make_memory(tmp_path)
+    proposal = memory.add_proposal("Текст", "Причина", "Польза", "low", "Стоп", unsolicited=False)
+    with memory._db() as conn:
+        conn.executemany(
+            "INSERT INTO initiative_proposal_events (proposal_id, event_kind, payload_json, ts) VALUES (?, 'tick', '{}', ?)",
+            [(proposal.proposal_id, float(i)) for i in range(50)],
+        )
+
+    retention = EventRetention(
+        {memory.db_path: [RetentionPolicy("initiative_proposal_events", "proposal_id", "event_kind", max_age_days=0, max_per_parent=5)]},
+        archive_dir=tmp_path / "archive",
+        batch_size=7,
+    )
+    statements = []
+    manager = get_connection_manager(memory.db_path)
+    retention._prepare(manager)
+    for ctx in (manager.read(), manager.write()):
+        with ctx as conn:
+            conn.set_trace_callback(statements.append)
+    try:
+        assert retention.run_once() == {"initiative_proposal_events": 46}
+    finally:
+        for ctx in (manager.read(), manager.write()):
+            with ctx as conn:
+                conn.set_trace_callback(None)
+    assert sum("ROW_NUMBER()" in s for s in statements) == 1
+    assert len(memory.list_proposal_events(proposal.proposal_id, limit=50)) == 5
+
+
+def test_daily_counts_are_read_only_before_the_first_retention_run(tmp_path):
+    memory = make_memory(tmp_path)
+    memory.add_proposal("Текст", "Причина", "Польза", "low", "Стоп", unsolicited=False)
+    retention = EventRetention(
+        {memory.db_path: [RetentionPolicy("initiative_proposal_events", "proposal_id", "event_kind")]},
+        archive_dir=tmp_path / "archive",
+    )
+
+    counts = retention.get_daily_counts("initiative_proposal_events", days=1)
+    assert [(c["kind"], c["count"]) for c in counts] == [("created", 1)]
+    with memory._read_db() as conn:
+        # No rollup table and no auto-vacuum migration (full VACUUM) from the read path.
+        assert conn.execute("SELECT 1 FROM sqlite_master WHERE name='event_rollups'").fetchone() is None
+        assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2
+
+
+def test_retention_runs_never_vacuum_the_whole_database(tmp_path):
+    memory = make_memory(tmp_path)
+    retention = EventRetention(
+        {memory.db_path: [RetentionPolicy("initiative_proposal_events", "proposal_id", "event_kind")]},
+        archive_dir=tmp_path / "archive",
+    )
+
+    assert retention.run_once() == {"initiative_proposal_events": 0}
+    with memory._read_db() as conn:
+        # The full VACUUM belongs to the startup migration, not to the shared writer of a live DB.
+        assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2
+    assert retention.get_stats()["migrations"] == {}
@@ -0,0 +1,78 @@
+import asyncio
+
+from backend.core.services.companion_memory import RelationshipFact
+from backend.core.services.fact_index import FactVectorIndex
+
+
+VECTORS = {
+    "кофе": [1.0, 0.0, 0.0],
+    "горы": [0.0, 1.0, 0.0],
+    "python": [0.0, 0.0, 1.0],
+}
+
+
+def _vector(text: str) -> list[float]:
+    return next((v for key, v in VECTORS.items() if key in text.lower()), [0.3, 0.3, 0.3])
+
+
+class FakeEmbeddings:
+    def __init__(self):
+        self.embedded: list[str] = []
+
+    async def embed(self, texts):
+        self.embedded.extend(texts)
+        return [_vector(t) for t in texts]
+
+    async def embed_query(self, text):
+        return _vector(text)
+
+
+def make_fact(fact_id: str, text: str, confidence: float = 0.8) -> RelationshipFact:
+    return RelationshipFact(
+        fact_id=fact_id,
+        user_id="local_user",
+        fact=text,
+        confidence=confidence,
+        source_type="chat_message",
+        source_ref_id=None,
+        status="active",
+        ttl_days=None,
+        created_at=0.0,
+        updated_at=0.0,
+    )
+
+
+def test_fact_index_ranks_by_similarity_and_confidence():
+    embeddings = FakeEmbeddings()
+    index = FactVectorIndex(embeddings, confidence_weight=0.2)
+    facts = [
+        make_fact("rf_1", "Пьёт кофе без сахара", confidence=0.5),
+        make_fact("rf_2", "Любит горы", confidence=0.9),
+        make_fact("rf_3", "Пишет на Python", confidence=0.9),
+        make_fact("rf_4", "Ещё раз про кофе: только чёрный", confidence=1.0),
+    ]
+
+    selected = asyncio.run(index.select("что заказать в кофейне? кофе", facts, limit=2))
+    # Both coffee facts win on similarity; confidence orders them.
+    assert [f.fact_id for f in selected] == ["rf_4", "rf_1"]
+    assert index.get_stats()["facts_indexed"] == 4
+
+
+def test_fact_index_embeds_once_and_reembeds_only_changed_facts():
+    embeddings = FakeEmbeddings()
+    index = FactVectorIndex(embeddings)
+    facts = [make_fact("rf_1", "Пьёт кофе"), make_fact("rf_2", "Любит горы")]
+
+    asyncio.run(index.select("кофе", facts, limit=1))
+    asyncio.run(index.select("горы", facts, limit=1))
+    assert embeddings.embedded == ["Пьёт кофе", "Любит горы"]
+
+    # rf_1 changed its text, rf_2 is no longer active.
+    updated = [make_fact("rf_1", "Пишет на Python")]
+    selected = asyncio.run(index.select("python", updated, limit=1))
+    assert [f.fact for f in selected] == ["Пишет на Python"]
+    assert embeddings.embedded[-1] == "Пишет на Python"
+    stats = index.get_stats()
+    assert stats["embedded"] == 3
+    assert stats["evicted"] == 1
+    assert stats["facts_indexed"] == 1
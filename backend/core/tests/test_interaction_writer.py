@@ -0,0 +1,119 @@
+import asyncio
+
+from backend.core.services.interaction_writer import InteractionWriter
+from backend.core.services.memory_engine import MemoryEngine
+
+
+class RecordingEngine:
+    def __init__(self, delay: float = 0.0):
+        self.batches: list[list[dict]] = []
+        self.delay = delay
+        self.outcomes: list[tuple[str, bool]] = []
+
+    async def record_outcome(self, interaction_id: str, helpful: bool):
+        # Like MemoryEngine: the interaction must already be stored.
+        assert any(item["interaction_id"] == interaction_id for batch in self.batches for item in batch)
+        self.outcomes.append((interaction_id, helpful))
+
+    async def add_interactions(self, items):
+        await asyncio.sleep(self.delay)
+        self.batches.append(list(items))
+        return [item["interaction_id"] for item in items]
+
+
+def test_writer_batches_and_drains_on_close():
+    engine = RecordingEngine()
+
+    async def _run():
+        writer = InteractionWriter(engine, max_queue=10, batch_size=3, flush_interval_s=0.05)
+        writer.start()
+        ids = [writer.submit(f"q{i}", f"a{i}", []) for i in range(5)]
+        await writer.close()
+        return writer, ids
+
+    writer, ids = asyncio.run(_run())
+    assert all(ids)
+    written = [item["interaction_id"] for batch in engine.batches for item in batch]
+    assert written == ids
+    assert [len(b) for b in engine.batches] == [3, 2]
+    stats = writer.get_stats()
+    assert stats["written"] == 5
+    assert stats["queue_depth"] == 0
+    assert stats["running"] is False
+
+
+def test_writer_drops_when_queue_is_full():
+    engine = RecordingEngine(delay=0.05)
+
+    async def _run():
+        writer = InteractionWriter(engine, max_queue=2, batch_size=1, flush_interval_s=0.01)
+        results = [writer.submit("q", "a", []) for _ in range(3)]
+        await writer.flush()
+        return writer, results
+
+    writer, results = asyncio.run(_run())
+    assert results[2] is None
+    stats = writer.get_stats()
+    assert stats["dropped"] == 1
+    assert stats["written"] == 2
+
+
+def test_outcome_waits_only_for_its_own_interaction():
+    engine = RecordingEngine(delay=0.2)
+
+    async def _run():
+        writer = InteractionWriter(engine, max_queue=10, batch_size=1, flush_interval_s=0.01)
+        writer.start()
+        first = writer.submit("q1", "a1", [])
+        await asyncio.sleep(0.3)
+        # A slow unrelated write is in progress; feedback for the written interaction does not wait on it.
+        writer.submit("q2", "a2", [])
+        await asyncio.sleep(0.01)
+        started = asyncio.get_running_loop().time()
+        status = await writer.record_outcome(first, True)
+        waited = asyncio.get_running_loop().time() - started
+        await writer.close()
+        return status, waited, first
+
+    status, waited, first = asyncio.run(_run())
+    assert status == "recorded"
+    assert waited < 0.1
+    assert engine.outcomes == [(first, True)]
+
+
+def test_outcome_for_a_pending_interaction_is_applied_after_its_write():
+    engine = RecordingEngine(delay=0.2)
+
+    async def _run():
+        writer = InteractionWriter(engine, max_queue=10, batch_size=1, flush_interval_s=0.01)
+        writer.start()
+        interaction_id = writer.submit("q", "a", [])
+        status = await writer.record_outcome(interaction_id, False, timeout=0.01)
+        deferred = writer.get_stats()["deferred_outcomes"]
+        await writer.flush()
+        await writer.close()
+        return status, deferred, interaction_id, writer.get_stats()
+
+    status, deferred, interaction_id, stats = asyncio.run(_run())
+    assert status == "queued"
+    assert deferred == 1
+    assert engine.outcomes == [(interaction_id, False)]
+    assert stats["outcomes_deferred"] == 1 and stats["deferred_outcomes"] == 0
+
+
+def test_memory_engine_add_interactions_keeps_pregenerated_ids(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    engine = MemoryEngine()
+    engine.chroma_available = False
+
+    ids = asyncio.run(
+        engine.add_interactions(
+            [
+                {"query": "q1", "response": "a1", "context_used": [], "interaction_id": "int_1"},
+                {"query": "q2", "response": "a2", "context_used": [{"id": "m1"}]},
+            ]
+        )
+    )
+    assert ids[0] == "int_1"
+    assert engine.in_memory_store["int_1"]["content"] == "Q: q1\nA: a1"
+    assert engine.interactions[ids[1]]["context_used"] == [{"id": "m1"}]
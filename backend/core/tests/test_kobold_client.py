@@ -23,3 +23,47 @@ def test_kobold_prompt_keeps_existing_system_messages_after_default():
     assert lines[0] == f"System: {DEFAULT_SYSTEM_PROMPT}"
     assert lines[1] == "System: Дополнительная политика"
     assert "User: Hello" in prompt
+
+
+def test_kobold_generate_stream_parses_sse_tokens():
+    import asyncio
+
+    import httpx
+
+    sse_body = (
+        'event: message\ndata: {"token": " При"}\n\n'
+        'event: message\ndata: {"token": "вет"}\n\n'
+        'event: message\ndata: {"token": "!"}\n\n'
+    )
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert request.url.path == "/api/extra/generate/stream"
+        return httpx.Response(200, text=sse_body, headers={"content-type": "text/event-stream"})
+
+    client = KoboldClient(base_url="http://kobold.test")
+    client.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    async def _collect():
+        return [t async for t in client.generate_stream([{"role": "user", "content": "hi"}])]
+
+    assert asyncio.run(_collect()) == ["При", "вет", "!"]
+
+
+def test_prompt_prefix_tracker_measures_shared_prefix():
+    from backend.core.services.kobold_client import PromptPrefixTracker
+
+    tracker = PromptPrefixTracker()
+    tracker.observe("System: a\n\nUser: hi\n\nAssistant:")
+    matched = tracker.observe("System: a\n\nUser: hi\n\nAssistant: ok\n\nUser: more\n\nAssistant:")
+
+    assert matched == len("System: a\n\nUser: hi\n\nAssistant:")
+    metrics = tracker.get_metrics()
+    assert metrics["observations"] == 2
+    assert 0 < metrics["avg_prefix_ratio"] < 1
+
+
+def test_payload_includes_grammar_only_when_given():
+    client = KoboldClient()
+    messages = [{"role": "user", "content": "hi"}]
+    assert "grammar" not in client._build_payload(messages, 10, 0.0, 0.9, 40)
+    assert client._build_payload(messages, 10, 0.0, 0.9, 40, grammar='root ::= "x"')["grammar"] == 'root ::= "x"'
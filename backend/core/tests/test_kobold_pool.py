@@ -0,0 +1,143 @@
+import asyncio
+
+import httpx
+
+from backend.core.services.kobold_client import KoboldClient
+from backend.core.services.kobold_pool import KoboldBackend, KoboldPool
+
+
+class StubKobold:
+    """Minimal KoboldCpp stand-in: /api/v1/model and /api/v1/generate."""
+
+    def __init__(self, name: str, up: bool = True):
+        self.name = name
+        self.up = up
+        self.generate_calls = 0
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        if not self.up:
+            raise httpx.ConnectError("connection refused", request=request)
+        if request.url.path == "/api/v1/model":
+            return httpx.Response(200, json={"result": f"{self.name}-model"})
+        if request.url.path == "/api/v1/generate":
+            self.generate_calls += 1
+            return httpx.Response(200, json={"results": [{"text": f" answer from {self.name}"}]})
+        return httpx.Response(404)
+
+    def backend(self, capabilities: set[str], max_context: int = 4096) -> KoboldBackend:
+        client = KoboldClient(
+            f"http://{self.name}.test",
+            client=httpx.AsyncClient(transport=httpx.MockTransport(self.handler)),
+        )
+        return KoboldBackend(name=self.name, client=client, capabilities=capabilities, max_context=max_context)
+
+
+def make_pool():
+    small, large = StubKobold("small"), StubKobold("large")
+    pool = KoboldPool(
+        [small.backend({"planner"}, max_context=2048), large.backend({"chat", "background"}, max_context=8192)],
+        probe_interval_s=60,
+    )
+    return pool, small, large
+
+
+def test_pool_routes_request_classes_to_capable_backends():
+    pool, small, large = make_pool()
+    messages = [{"role": "user", "content": "hi"}]
+
+    async def _run():
+        planner_text = await pool.client_for("planner").generate(messages, max_tokens=16)
+        chat_text = await pool.client_for("chat").generate(messages, max_tokens=16)
+        return planner_text, chat_text
+
+    planner_text, chat_text = asyncio.run(_run())
+    assert planner_text == "answer from small"
+    assert chat_text == "answer from large"
+    metrics = {b["name"]: b for b in pool.get_metrics()["backends"]}
+    assert metrics["small"]["requests"] == 1
+    assert metrics["large"]["latency_ms_p50"] is not None
+    assert metrics["large"]["tokens_per_sec_p50"] is not None
+
+
+def test_pool_fails_over_and_skips_backend_marked_down():
+    pool, small, large = make_pool()
+    small.up = False
+    client = pool.client_for("planner")
+    messages = [{"role": "user", "content": "plan"}]
+
+    async def _run():
+        first = await client.generate(messages, max_tokens=16)
+        second = await client.generate(messages, max_tokens=16)
+        return first, second
+
+    first, second = asyncio.run(_run())
+    assert first == second == "answer from large"
+    assert pool.get_metrics()["failovers"] == 1
+    # The cached probe keeps the dead backend out of the second request.
+    assert pool.backends[0].healthy is False
+    assert pool.backends[0].failures == 1
+
+
+def test_pool_prefers_backend_whose_context_fits():
+    pool, small, large = make_pool()
+    long_prompt = [{"role": "user", "content": "x" * 9000}]
+    text = asyncio.run(pool.client_for("planner").generate(long_prompt, max_tokens=16))
+    assert text == "answer from large"
+    assert small.generate_calls == 0
+
+
+def test_pool_health_probes_are_cached():
+    pool, small, _ = make_pool()
+    backend = pool.backends[0]
+
+    async def _run():
+        assert await pool.probe(backend) is True
+        small.up = False
+        cached = await pool.probe(backend)
+        forced = await pool.probe(backend, force=True)
+        return cached, forced
+
+    cached, forced = asyncio.run(_run())
+    assert cached is True
+    assert forced is False
+
+
+def test_routed_client_aborts_the_backend_of_the_calling_request():
+    pool, small, large = make_pool()
+    aborted: list[str] = []
+    for stub in (small, large):
+        original = stub.handler
+
+        def handler(request: httpx.Request, stub=stub, original=original) -> httpx.Response:
+            if request.url.path == "/api/extra/abort":
+                aborted.append(stub.name)
+                return httpx.Response(200, json={"success": "true"})
+            return original(request)
+
+        stub.handler = handler
+    for backend, stub in zip(pool.backends, (small, large)):
+        backend.client.client = httpx.AsyncClient(transport=httpx.MockTransport(stub.handler))
+    client = pool.client_for("planner")
+    both_generated = asyncio.Event()
+    done: list[str] = []
+
+    async def request(content: str) -> bool:
+        await client.generate([{"role": "user", "content": content}], max_tokens=16)
+        done.append(content)
+        if len(done) == 2:
+            both_generated.set()
+        await both_generated.wait()
+        return await client.abort()
+
+    async def _run():
+        # The long prompt only fits the large backend and is served last.
+        results = await asyncio.gather(request("short"), request("x" * 9000))
+        return results, await client.abort(), await client.get_model_id()
+
+    results, outside_abort, model_id = asyncio.run(_run())
+    assert results == [True, True]
+    assert sorted(aborted) == ["large", "small"]
+    # No generation in the calling task: nothing to abort, and no other request is hit.
+    assert outside_abort is False
+    # The plan cache key follows routing, not whichever backend served last.
+    assert model_id == "small-model"
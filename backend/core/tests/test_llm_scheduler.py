@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+
+from backend.core.services.llm_scheduler import LLMPriority, LLMScheduler, SchedulerQueueFullError
+
+
+def test_scheduler_serves_waiters_by_priority():
+    scheduler = LLMScheduler(max_queue=8, concurrency=1)
+    order: list[str] = []
+
+    async def job(name: str):
+        order.append(name)
+        await asyncio.sleep(0.01)
+
+    async def _run():
+        release = asyncio.Event()
+
+        async def holder():
+            async with scheduler.slot(LLMPriority.INTERACTIVE):
+                await release.wait()
+
+        first = asyncio.create_task(holder())
+        await asyncio.sleep(0)
+        waiting = [
+            asyncio.create_task(scheduler.run(lambda: job("background"), priority=LLMPriority.BACKGROUND)),
+            asyncio.create_task(scheduler.run(lambda: job("planner"), priority=LLMPriority.PLANNER)),
+            asyncio.create_task(scheduler.run(lambda: job("chat"), priority=LLMPriority.INTERACTIVE)),
+        ]
+        await asyncio.sleep(0)
+        assert scheduler.get_metrics()["queue_depth"] == 3
+        release.set()
+        await asyncio.gather(first, *waiting)
+
+    asyncio.run(_run())
+    assert order == ["chat", "planner", "background"]
+    metrics = scheduler.get_metrics()
+    assert metrics["completed_total"] == 4
+    assert metrics["wait_time"]["background"]["samples"] == 1
+
+
+def test_scheduler_rejects_when_queue_is_full_and_enforces_deadline():
+    scheduler = LLMScheduler(max_queue=1, concurrency=1)
+
+    async def _run():
+        release = asyncio.Event()
+
+        async def holder():
+            async with scheduler.slot():
+                await release.wait()
+
+        first = asyncio.create_task(holder())
+        await asyncio.sleep(0)
+        queued = asyncio.create_task(scheduler.run(asyncio.sleep, deadline_s=0.05))
+        await asyncio.sleep(0)
+        with pytest.raises(SchedulerQueueFullError):
+            await scheduler.run(lambda: asyncio.sleep(0))
+        with pytest.raises(asyncio.TimeoutError):
+            await queued
+        release.set()
+        await first
+
+    asyncio.run(_run())
+    metrics = scheduler.get_metrics()
+    assert metrics["rejected_total"] == 1
+    assert metrics["deadline_exceeded_total"] == 1
+    assert metrics["queue_depth"] == 0
+    assert metrics["active"] == 0
+
+
+def test_scheduler_fires_abort_hook_when_running_request_is_cancelled():
+    scheduler = LLMScheduler()
+    aborted = asyncio.Event()
+
+    async def abort():
+        aborted.set()
+
+    async def _run():
+        task = asyncio.create_task(scheduler.run(lambda: asyncio.sleep(10), on_cancel=abort))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await asyncio.wait_for(aborted.wait(), timeout=1)
+
+    asyncio.run(_run())
+    assert scheduler.get_metrics()["cancelled_total"] == 1
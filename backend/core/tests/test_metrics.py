@@ -0,0 +1,112 @@
+import asyncio
+import json
+
+import httpx
+
+from backend.core.services import kobold_client as kobold_client_module
+from backend.core.services.kobold_client import KoboldClient
+from backend.core.services.metrics import (
+    MetricsRegistry,
+    capture_generation_stats,
+    get_registry,
+    llm_caller,
+)
+
+
+def test_registry_labels_and_rolling_histograms():
+    registry = MetricsRegistry(histogram_window=3)
+    registry.inc("calls", {"caller": "chat"})
+    registry.inc("calls", {"caller": "chat"})
+    for value in (1, 2, 3, 100):
+        registry.observe("latency_ms", value, {"caller": "chat"})
+
+    snapshot = registry.snapshot()
+    assert snapshot["counters"]["calls{caller=chat}"] == 2
+    histogram = snapshot["histograms"]["latency_ms{caller=chat}"]
+    assert histogram["count"] == 3
+    assert histogram["total_count"] == 4
+    assert histogram["max"] == 100
+
+
+def test_generate_records_perf_stats_for_caller(monkeypatch):
+    monkeypatch.setattr(kobold_client_module, "KOBOLD_PERF_STATS", True)
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/api/v1/generate":
+            return httpx.Response(200, json={"results": [{"text": " hello there"}]})
+        if request.url.path == "/api/extra/perf":
+            return httpx.Response(
+                200,
+                json={"last_process": 0.25, "last_eval": 2.0, "last_token_count": 40, "last_input_count": 300},
+            )
+        return httpx.Response(404)
+
+    client = KoboldClient("http://kobold.test", client=httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    get_registry().reset()
+
+    async def _run():
+        with llm_caller("planner"), capture_generation_stats() as generations:
+            text = await client.generate([{"role": "user", "content": "hi"}], max_tokens=40)
+        return text, generations
+
+    text, generations = asyncio.run(_run())
+    assert text == "hello there"
+    stats = generations[0].as_dict()
+    assert stats["caller"] == "planner"
+    assert stats["prompt_tokens"] == 300
+    assert stats["generated_tokens"] == 40
+    assert stats["ttft_ms"] == 250.0
+    assert stats["tokens_per_sec"] == 20.0
+
+    snapshot = get_registry().snapshot()
+    assert snapshot["counters"]["llm_calls_total{caller=planner,outcome=ok}"] == 1
+    assert snapshot["histograms"]["llm_ttft_ms{caller=planner}"]["p50"] == 250.0
+
+
+def test_generate_skips_perf_round_trip_by_default():
+    paths = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        paths.append(request.url.path)
+        if request.url.path == "/api/extra/tokencount":
+            return httpx.Response(200, json={"value": 7 if json.loads(request.content)["prompt"] != "ok" else 1})
+        return httpx.Response(200, json={"results": [{"text": "ok"}]})
+
+    client = KoboldClient("http://kobold.test", client=httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+
+    async def _run():
+        with capture_generation_stats() as generations:
+            await client.generate([{"role": "user", "content": "hi"}])
+        return generations
+
+    get_registry().reset()
+    generations = asyncio.run(_run())
+    assert "/api/extra/perf" not in paths
+    # Token counts come from the backend's tokenizer, TTFT is reported as unmeasured.
+    assert (generations[0].prompt_tokens, generations[0].generated_tokens) == (7, 1)
+    assert generations[0].ttft_ms is None
+    assert get_registry().snapshot()["counters"]["llm_ttft_unmeasured_total{caller=unknown}"] == 1
+
+
+def test_generate_stream_measures_ttft_without_perf_endpoint():
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/api/extra/generate/stream":
+            body = "".join(f'data: {{"token": "{t}"}}\n\n' for t in ["a", "b", "c"])
+            return httpx.Response(200, text=body, headers={"content-type": "text/event-stream"})
+        return httpx.Response(404)
+
+    client = KoboldClient("http://kobold.test", client=httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+
+    async def _run():
+        with llm_caller("chat"), capture_generation_stats() as generations:
+            tokens = [t async for t in client.generate_stream([{"role": "user", "content": "hi"}])]
+        return tokens, generations
+
+    tokens, generations = asyncio.run(_run())
+    assert tokens == ["a", "b", "c"]
+    stats = generations[0]
+    assert stats.streamed is True
+    assert stats.caller == "chat"
+    assert stats.generated_tokens == 3
+    assert stats.ttft_ms is not None
+    assert stats.prompt_tokens > 0
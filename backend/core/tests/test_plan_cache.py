@@ -0,0 +1,92 @@
+import asyncio
+import time
+
+from backend.core.services import plan_cache as plan_cache_module
+from backend.core.services.plan_cache import PlanCache
+from backend.core.services.task_planner import TaskPlanner
+
+
+PLAN_JSON = '{"tool":"sandbox.execute","language":"python","code":"print(42)","timeout":10}'
+
+
+def make_planner(tmp_path, monkeypatch, calls: dict, model_id: str = "model-a") -> TaskPlanner:
+    planner = TaskPlanner()
+    planner.plan_cache = PlanCache(db_path=tmp_path / "plan_cache.db")
+
+    async def fake_generate(*_args, **_kwargs):
+        calls["n"] += 1
+        return PLAN_JSON
+
+    async def fake_model_id():
+        return model_id
+
+    monkeypatch.setattr(planner.kobold, "generate", fake_generate)
+    monkeypatch.setattr(planner.kobold, "get_model_id", fake_model_id)
+    return planner
+
+
+def test_plan_cache_skips_llm_for_repeated_goal_and_survives_restart(tmp_path, monkeypatch):
+    calls = {"n": 0}
+    planner = make_planner(tmp_path, monkeypatch, calls)
+
+    first = asyncio.run(planner.build_plan("print   42"))
+    second = asyncio.run(planner.build_plan("print 42"))
+    assert calls["n"] == 1
+    assert first == second
+    assert planner.plan_cache.get_stats()["memory_hits"] == 1
+
+    # A fresh process only has the SQLite tier.
+    restarted = make_planner(tmp_path, monkeypatch, calls)
+    third = asyncio.run(restarted.build_plan("print 42"))
+    assert calls["n"] == 1
+    assert third.code == "print(42)"
+    assert restarted.plan_cache.get_stats()["sqlite_hits"] == 1
+
+
+def test_plan_cache_bypass_and_model_change_call_llm(tmp_path, monkeypatch):
+    calls = {"n": 0}
+    planner = make_planner(tmp_path, monkeypatch, calls)
+    asyncio.run(planner.build_plan("print 42"))
+    asyncio.run(planner.build_plan("print 42", bypass_cache=True))
+    assert calls["n"] == 2
+
+    other_model = make_planner(tmp_path, monkeypatch, calls, model_id="model-b")
+    asyncio.run(other_model.build_plan("print 42"))
+    assert calls["n"] == 3
+
+
+def test_plan_cache_does_not_store_heuristic_fallback(tmp_path, monkeypatch):
+    planner = make_planner(tmp_path, monkeypatch, {"n": 0})
+
+    async def fail_generate(*_args, **_kwargs):
+        raise RuntimeError("no llm")
+
+    monkeypatch.setattr(planner.kobold, "generate", fail_generate)
+    plan = asyncio.run(planner.build_plan("python: print(1)"))
+    assert plan.code == "print(1)"
+    assert planner.plan_cache.get_stats()["stores"] == 0
+
+
+def test_plan_cache_entries_expire(tmp_path, monkeypatch):
+    cache = PlanCache(db_path=tmp_path / "plan_cache.db", ttl_s=60)
+    key = cache.make_key("echo hi", "v1", "m")
+    cache.put(key, "echo hi", "v1", "m", {"tool": "sandbox.execute", "language": "bash", "code": "echo hi", "timeout": 5})
+    assert cache.get(key)["code"] == "echo hi"
+
+    restarted = PlanCache(db_path=tmp_path / "plan_cache.db", ttl_s=60)
+    later = time.time() + 120
+    monkeypatch.setattr(plan_cache_module.time, "time", lambda: later)
+    assert restarted.get(key) is None
+    assert restarted.get_stats()["expired"] == 1
+
+
+def test_plan_cache_reuses_pooled_connections(tmp_path):
+    from backend.core.services.sqlite_pool import get_connection_manager
+
+    cache = PlanCache(db_path=tmp_path / "plan_cache.db")
+    for i in range(20):
+        key = cache.make_key(f"echo {i}", "v1", "m")
+        cache.put(key, f"echo {i}", "v1", "m", {"tool": "sandbox.execute", "language": "bash", "code": "echo", "timeout": 5})
+        cache._memory.clear()
+        assert cache.get(key) is not None
+    assert get_connection_manager(tmp_path / "plan_cache.db").get_stats()["connections_opened"] == 2
@@ -0,0 +1,35 @@
+from backend.core.services.response_cache import SemanticResponseCache, make_fingerprint
+
+
+def test_response_cache_matches_by_similarity_within_fingerprint():
+    cache = SemanticResponseCache(similarity_threshold=0.9)
+    fp = make_fingerprint("stable", "balanced", 1)
+    cache.put([1.0, 0.0, 0.0], fp, query="как настроить termux?", response="ответ", interaction_id="i1", context_ids=["m1"])
+
+    hit = cache.lookup([0.99, 0.05, 0.0], fp)
+    assert hit is not None and hit.response == "ответ"
+    assert cache.lookup([0.0, 1.0, 0.0], fp) is None
+    # Same question under another mode/profile version is a different answer.
+    assert cache.lookup([1.0, 0.0, 0.0], make_fingerprint("wild", "balanced", 1)) is None
+
+    stats = cache.get_stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 2
+    assert stats["hit_rate"] == round(1 / 3, 4)
+
+
+def test_response_cache_invalidation_and_feedback_tracking():
+    cache = SemanticResponseCache(similarity_threshold=0.9)
+    fp = make_fingerprint("x")
+    cache.put([1.0, 0.0], fp, query="q1", response="a1", interaction_id="i1", context_ids=["m1"])
+    cache.put([0.0, 1.0], fp, query="q2", response="a2", interaction_id="i2")
+
+    assert cache.invalidate_memory("m1") == 1
+    assert cache.lookup([1.0, 0.0], fp) is None
+
+    assert cache.lookup([0.0, 1.0], fp) is not None
+    cache.record_feedback("i2", helpful=False)
+    stats = cache.get_stats()
+    assert stats["rejected_after_hit"] == 1
+    assert stats["hit_regression_rate"] == 1.0
+    assert stats["entries"] == 0
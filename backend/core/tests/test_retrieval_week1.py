@@ -6,7 +6,7 @@ from backend.core.services.retrieval import LegacyMemoryRetriever, multimodal_ra
 
 
 class FakeMemoryEngine:
-    async def search(self, query: str, limit: int = 10):
+    async def search(self, query: str, limit: int = 10, **_kwargs):
         return [{"id": "legacy_1", "content": f"legacy:{query}", "score": 0.9}]
 
 
@@ -57,3 +57,21 @@ def test_search_with_backend_fallbacks_to_legacy_when_mm_missing(monkeypatch):
     result, backend = asyncio.run(search_with_backend(FakeMemoryEngine(), "plan", limit=5, multimodal_retriever=None))
     assert backend == "legacy"
     assert result[0]["id"] == "legacy_1"
+
+
+def test_mmr_select_skips_paraphrased_duplicates():
+    from backend.core.services.retrieval import mmr_select
+
+    items = [
+        {"id": "a", "content": "termux setup", "score": 0.95, "embedding": [1.0, 0.0, 0.0]},
+        {"id": "a2", "content": "termux install", "score": 0.94, "embedding": [0.99, 0.05, 0.0]},
+        {"id": "b", "content": "kobold model", "score": 0.80, "embedding": [0.0, 1.0, 0.0]},
+        {"id": "c", "content": "voice mode", "score": 0.70, "embedding": [0.0, 0.0, 1.0]},
+    ]
+
+    assert [x["id"] for x in mmr_select(items, 3, lambda_=0.5)] == ["a", "b", "c"]
+    # Pure relevance keeps retrieval order.
+    assert [x["id"] for x in mmr_select(items, 2, lambda_=1.0)] == ["a", "a2"]
+    # Without embeddings nothing is reordered.
+    plain = [{k: v for k, v in x.items() if k != "embedding"} for x in items]
+    assert [x["id"] for x in mmr_select(plain, 2, lambda_=0.5)] == ["a", "a2"]
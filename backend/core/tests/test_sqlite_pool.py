@@ -0,0 +1,70 @@
+import threading
+
+from backend.core.services.sqlite_pool import SQLiteConnectionManager, get_connection_manager
+
+
+def test_connection_manager_uses_wal_and_reuses_connections(tmp_path):
+    manager = SQLiteConnectionManager(tmp_path / "pool.db")
+    with manager.write() as conn:
+        conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)")
+        conn.execute("INSERT INTO items (name) VALUES ('a')")
+    with manager.write() as conn:
+        conn.execute("INSERT INTO items (name) VALUES ('b')")
+
+    with manager.read() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert [r["name"] for r in conn.execute("SELECT name FROM items ORDER BY id")] == ["a", "b"]
+    with manager.read() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM items").fetchone()[0] == 2
+
+    # One writer plus one reader for this thread, no matter how many calls.
+    assert manager.get_stats()["connections_opened"] == 2
+    manager.close()
+
+
+def test_connection_manager_rolls_back_failed_writes_and_serves_threads(tmp_path):
+    manager = get_connection_manager(tmp_path / "pool.db")
+    assert get_connection_manager(str(tmp_path / "pool.db")) is manager
+    with manager.write() as conn:
+        conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY)")
+
+    try:
+        with manager.write() as conn:
+            conn.execute("INSERT INTO items (id) VALUES (1)")
+            raise RuntimeError("boom")
+    except RuntimeError:
+        pass
+
+    counts = []
+
+    def reader():
+        with manager.read() as conn:
+            counts.append(conn.execute("SELECT COUNT(*) FROM items").fetchone()[0])
+
+    threads = [threading.Thread(target=reader) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert counts == [0, 0, 0]
+    assert manager.get_stats()["readers"] == 3
+    manager.close()
+
+
+def test_data_version_sees_writer_commits_without_the_write_lock(tmp_path):
+    manager = SQLiteConnectionManager(tmp_path / "pool.db")
+    with manager.write() as conn:
+        conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY)")
+    before = manager.data_version()
+
+    with manager.write() as conn:
+        conn.execute("INSERT INTO items (id) VALUES (1)")
+        # Held by this thread: another thread's stamp must not wait for it.
+        stamps = []
+        thread = threading.Thread(target=lambda: stamps.append(manager.data_version()))
+        thread.start()
+        thread.join(timeout=1)
+        assert stamps
+    # A commit through the manager's own writer changes the reader's version.
+    assert manager.data_version() != before
+    manager.close()
@@ -1,6 +1,6 @@
 import asyncio
 
-from backend.core.services.task_planner import TaskPlanner
+from backend.core.services.task_planner import PLAN_GRAMMAR, TaskPlanner
 
 
 def test_task_planner_uses_llm_json(monkeypatch):
@@ -44,3 +44,28 @@ def test_task_planner_uses_safe_termux_pkg_plan_for_python_install(monkeypatch):
     assert "python.org/downloads" in plan.code
     assert "make altinstall" not in plan.code
     assert plan.timeout == 120
+
+
+def test_task_planner_sends_plan_grammar_and_tracks_fallbacks(monkeypatch):
+    planner = TaskPlanner()
+    seen = {}
+    outputs = iter(['{"tool": "sandbox.execute", "language": "bash", "code": "echo ok", "timeout": 5}', "not json"])
+
+    async def fake_generate(*_args, **kwargs):
+        seen.update(kwargs)
+        return next(outputs)
+
+    monkeypatch.setattr(planner.kobold, "generate", fake_generate)
+    plan = asyncio.run(planner.build_plan("echo ok"))
+    assert plan.code == "echo ok"
+    assert seen["grammar"] == PLAN_GRAMMAR
+
+    fallback = asyncio.run(planner.build_plan("bash: ls"))
+    assert fallback.code == "ls"
+
+    metrics = planner.get_metrics()
+    assert metrics["llm_plans"] == 1
+    assert metrics["fallback_parse_error"] == 1
+    assert metrics["fallback_rate"] == 0.5
+    assert metrics["llm_latency_ms_p50"] is not None
+
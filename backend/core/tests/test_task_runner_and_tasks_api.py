@@ -29,7 +29,7 @@ def make_client(tmp_path) -> tuple[TestClient, TaskRunner]:
 def test_tasks_run_uses_planner_language_and_started_payload(tmp_path, monkeypatch):
     client, _ = make_client(tmp_path)
 
-    async def fake_build_plan(goal: str):
+    async def fake_build_plan(goal: str, **_kwargs):
         assert goal == "python: print(2+2)"
         return TaskExecutionPlan(tool="sandbox.execute", language="python", code="print(2+2)", timeout=30)
 
@@ -64,7 +64,7 @@ def test_tasks_run_uses_planner_language_and_started_payload(tmp_path, monkeypat
 def test_high_risk_requires_approval_and_blocks_then_approves(tmp_path, monkeypatch):
     client, _ = make_client(tmp_path)
 
-    async def fake_build_plan(_goal: str):
+    async def fake_build_plan(_goal: str, **_kwargs):
         return TaskExecutionPlan(tool="sandbox.execute", language="bash", code="echo ok", timeout=30)
 
     monkeypatch.setattr(tasks_router.planner, "build_plan", fake_build_plan)
@@ -161,7 +161,7 @@ def test_db_drift_is_seen_and_invalidation_triggers(tmp_path):
 def test_task_planner_heuristic_python_without_prefix(tmp_path, monkeypatch):
     client, _ = make_client(tmp_path)
 
-    async def fake_build_plan(goal: str):
+    async def fake_build_plan(goal: str, **_kwargs):
         assert goal == "print(40+2)"
         return TaskExecutionPlan(tool="sandbox.execute", language="python", code="print(40+2)", timeout=30)
 
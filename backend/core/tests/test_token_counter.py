@@ -0,0 +1,92 @@
+import asyncio
+import json
+
+import httpx
+
+from backend.core.services.token_counter import TokenCounter, estimate_tokens
+
+
+def test_token_counter_caches_remote_counts():
+    calls = {"n": 0}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls["n"] += 1
+        assert request.url.path == "/api/extra/tokencount"
+        return httpx.Response(200, json={"value": 7})
+
+    counter = TokenCounter(base_url="http://kobold.test", client=httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+
+    async def _run():
+        return [await counter.count("привет мир"), await counter.count("привет мир")]
+
+    assert asyncio.run(_run()) == [7, 7]
+    assert calls["n"] == 1
+    assert counter.get_stats()["cache_hits"] == 1
+
+
+def test_token_counter_falls_back_to_estimate_and_backs_off():
+    calls = {"n": 0}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls["n"] += 1
+        raise httpx.ConnectError("refused", request=request)
+
+    counter = TokenCounter(base_url="http://kobold.test", client=httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+
+    async def _run():
+        return [await counter.count("a" * 30), await counter.count("b" * 30)]
+
+    assert asyncio.run(_run()) == [estimate_tokens("a" * 30)] * 2
+    assert calls["n"] == 1
+    assert counter.get_stats()["remote_available"] is False
+
+
+def test_count_many_sends_cache_misses_concurrently_and_dedupes():
+    in_flight = {"now": 0, "max": 0, "calls": 0}
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        in_flight["now"] += 1
+        in_flight["calls"] += 1
+        in_flight["max"] = max(in_flight["max"], in_flight["now"])
+        await asyncio.sleep(0.01)
+        in_flight["now"] -= 1
+        return httpx.Response(200, json={"value": len(json.loads(request.content)["prompt"])})
+
+    counter = TokenCounter(base_url="http://kobold.test", client=httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    assert asyncio.run(counter.count_many(["a", "bb", "a", "", "ccc"])) == [1, 2, 1, 0, 3]
+    assert in_flight["calls"] == 3
+    assert in_flight["max"] == 3
+
+
+def test_token_counter_follows_routed_backend_url():
+    urls: list[str] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        urls.append(str(request.url))
+        return httpx.Response(200, json={"value": 1})
+
+    class Routed:
+        base_url = "http://large.test"
+
+    routed = Routed()
+    counter = TokenCounter(kobold=routed, client=httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+
+    async def _run():
+        await counter.count("one")
+        routed.base_url = "http://small.test/"
+        await counter.count("two")
+
+    asyncio.run(_run())
+    assert urls == ["http://large.test/api/extra/tokencount", "http://small.test/api/extra/tokencount"]
+
+
+def test_estimate_only_counter_and_cyrillic_estimate():
+    counter = TokenCounter(base_url=None)
+    assert counter.client is None
+    assert asyncio.run(counter.count("привет")) == estimate_tokens("привет")
+    assert counter.get_stats()["remote_available"] is False
+    asyncio.run(counter.close())
+
+    # Cyrillic splits into more tokens per character than Latin text of the same length.
+    assert estimate_tokens("привет мир") > estimate_tokens("hello worl")
+    assert estimate_tokens("привет мир") >= len("привет мир") / 2
@@ -1,12 +1,14 @@
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import List
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional, Union
 import asyncio
+import base64
 import hashlib
 import os
 import random
+import struct
 import uvicorn
 
 try:
@@ -34,6 +36,13 @@ model_loading = False
 model_error = None
 MODEL_NAME = os.getenv("EMBEDDINGS_MODEL", "all-MiniLM-L6-v2")
 FALLBACK_DIMENSION = int(os.getenv("EMBEDDINGS_FALLBACK_DIM", "384"))
+# Server-side defaults for output shaping; each request may override them.
+DEFAULT_OUTPUT_DIMENSIONS = int(os.getenv("EMBEDDINGS_OUTPUT_DIM", "0")) or None
+DEFAULT_OUTPUT_PRECISION = os.getenv("EMBEDDINGS_OUTPUT_PRECISION", "float32").strip().lower()
+
+Precision = Literal["float32", "float16"]
+# "float": JSON number lists; "base64": packed little-endian bytes of the requested precision.
+Encoding = Literal["float", "base64"]
 
 
 def deterministic_fallback_embedding(text: str, dim: int = FALLBACK_DIMENSION) -> List[float]:
@@ -54,6 +63,50 @@ def deterministic_fallback_embedding(text: str, dim: int = FALLBACK_DIMENSION) -
     return [v / norm for v in vector]
 
 
+def _to_float16(value: float) -> float:
+    """Round a float to the nearest IEEE half-precision value (still serialized as a JSON number)."""
+    try:
+        return struct.unpack("<e", struct.pack("<e", value))[0]
+    except OverflowError:
+        return float("inf") if value > 0 else float("-inf")
+
+
+def shape_embedding(vector: List[float], dimensions: Optional[int] = None, precision: str = "float32") -> List[float]:
+    """Truncate to the first `dimensions` components, L2-renormalize and apply output precision.
+
+    Prefix truncation is only meaningful for Matryoshka-style models, but renormalizing keeps
+    cosine/dot-product scores comparable either way. float16 here only rounds the values; the
+    payload shrinks only with `encode_embedding` (encoding="base64").
+    """
+
+    values = [float(v) for v in vector]
+    if dimensions is not None and 0 < dimensions < len(values):
+        values = values[:dimensions]
+        norm = sum(v * v for v in values) ** 0.5
+        if norm > 0:
+            values = [v / norm for v in values]
+
+    if precision == "float16":
+        values = [_to_float16(v) for v in values]
+    return values
+
+
+def encode_embedding(values: List[float], precision: str = "float32") -> str:
+    """Pack a vector as little-endian float16/float32 bytes, base64-encoded (2 or 4 bytes per value)."""
+
+    if precision == "float16":
+        packed = b"".join(struct.pack("<e", _to_float16(v)) for v in values)
+    else:
+        packed = struct.pack(f"<{len(values)}f", *values)
+    return base64.b64encode(packed).decode("ascii")
+
+
+def _encode_output(vectors: List[List[float]], precision: str, encoding: str) -> List[Union[List[float], str]]:
+    if encoding == "base64":
+        return [encode_embedding(vector, precision) for vector in vectors]
+    return vectors
+
+
 async def _load_model():
     global model, model_loading, model_error
 
@@ -76,19 +129,34 @@ async def _load_model():
 
 class EmbedRequest(BaseModel):
     texts: List[str]
+    dimensions: Optional[int] = Field(default=None, ge=1)
+    precision: Optional[Precision] = None
+    encoding: Encoding = "float"
 
 
 class EmbedResponse(BaseModel):
-    embeddings: List[List[float]]
+    embeddings: List[Union[List[float], str]]
     model: str
     dimension: int
+    precision: Precision = "float32"
+    encoding: Encoding = "float"
     fallback_active: bool = False
 
 
+def _resolve_output_options(request: EmbedRequest) -> tuple[Optional[int], str]:
+    dimensions = request.dimensions if request.dimensions is not None else DEFAULT_OUTPUT_DIMENSIONS
+    precision = request.precision or DEFAULT_OUTPUT_PRECISION
+    if precision not in {"float32", "float16"}:
+        precision = "float32"
+    return dimensions, precision
+
+
 @app.post("/embed", response_model=EmbedResponse)
 async def embed_texts(request: EmbedRequest):
     """Генерация эмбеддингов для текстов"""
 
+    dimensions, precision = _resolve_output_options(request)
+
     if model:
         try:
             embeddings = model.encode(
@@ -97,10 +165,13 @@ async def embed_texts(request: EmbedRequest):
                 show_progress_bar=False,
             )
 
+            vectors = [shape_embedding(row, dimensions, precision) for row in embeddings.tolist()]
             return EmbedResponse(
-                embeddings=embeddings.tolist(),
+                embeddings=_encode_output(vectors, precision, request.encoding),
                 model=MODEL_NAME,
-                dimension=embeddings.shape[1],
+                dimension=len(vectors[0]) if vectors else min(embeddings.shape[1], dimensions or embeddings.shape[1]),
+                precision=precision,
+                encoding=request.encoding,
                 fallback_active=False,
             )
 
@@ -108,11 +179,15 @@ async def embed_texts(request: EmbedRequest):
             raise HTTPException(status_code=500, detail=str(e))
 
     # Degraded mode: deterministic fallback keeps API available for memory flows.
-    fallback_vectors = [deterministic_fallback_embedding(text) for text in request.texts]
+    fallback_vectors = [
+        shape_embedding(deterministic_fallback_embedding(text), dimensions, precision) for text in request.texts
+    ]
     return EmbedResponse(
-        embeddings=fallback_vectors,
+        embeddings=_encode_output(fallback_vectors, precision, request.encoding),
         model=f"{MODEL_NAME}::fallback",
-        dimension=FALLBACK_DIMENSION,
+        dimension=len(fallback_vectors[0]) if fallback_vectors else min(FALLBACK_DIMENSION, dimensions or FALLBACK_DIMENSION),
+        precision=precision,
+        encoding=request.encoding,
         fallback_active=True,
     )
 
@@ -138,6 +213,8 @@ async def health():
         "sentence_transformers_available": SentenceTransformer is not None,
         "fallback_active": fallback_active,
         "fallback_dimension": FALLBACK_DIMENSION if fallback_active else None,
+        "default_output_dimensions": DEFAULT_OUTPUT_DIMENSIONS,
+        "default_output_precision": DEFAULT_OUTPUT_PRECISION,
     }
 
 
@@ -0,0 +1,51 @@
+import base64
+import struct
+
+from fastapi.testclient import TestClient
+
+from backend.embeddings import main as embeddings_main
+from backend.embeddings.main import encode_embedding, shape_embedding
+
+
+def test_shape_embedding_truncates_and_renormalizes():
+    shaped = shape_embedding([3.0, 4.0, 12.0], dimensions=2)
+    assert shaped == [0.6, 0.8]
+    assert abs(sum(v * v for v in shaped) - 1.0) < 1e-9
+
+    # No truncation (or dimensions >= len) leaves the vector untouched.
+    assert shape_embedding([3.0, 4.0, 12.0]) == [3.0, 4.0, 12.0]
+    assert shape_embedding([3.0, 4.0], dimensions=5) == [3.0, 4.0]
+    assert shape_embedding([0.0, 0.0, 1.0], dimensions=2) == [0.0, 0.0]
+
+
+def test_shape_embedding_float16_rounds_to_half_precision():
+    shaped = shape_embedding([0.1, 1.0, 70000.0], precision="float16")
+    assert shaped[0] == struct.unpack("<e", struct.pack("<e", 0.1))[0] != 0.1
+    assert shaped[1] == 1.0
+    assert shaped[2] == float("inf")
+
+
+def test_encode_embedding_packs_little_endian_bytes():
+    values = [0.5, -0.25, 0.1]
+    half = base64.b64decode(encode_embedding(values, "float16"))
+    assert len(half) == 2 * len(values)
+    assert list(struct.unpack("<3e", half))[:2] == [0.5, -0.25]
+
+    full = base64.b64decode(encode_embedding(values, "float32"))
+    assert len(full) == 4 * len(values)
+    assert abs(struct.unpack("<3f", full)[2] - 0.1) < 1e-7
+
+
+def test_embed_endpoint_base64_encoding_in_fallback_mode(monkeypatch):
+    monkeypatch.setattr(embeddings_main, "model", None)
+    client = TestClient(embeddings_main.app)
+
+    plain = client.post("/embed", json={"texts": ["привет"], "dimensions": 8, "precision": "float16"}).json()
+    packed = client.post(
+        "/embed", json={"texts": ["привет"], "dimensions": 8, "precision": "float16", "encoding": "base64"}
+    ).json()
+
+    assert plain["encoding"] == "float" and packed["encoding"] == "base64"
+    assert packed["dimension"] == 8
+    decoded = struct.unpack("<8e", base64.b64decode(packed["embeddings"][0]))
+    assert list(decoded) == plain["embeddings"][0]
@@ -12,17 +12,88 @@ export const chatAPI = {
     options: {
       autonomousMode?: 'off' | 'auto' | 'force'
       webSearch?: boolean
+      sessionId?: string
     } = {}
   ) => {
     const { data } = await api.post('/chat/', {
       messages,
       use_memory: useMemory,
       autonomous_mode: options.autonomousMode ?? 'auto',
-      web_search: options.webSearch ?? true
+      web_search: options.webSearch ?? true,
+      session_id: options.sessionId
     })
     return data
   },
 
+  stream: async (
+    messages: any[],
+    onToken: (token: string) => void,
+    useMemory: boolean = true,
+    options: {
+      autonomousMode?: 'off' | 'auto' | 'force'
+      webSearch?: boolean
+      sessionId?: string
+    } = {}
+  ) => {
+    const response = await fetch('/api/chat/stream', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({
+        messages,
+        use_memory: useMemory,
+        autonomous_mode: options.autonomousMode ?? 'auto',
+        web_search: options.webSearch ?? true,
+        session_id: options.sessionId
+      })
+    })
+    if (!response.ok || !response.body) {
+      throw new Error(`chat stream failed: ${response.status}`)
+    }
+
+    const reader = response.body.getReader()
+    const decoder = new TextDecoder()
+    let buffer = ''
+    let done: any = null
+    while (true) {
+      const { value, done: finished } = await reader.read()
+      if (finished) break
+      buffer += decoder.decode(value, { stream: true })
+      const events = buffer.split('\n\n')
+      buffer = events.pop() ?? ''
+      for (const raw of events) {
+        const event = raw.match(/^event: (.*)$/m)?.[1]
+        const data = raw.match(/^data: (.*)$/m)?.[1]
+        if (!event || data === undefined) continue
+        const payload = JSON.parse(data)
+        if (event === 'token') onToken(payload.token)
+        else if (event === 'done') done = payload
+        else if (event === 'error') throw new Error(payload.detail)
+      }
+    }
+    return done
+  },
+
+  // Call debounced while the user types; the matching send() then reuses the prefetched context.
+  // No warm_prompt: it needs a server session with the prefix_stable layout, which the chat page does not use.
+  prefetch: async (text: string, options: { sessionId?: string; useMemory?: boolean } = {}) => {
+    const { data } = await api.post('/chat/prefetch', {
+      text,
+      session_id: options.sessionId,
+      use_memory: options.useMemory ?? true
+    })
+    return data
+  },
+
+  createSession: async (title: string = '') => {
+    const { data } = await api.post('/chat/sessions', { title })
+    return data
+  },
+
+  getSession: async (sessionId: string, limit: number = 100) => {
+    const { data } = await api.get(`/chat/sessions/${sessionId}`, { params: { limit } })
+    return data
+  },
+
   feedback: async (interactionId: string, helpful: boolean) => {
     const { data } = await api.post('/chat/feedback', null, {
       params: { interaction_id: interactionId, helpful }
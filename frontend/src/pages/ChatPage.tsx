@@ -19,6 +19,7 @@ interface ChatDraftState {
 const CHAT_MESSAGES_KEY = 'chat_messages'
 const CHAT_USE_MEMORY_KEY = 'chat_use_memory'
 const CHAT_INPUT_KEY = 'chat_input'
+const PREFETCH_DEBOUNCE_MS = 400
 
 let chatDraftState: ChatDraftState | null = null
 
@@ -101,12 +102,16 @@ export default function ChatPage() {
   const useMemoryRef = useRef(useMemory)
   const inputRef = useRef(input)
   const recognitionRef = useRef<any>(null)
+  const prefetchTimerRef = useRef<ReturnType<typeof setTimeout> | null>(null)
 
   useEffect(() => {
     return () => {
       if (recognitionRef.current) {
         recognitionRef.current.stop()
       }
+      if (prefetchTimerRef.current) {
+        clearTimeout(prefetchTimerRef.current)
+      }
     }
   }, [])
 
@@ -127,6 +132,18 @@ export default function ChatPage() {
     inputRef.current = next
     setInput(next)
     persistState(messagesRef.current, useMemoryRef.current, next)
+    schedulePrefetch(next)
+  }
+
+  const schedulePrefetch = (draft: string) => {
+    if (prefetchTimerRef.current) {
+      clearTimeout(prefetchTimerRef.current)
+    }
+    const text = draft.trim()
+    if (text.length < 3) return
+    prefetchTimerRef.current = setTimeout(() => {
+      chatAPI.prefetch(text, { useMemory: useMemoryRef.current }).catch(() => undefined)
+    }, PREFETCH_DEBOUNCE_MS)
   }
 
   const stopDictation = () => {
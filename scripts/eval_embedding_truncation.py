@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""Measure recall impact of truncated / float16 embeddings on the memory corpus.
+
+Every document is used as a query against the rest of the corpus. Neighbours computed with
+full float32 vectors are the ground truth; each (dimensions, precision) variant reports
+recall@k against that ground truth together with the per-vector storage cost.
+
+Usage:
+    python scripts/eval_embedding_truncation.py --dims 384,256,128,64 --k 5
+    python scripts/eval_embedding_truncation.py --corpus memory_dump.jsonl --limit 500
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+from pathlib import Path
+import sys
+
+import httpx
+
+
+DEFAULT_EMBEDDINGS_URL = "http://localhost:8001"
+DEFAULT_CHROMA_DIR = Path.home() / "roampal-android" / "data" / "memory"
+
+
+def load_corpus(corpus: str | None, limit: int) -> list[str]:
+    """Load documents from a JSONL/text file or from the MemoryEngine Chroma collection."""
+
+    if corpus:
+        texts: list[str] = []
+        for line in Path(corpus).read_text(encoding="utf-8").splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                try:
+                    line = str(json.loads(line).get("content", "")).strip()
+                except json.JSONDecodeError:
+                    pass
+            if line:
+                texts.append(line)
+        return texts[:limit]
+
+    try:
+        import chromadb
+        from chromadb.config import Settings
+    except Exception as exc:
+        raise SystemExit(f"chromadb is not available ({exc}); pass --corpus instead")
+
+    client = chromadb.PersistentClient(path=str(DEFAULT_CHROMA_DIR), settings=Settings(anonymized_telemetry=False))
+    collection = client.get_or_create_collection(name="roampal_memory")
+    docs = collection.get(limit=limit).get("documents") or []
+    return [d for d in docs if d and d.strip()]
+
+
+def embed(client: httpx.Client, base_url: str, texts: list[str], dimensions: int | None, precision: str) -> list[list[float]]:
+    vectors: list[list[float]] = []
+    for start in range(0, len(texts), 64):
+        payload: dict = {"texts": texts[start:start + 64], "precision": precision}
+        if dimensions:
+            payload["dimensions"] = dimensions
+        response = client.post(f"{base_url}/embed", json=payload)
+        response.raise_for_status()
+        vectors.extend(response.json()["embeddings"])
+    return vectors
+
+
+def top_k_neighbours(vectors: list[list[float]], k: int) -> list[set[int]]:
+    neighbours: list[set[int]] = []
+    for i, query in enumerate(vectors):
+        scores = [
+            (sum(a * b for a, b in zip(query, other)), j)
+            for j, other in enumerate(vectors)
+            if j != i
+        ]
+        scores.sort(reverse=True)
+        neighbours.append({j for _, j in scores[:k]})
+    return neighbours
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=DEFAULT_EMBEDDINGS_URL)
+    parser.add_argument("--corpus", default=None, help="JSONL ({'content': ...}) or plain-text file")
+    parser.add_argument("--limit", type=int, default=300)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--dims", default="256,128,64", help="comma-separated truncation sizes")
+    args = parser.parse_args()
+
+    texts = load_corpus(args.corpus, args.limit)
+    if len(texts) <= args.k:
+        print(f"corpus too small: {len(texts)} documents for k={args.k}", file=sys.stderr)
+        return 1
+
+    with httpx.Client(timeout=120.0) as client:
+        baseline = embed(client, args.url, texts, None, "float32")
+        full_dim = len(baseline[0])
+        truth = top_k_neighbours(baseline, args.k)
+
+        variants = [(None, "float16")]
+        for raw in args.dims.split(","):
+            dim = int(raw.strip()) if raw.strip() else 0
+            if 0 < dim < full_dim:
+                variants.extend([(dim, "float32"), (dim, "float16")])
+
+        print(f"documents={len(texts)} full_dim={full_dim} k={args.k}")
+        print(f"{'dims':>6} {'precision':>9} {'bytes/vec':>10} {'recall@k':>9}")
+        print(f"{full_dim:>6} {'float32':>9} {full_dim * 4:>10} {1.0:>9.3f}")
+        for dimensions, precision in variants:
+            vectors = embed(client, args.url, texts, dimensions, precision)
+            found = top_k_neighbours(vectors, args.k)
+            recall = sum(len(a & b) for a, b in zip(truth, found)) / (len(texts) * args.k)
+            dim = dimensions or full_dim
+            width = 2 if precision == "float16" else 4
+            print(f"{dim:>6} {precision:>9} {dim * width:>10} {recall:>9.3f}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())